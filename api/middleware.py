@@ -0,0 +1,71 @@
+from service.metrics import observe_request
+from service.tracing import parse_traceparent, tracer
+import time
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and records it under its route template.
+
+    Written as plain ASGI middleware instead of BaseHTTPMiddleware, so it adds
+    one timer read and one histogram update per request and nothing else.
+    Requests that match no route are grouped under "unmatched" so unknown
+    paths cannot create unbounded label values.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            observe_request(scope["method"], getattr(route, "path", "unmatched"), status, time.perf_counter() - started)
+
+
+class TracingMiddleware:
+    """Runs each HTTP request in a root span named after its route template.
+
+    An incoming W3C traceparent header continues the caller's trace. The trace
+    ID is returned in an X-Trace-Id response header so a slow response can be
+    matched to its spans and log lines. Does nothing unless tracing is enabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        with tracer.start_as_current_span(f"HTTP {scope['method']}", {"http.method": scope["method"]},
+                                          trace_id, parent_id) as span:
+
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status("ERROR")
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", span.trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = scope.get("route")
+                span.set_attribute("http.route", getattr(route, "path", "unmatched"))
+                span.update_name(f"HTTP {scope['method']} {getattr(route, 'path', 'unmatched')}")
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from models.url_pydantic_models import *
 from pydantic import ValidationError
 from service.exceptions import *
 from service.url_service import *
 from service.utils import *
+from service.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from service.analytics import record_click
+from service.hotkeys import hot_keys
+from service.cache import url_cache
+from service.stats import GRANULARITIES, TOP_PERIODS, TOP_URLS_MAX, get_link_stats_async, get_top_urls_async
+from service import metrics
 from datetime import datetime, timedelta
+from typing import Optional
+import json
 
 
 router = APIRouter()
@@ -30,13 +38,14 @@ async def create_short_url(request: URLRequest, user: UserEntry = Depends(get_cu
         HTTPException: 403 if the URL limit is reached
         HTTPException: 409 if the custom URL is already in use.
         HTTPException: 400 if no URL is provided in the request.
+        HTTPException: 503 if no free short URL was found; safe to retry.
         HTTPException: 500 for general server errors.
 
     Returns:
         URLResponse: An object containing the generated short URL, the original URL, and a timestamp.
     """
     try:
-        short_url = generate_short_url(str(request.url), user.user_id, request.custom_url, request.length)
+        short_url = await generate_short_url_async(str(request.url), user.user_id, request.custom_url, request.length)
         if request.url:
             response = URLResponse(
                 short_url=short_url,
@@ -52,13 +61,48 @@ async def create_short_url(request: URLRequest, user: UserEntry = Depends(get_cu
         raise HTTPException(status_code=403, detail=str(e))
     except CustomUrlExistsError as e:
         raise HTTPException(status_code=409, detail=str(e))
+    except ShortIdUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.post("/shorten/batch")
+async def create_short_urls(request: BatchURLRequest, user: UserEntry = Depends(get_current_user)):
+    """Creates short URLs for a batch of original URLs.
+
+    Args:
+        request (BatchURLRequest): The request body containing up to 1000 URL requests.
+        token (str): Bearer token for authentication.
+    
+    Raises:
+        HTTPException: 422 if any item in the batch is invalid.
+        HTTPException: 503 if the user's URL quota could not be reserved; safe to retry.
+        HTTPException: 500 for general server errors.
+
+    Returns:
+        BatchURLResponse: One result per item, in request order. Each result has a status code:
+            201 created, 403 URL limit reached, 409 custom URL in use, 503 not stored and safe to retry.
+    """
+    try:
+        results = await generate_short_urls_async(request.items, user.user_id)
+        created = sum(1 for result in results if result["status_code"] == 201)
+        return BatchURLResponse(
+            results=[BatchURLResult(**result) for result in results],
+            created=created,
+            failed=len(results) - created,
+            timestamp=datetime.now().isoformat()
+            )
+    except QuotaContentionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.get("/r/{short_url}")
-async def redirect_to_original_url(short_url):
+async def redirect_to_original_url(short_url, request: Request):
     """Redirects to the original URL corresponding to a given short URL.
 
+    The click is queued for analytics without waiting on the database.
+
     Args:
         short_url (str): The short URL that maps to the original URL.
 
@@ -71,7 +115,9 @@ async def redirect_to_original_url(short_url):
     """
     try:
         #call service func to get og url
-        original_url = get_original_url(short_url)
+        original_url = await get_original_url_async(short_url)
+        headers = request.headers
+        record_click(short_url, headers.get("referer"), headers.get("user-agent"))
         #redirect to og url
         return RedirectResponse(url=original_url)
     except ValueError:
@@ -81,65 +127,177 @@ async def redirect_to_original_url(short_url):
         #server error
         raise HTTPException(status_code=500, detail=str(e))
     
+@router.post("/resolve/batch", response_model=BatchResolveResponse)
+async def resolve_short_urls(request: BatchResolveRequest):
+    """Resolves many short URLs to their original URLs in one call.
+
+    Args:
+        request (BatchResolveRequest): The request body containing up to 1000 short URLs.
+
+    Raises:
+        HTTPException: 500 for server errors.
+
+    Returns:
+        BatchResolveResponse: Every requested short URL mapped to its original URL (None if not found),
+            plus the list of short URLs that were not found.
+    """
+    try:
+        urls = await get_original_urls_async(request.short_urls)
+        return BatchResolveResponse(urls=urls, misses=[short_url for short_url, original_url in urls.items() if original_url is None])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
 @router.get("/list-urls")
-async def list_url_pairs(user: UserEntry = Depends(get_current_user)):
-    """Retrieves all stored short-original URL pairs.
+async def list_url_pairs(user: UserEntry = Depends(get_current_user),
+                         page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None,
+                         format: str = Query("json", pattern="^(json|ndjson)$")):
+    """Retrieves stored short-original URL pairs, one page at a time or as a stream.
 
     Args:
         token (str): Bearer token for authentication.
+        page_size (int, optional): The maximum number of pairs per page. Defaults to 100.
+        cursor (str, optional): The next_cursor returned with the previous page.
+        format (str, optional): "json" for one page, or "ndjson" to stream every pair,
+            one JSON object per line, as the table is scanned.
     
     Raises:
+        HTTPException: 400 if the cursor is invalid.
         HTTPException: 403 for non-admin users
         HTTPException: 404 if there are no URLs stored in the database.
         HTTPException: 500 for server errors.
 
     Returns:
-        dict: All short URLs as keys and their associated original URLs as values.
+        dict: A page of short URLs as keys and their associated original URLs as values, and the
+            cursor for the next page (None on the last page). With format=ndjson, a streaming response.
     """
     
     try:
         validate_admin_user(user)
-        url_list = get_url_list()
-        if url_list:
-            return {"url_pairs": url_list}
+        if format == "ndjson":
+            return StreamingResponse(stream_url_pairs_ndjson(page_size), media_type="application/x-ndjson")
+        url_list, next_cursor = await get_url_page_async(page_size, cursor)
+        if url_list or cursor:
+            return {"url_pairs": url_list, "next_cursor": next_cursor}
         else:
             raise HTTPException(status_code=404, detail="No URLs found")
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}") 
     except AdminPrivilegesRequiredError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def stream_url_pairs_ndjson(page_size: int):
+    async for url_dict in iter_url_pages_async(page_size):
+        yield "".join(json.dumps({"short_url": short_url, "original_url": original_url}) + "\n"
+                      for short_url, original_url in url_dict.items())
     
 
 @router.get("/list-my-urls")
-async def list_my_urls(user: UserEntry = Depends(get_current_user)):
-    """Lists URLs specific to the authenticated user.
+async def list_my_urls(user: UserEntry = Depends(get_current_user),
+                       page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None):
+    """Lists URLs specific to the authenticated user, most recent first, one page at a time.
 
     Args:
         token (str): Bearer token for authentication.
+        page_size (int, optional): The maximum number of pairs per page. Defaults to 100.
+        cursor (str, optional): The next_cursor returned with the previous page.
 
     Raises:
+        HTTPException: 400 if the cursor is invalid.
         HTTPException: 404 if no URLs are found for the user.
         HTTPException: 500 for server errors.
 
     Returns:
-        dict: URLs associated with the authenticated user.
+        dict: A page of URLs associated with the authenticated user, and the cursor for the
+            next page (None on the last page).
     """    
     try:
-        url_list = get_user_url_list(user.user_id)
-        if url_list:
-            return {"url_pairs": url_list}
+        url_list, next_cursor = await get_user_url_page_async(user.user_id, page_size, cursor)
+        if url_list or cursor:
+            return {"url_pairs": url_list, "next_cursor": next_cursor}
         else:
             raise HTTPException(status_code=404, detail="No URLs found")
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except JWTError:
-        raise HTTPException(HTTPExceptionstatus_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@router.get("/stats/{short_url}", response_model=LinkStatsResponse)
+async def link_stats(short_url,
+                     user: UserEntry = Depends(get_current_user),
+                     granularity: str = Query("day", pattern=f"^({'|'.join(GRANULARITIES)})$"),
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None):
+    """Reports clicks on a short URL over time, by referrer and by user agent.
+
+    Read from pre-aggregated rollups, so the cost depends on the number of points
+    requested, not on how many clicks the link has.
+
+    Args:
+        short_url (str): The short URL to report on. Must belong to the caller unless they are admin.
+        token (str): Bearer token for authentication.
+        granularity (str, optional): "minute", "hour", "day" or "month". Defaults to "day".
+        start (datetime, optional): The start of the range, UTC unless an offset is given.
+            Defaults to a window that suits the granularity.
+        end (datetime, optional): The end of the range. Defaults to now.
+
+    Raises:
+        HTTPException: 400 if the range is reversed or has too many points.
+        HTTPException: 404 if the short URL is not found or belongs to another user.
+        HTTPException: 500 for server errors.
+
+    Returns:
+        LinkStatsResponse: The all-time total, the zero-filled series and the breakdowns.
+    """
+    try:
+        return await get_link_stats_async(short_url, user, granularity, start, end)
+    except InvalidStatsRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Short URL not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/my-top-urls", response_model=TopUrlsResponse)
+async def my_top_urls(user: UserEntry = Depends(get_current_user),
+                      limit: int = Query(10, ge=1, le=TOP_URLS_MAX),
+                      period: str = Query("all", pattern=f"^({'|'.join(TOP_PERIODS)})$")):
+    """Lists the authenticated user's most clicked URLs.
+
+    Args:
+        token (str): Bearer token for authentication.
+        limit (int, optional): How many URLs to return. Defaults to 10.
+        period (str, optional): Rank by clicks over "all" time, or in the current "month", "day" or "hour".
+
+    Raises:
+        HTTPException: 500 for server errors.
+
+    Returns:
+        TopUrlsResponse: Up to limit URLs with their click counts, most clicked first.
+    """
+    try:
+        return {"period": period, "urls": await get_top_urls_async(user.user_id, limit, period)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
     
 @router.delete("/delete-url/{short_url}")
-async def delete_url(short_url, user: UserEntry = Depends(get_current_user)):
+async def delete_short_url(short_url, user: UserEntry = Depends(get_current_user)):
     """Deletes a given short URL from the database.
 
     Args:
@@ -158,7 +316,7 @@ async def delete_url(short_url, user: UserEntry = Depends(get_current_user)):
     try:
         #AUTHENTICATE ADMIN
         validate_admin_user(user)
-        delete_url(user, short_url)
+        await delete_url_async(short_url)
         return {"detail": f"{short_url} was deleted."}
     except AdminPrivilegesRequiredError:
         raise HTTPException(status_code=403, detail="Admin privileges required.")
@@ -175,10 +333,16 @@ async def create_user(user_request: UserRequest):
     Args:
         user_request (UserRequest): The request body containing user credentials.
 
+    Raises:
+        HTTPException: 503 if the password hashing pool is saturated.
+
     Returns:
         dict: Confirmation message that the user was created successfully.
     """
-    new_user = create_new_user(user_request.username, user_request.password)
+    try:
+        new_user = await create_new_user_async(user_request.username, user_request.password)
+    except HashingUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     return {"message": f"User {new_user.user_id} created successfully."}
     
 
@@ -191,15 +355,22 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm=Depends())
 
     Raises:
         HTTPException: 401 if credentials are incorrect.
+        HTTPException: 503 if the password hashing pool is saturated or the JWT key cannot be loaded.
 
     Returns:
         dict: Access token and token type.
     """
-    user = authenticate_user(form_data.username, form_data.password) 
+    try:
+        user = await authenticate_user_async(form_data.username, form_data.password) 
+    except HashingUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password", headers={"WWW-Authenticate": "Bearer"})
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub":user.user_id}, expires_delta=access_token_expires)
+    try:
+        access_token = await create_access_token_async(data={"sub":user.user_id}, expires_delta=access_token_expires)
+    except SecretUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     return {"access_token": access_token, "token_type": "bearer"}
     
 
@@ -212,12 +383,18 @@ async def change_password(user_request: UserRequest, user: UserEntry = Depends(g
         user_request (UserRequest): The request body containing the new password.
         token (str): Bearer token for authentication.
 
+    Raises:
+        HTTPException: 503 if the password hashing pool is saturated.
+        HTTPException: 500 for server errors.
+
     Returns:
         dict: Confirmation message that the password was updated.
     """
     try:
-        update_password(user.user_id, user_request.password)
+        await update_password_async(user.user_id, user_request.password)
         return {"message": "Password has been updated."}
+    except HashingUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -244,8 +421,7 @@ async def update_url_limit(request: UpdateUrlLimitRequest, user: UserEntry = Dep
     new_limit = request.new_limit
     try:
         validate_admin_user(user)
-        user_to_update = UserEntry.get(user_to_update)
-        user_to_update.update(actions=[UserEntry.url_limit.set(new_limit)])
+        user_to_update = await update_user_url_limit_async(user_to_update, new_limit)
         return {"message": f"User {user_to_update.user_id} limit updated to {new_limit}."}
     except UserEntry.DoesNotExist:
         raise HTTPException(status_code=404, detail="User not found.")          
@@ -255,18 +431,65 @@ async def update_url_limit(request: UpdateUrlLimitRequest, user: UserEntry = Dep
         raise e 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-        
-            
-            
-            
-    
 
-        
-        
-            
-            
-            
-    
 
-    
+@router.get("/hash-metrics")
+async def hash_metrics(user: UserEntry = Depends(get_current_user)):
+    """Reports password hashing pool queue depth and latency.
+
+    Args:
+        token (str): Bearer token for authentication.
+
+    Raises:
+        HTTPException: 403 if the user is not admin.
 
+    Returns:
+        dict: Queue depth, completed and rejected counts, and recent latency percentiles in seconds.
+    """
+    try:
+        validate_admin_user(user)
+        return password_hasher.stats()
+    except AdminPrivilegesRequiredError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+@router.get("/hot-keys")
+async def list_hot_keys(user: UserEntry = Depends(get_current_user)):
+    """Lists the short URLs this worker currently treats as hot and pins in its cache.
+
+    Args:
+        token (str): Bearer token for authentication.
+
+    Raises:
+        HTTPException: 403 if the user is not admin.
+
+    Returns:
+        dict: The hot short URLs with their estimated recent lookups, hottest first, whether
+            each is pinned, and the detection settings. Each worker process tracks its own.
+    """
+    try:
+        validate_admin_user(user)
+    except AdminPrivilegesRequiredError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    pinned = url_cache.pinned()
+    return {
+        "hot_keys": [{"short_url": short_url, "estimated_lookups": estimate, "pinned": short_url in pinned}
+                     for short_url, estimate in hot_keys.hot_keys()],
+        "threshold": hot_keys.threshold,
+        "window_seconds": hot_keys.window_seconds,
+        "pinned_ttl_seconds": url_cache.pinned_ttl,
+    }
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Exposes request, DynamoDB, cache, hashing and event-loop metrics for Prometheus to scrape.
+
+    Under gunicorn (METRICS_MULTIPROC_DIR set) the response covers every worker,
+    whichever one serves it: counters and histograms are summed, and gauges
+    carry a worker label.
+
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
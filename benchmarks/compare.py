@@ -0,0 +1,65 @@
+import argparse
+import json
+import sys
+'''
+Compares two result files written by benchmarks.load and prints the change in
+throughput and latency per workload, concurrency level and endpoint.
+
+Use the command: python -m benchmarks.compare before.json after.json --fail-above 10
+
+With --fail-above, exits non-zero if any p99 grew by more than that percentage.
+'''
+
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate")
+
+
+def index_runs(results: dict) -> dict:
+    return {(run["workload"], run["concurrency"], endpoint): stats
+            for run in results["runs"] for endpoint, stats in run["endpoints"].items()}
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(before: dict, after: dict) -> list[dict]:
+    """Returns one row per (workload, concurrency, endpoint) present in both results."""
+    old, new = index_runs(before), index_runs(after)
+    rows = []
+    for key in sorted(old.keys() & new.keys(), key=lambda key: (key[0], key[1], key[2] == "ALL", key[2])):
+        row = {"workload": key[0], "concurrency": key[1], "endpoint": key[2]}
+        for metric in METRICS:
+            row[metric] = (old[key][metric], new[key][metric], change(old[key][metric], new[key][metric]))
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-above", type=float, default=None, help="Fail if any p99 regresses by more than this percent")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('git_commit')} -> {after['meta'].get('git_commit')}")
+    regressions = []
+    for row in compare(before, after):
+        rps, p50, p99 = row["throughput_rps"], row["p50_ms"], row["p99_ms"]
+        print(f"{row['workload']:<22}{row['concurrency']:>4} {row['endpoint']:<16}"
+              f"rps {rps[0]:>8.0f} -> {rps[1]:>8.0f} ({rps[2]:+6.1f}%)  "
+              f"p50 {p50[0]:>8.3f} -> {p50[1]:>8.3f} ({p50[2]:+6.1f}%)  "
+              f"p99 {p99[0]:>8.3f} -> {p99[1]:>8.3f} ({p99[2]:+6.1f}%)")
+        if args.fail_above is not None and p99[2] > args.fail_above:
+            regressions.append(row)
+    if regressions:
+        print(f"\n{len(regressions)} endpoint(s) regressed by more than {args.fail_above}% at p99")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
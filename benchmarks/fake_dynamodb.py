@@ -0,0 +1,532 @@
+'''
+An in-memory stand-in for the DynamoDB API, for benchmarks and local runs.
+
+It implements the low-level calls PynamoDB makes (GetItem, PutItem, UpdateItem,
+DeleteItem, Query, Scan, BatchGetItem, BatchWriteItem, TransactWriteItems,
+DescribeTable). It understands the condition, filter, key-condition and update
+expressions PynamoDB generates. Failed conditions raise the same botocore
+ClientErrors DynamoDB returns, so the service layer's error handling runs
+unchanged. Latency and capacity are not modelled, so results show the cost of
+the application itself.
+
+Use install() to route every PynamoDB model through a fresh instance.
+'''
+from botocore.exceptions import ClientError
+from decimal import Decimal
+from service import aws_clients
+from threading import Lock
+import re
+import zlib
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def to_python(value: dict):
+    """Converts a DynamoDB attribute value, e.g. {"N": "3"}, to a comparable Python value."""
+    kind, raw = next(iter(value.items()))
+    if kind == "S":
+        return raw
+    if kind == "N":
+        return Decimal(raw)
+    if kind == "BOOL":
+        return raw
+    if kind == "NULL":
+        return None
+    if kind == "B":
+        return raw
+    if kind in ("SS", "BS"):
+        return set(raw)
+    if kind == "NS":
+        return {Decimal(n) for n in raw}
+    if kind == "L":
+        return [to_python(v) for v in raw]
+    if kind == "M":
+        return {k: to_python(v) for k, v in raw.items()}
+    raise ExpressionError(f"Unsupported attribute type {kind}")
+
+
+def number(value: Decimal) -> dict:
+    return {"N": str(int(value)) if value == value.to_integral_value() else str(value)}
+
+
+_TOKEN = re.compile(r"\s*(#\w+|:\w+|<>|<=|>=|[=<>(),.]|[A-Za-z_]\w*)")
+
+
+def tokenize(expression: str) -> list[str]:
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise ExpressionError(f"Cannot parse expression at: {expression[position:]}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    #recursive-descent parser for condition and key-condition expressions;
+    #produces a function of the item's attribute dict
+
+    def __init__(self, expression: str, names: dict, values: dict):
+        self.tokens = tokenize(expression)
+        self.names = names or {}
+        self.values = values or {}
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: str = None):
+        token = self.peek()
+        if token is None or (expected is not None and token.upper() != expected):
+            raise ExpressionError(f"Expected {expected}, got {token}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        condition = self.parse_or()
+        if self.peek() is not None:
+            raise ExpressionError(f"Unexpected token {self.peek()}")
+        return condition
+
+    def parse_or(self):
+        left = self.parse_and()
+        while (self.peek() or "").upper() == "OR":
+            self.take()
+            right = self.parse_and()
+            left = (lambda a, b: lambda item: a(item) or b(item))(left, right)
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while (self.peek() or "").upper() == "AND":
+            self.take()
+            right = self.parse_not()
+            left = (lambda a, b: lambda item: a(item) and b(item))(left, right)
+        return left
+
+    def parse_not(self):
+        if (self.peek() or "").upper() == "NOT":
+            self.take()
+            inner = self.parse_not()
+            return lambda item: not inner(item)
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        if self.peek() == "(":
+            self.take()
+            inner = self.parse_or()
+            self.take(")")
+            return inner
+        token = self.peek()
+        if token in ("attribute_exists", "attribute_not_exists", "begins_with", "contains", "attribute_type"):
+            return self.parse_function()
+        left = self.parse_operand()
+        operator = self.take()
+        if operator.upper() == "BETWEEN":
+            low = self.parse_operand()
+            self.take("AND")
+            high = self.parse_operand()
+            return lambda item: _compare(low(item), "<=", left(item)) and _compare(left(item), "<=", high(item))
+        if operator.upper() == "IN":
+            self.take("(")
+            options = [self.parse_operand()]
+            while self.peek() == ",":
+                self.take()
+                options.append(self.parse_operand())
+            self.take(")")
+            return lambda item: any(_compare(left(item), "=", option(item)) for option in options)
+        right = self.parse_operand()
+        return lambda item: _compare(left(item), operator, right(item))
+
+    def parse_function(self):
+        name = self.take()
+        self.take("(")
+        path = self.parse_path()
+        argument = None
+        if self.peek() == ",":
+            self.take()
+            argument = self.parse_operand()
+        self.take(")")
+        if name == "attribute_exists":
+            return lambda item: path(item) is not _MISSING
+        if name == "attribute_not_exists":
+            return lambda item: path(item) is _MISSING
+        if name == "begins_with":
+            return lambda item: isinstance(path(item), str) and path(item).startswith(argument(item))
+        if name == "contains":
+            return lambda item: path(item) is not _MISSING and argument(item) in path(item)
+        raise ExpressionError(f"Unsupported function {name}")
+
+    def parse_operand(self):
+        token = self.peek()
+        if token is None:
+            raise ExpressionError("Expected an operand")
+        if token.startswith(":"):
+            self.take()
+            value = to_python(self.values[token])
+            return lambda item: value
+        if token == "size":
+            self.take()
+            self.take("(")
+            path = self.parse_path()
+            self.take(")")
+            return lambda item: Decimal(len(path(item))) if path(item) is not _MISSING else _MISSING
+        return self.parse_path()
+
+    def parse_path(self):
+        parts = [self.name(self.take())]
+        while self.peek() == ".":
+            self.take()
+            parts.append(self.name(self.take()))
+
+        def resolve(item):
+            value = {"M": item}
+            for part in parts:
+                children = value.get("M")
+                if children is None or part not in children:
+                    return _MISSING
+                value = children[part]
+            return to_python(value)
+        return resolve
+
+    def name(self, token: str) -> str:
+        return self.names[token] if token.startswith("#") else token
+
+
+class _Missing:
+    pass
+
+
+_MISSING = _Missing()
+
+
+def _compare(left, operator: str, right) -> bool:
+    if left is _MISSING or right is _MISSING:
+        return operator == "<>"
+    if operator == "=":
+        return left == right
+    if operator == "<>":
+        return left != right
+    try:
+        if operator == "<":
+            return left < right
+        if operator == "<=":
+            return left <= right
+        if operator == ">":
+            return left > right
+        if operator == ">=":
+            return left >= right
+    except TypeError:
+        return False
+    raise ExpressionError(f"Unsupported operator {operator}")
+
+
+def compile_condition(expression: str, names: dict = None, values: dict = None):
+    """Returns a predicate over raw DynamoDB items, or one that is always true when there is no expression."""
+    if not expression:
+        return lambda item: True
+    condition = _Parser(expression, names, values).parse()
+    return condition
+
+
+def apply_update(item: dict, expression: str, names: dict = None, values: dict = None) -> dict:
+    """Returns a copy of item with a SET/ADD/REMOVE/DELETE update expression applied."""
+    names, values = names or {}, values or {}
+    item = dict(item)
+    clauses = re.split(r"\b(SET|ADD|REMOVE|DELETE)\b", expression, flags=re.IGNORECASE)
+    for keyword, body in zip(clauses[1::2], clauses[2::2]):
+        keyword = keyword.upper()
+        for action in _split_top_level(body):
+            tokens = tokenize(action)
+            if keyword == "SET":
+                path = _name(tokens[0], names)
+                item[path] = _set_value(item, tokens[2:], names, values)
+            elif keyword == "ADD":
+                path, value = _name(tokens[0], names), values[tokens[1]]
+                if "N" in value:
+                    current = to_python(item[path]) if path in item else Decimal(0)
+                    item[path] = number(current + Decimal(value["N"]))
+                else:
+                    kind = next(iter(value))
+                    item[path] = {kind: sorted(set(item.get(path, {kind: []})[kind]) | set(value[kind]))}
+            elif keyword == "REMOVE":
+                item.pop(_name(tokens[0], names), None)
+            elif keyword == "DELETE":
+                path, value = _name(tokens[0], names), values[tokens[1]]
+                kind = next(iter(value))
+                remaining = sorted(set(item.get(path, {kind: []})[kind]) - set(value[kind]))
+                if remaining:
+                    item[path] = {kind: remaining}
+                else:
+                    item.pop(path, None)
+    return item
+
+
+def _split_top_level(body: str) -> list[str]:
+    parts, depth, current = [], 0, ""
+    for char in body:
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _name(token: str, names: dict) -> str:
+    return names[token] if token.startswith("#") else token
+
+
+def _operand_value(item: dict, tokens: list[str], names: dict, values: dict) -> tuple[dict, list[str]]:
+    #returns the raw attribute value of the operand at the front of tokens and the remaining tokens
+    if tokens[0] == "if_not_exists":
+        path = _name(tokens[2], names)
+        default = values[tokens[4]]
+        return item.get(path, default), tokens[6:]
+    if tokens[0].startswith(":"):
+        return values[tokens[0]], tokens[1:]
+    return item[_name(tokens[0], names)], tokens[1:]
+
+
+def _set_value(item: dict, tokens: list[str], names: dict, values: dict) -> dict:
+    left, rest = _operand_value(item, tokens, names, values)
+    if not rest:
+        return left
+    operator = rest[0]
+    right, _ = _operand_value(item, rest[1:], names, values)
+    if operator == "+":
+        return number(Decimal(left["N"]) + Decimal(right["N"]))
+    if operator == "-":
+        return number(Decimal(left["N"]) - Decimal(right["N"]))
+    raise ExpressionError(f"Unsupported SET operator {operator}")
+
+
+def _project(item: dict, projection: str, names: dict) -> dict:
+    if not projection:
+        return item
+    wanted = {_name(part.strip(), names or {}) for part in projection.split(",")}
+    return {key: value for key, value in item.items() if key in wanted}
+
+
+def _client_error(operation: str, code: str, message: str = "", **extra) -> ClientError:
+    response = {"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPHeaders": {}}}
+    response.update(extra)
+    return ClientError(response, operation)
+
+
+class FakeTable:
+    def __init__(self, name: str, hash_key: str, range_key: str = None, indexes: dict = None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        #index name -> (hash key, range key)
+        self.indexes = indexes or {}
+        self.items = {}
+
+    def key_names(self) -> tuple:
+        return (self.hash_key, self.range_key) if self.range_key else (self.hash_key,)
+
+    def key_of(self, item: dict) -> tuple:
+        try:
+            return tuple(to_python(item[name]) for name in self.key_names())
+        except KeyError as e:
+            raise _client_error("PutItem", "ValidationException", f"Missing key attribute {e}")
+
+    def key_dict(self, item: dict, index_name: str = None) -> dict:
+        names = list(self.key_names())
+        if index_name:
+            names += [name for name in self.indexes[index_name] if name and name not in names]
+        return {name: item[name] for name in names}
+
+
+class FakeDynamoDB:
+    """A thread-safe, in-memory DynamoDB that answers PynamoDB's low-level API calls.
+
+    Args:
+        tables (list[FakeTable]): The tables to serve.
+    """
+
+    #PynamoDB checks for a request signer when reusing a client
+    _request_signer = None
+
+    def __init__(self, tables: list):
+        self.tables = {table.name: table for table in tables}
+        self.calls = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_models(cls, models: list) -> "FakeDynamoDB":
+        """Builds the tables, keys and global secondary indexes from PynamoDB model classes."""
+        tables = []
+        for model in models:
+            indexes = {}
+            for index in model._indexes.values():
+                hash_key = next(attr.attr_name for attr in index.Meta.attributes.values() if attr.is_hash_key)
+                range_key = next((attr.attr_name for attr in index.Meta.attributes.values() if attr.is_range_key), None)
+                indexes[index.Meta.index_name] = (hash_key, range_key)
+            tables.append(FakeTable(model.Meta.table_name, model._hash_keyname, model._range_keyname, indexes))
+        return cls(tables)
+
+    def _make_api_call(self, operation_name: str, kwargs: dict) -> dict:
+        handler = getattr(self, f"_op_{operation_name}", None)
+        if handler is None:
+            raise _client_error(operation_name, "UnknownOperationException", f"{operation_name} is not supported by the fake")
+        with self._lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+            return handler(kwargs)
+
+    def _table(self, kwargs: dict) -> FakeTable:
+        try:
+            return self.tables[kwargs["TableName"]]
+        except KeyError:
+            raise _client_error("DescribeTable", "ResourceNotFoundException", f"Table {kwargs.get('TableName')} not found")
+
+    def _check(self, kwargs: dict, item: dict) -> bool:
+        condition = compile_condition(kwargs.get("ConditionExpression"), kwargs.get("ExpressionAttributeNames"),
+                                      kwargs.get("ExpressionAttributeValues"))
+        return condition(item or {})
+
+    def _op_DescribeTable(self, kwargs):
+        table = self._table(kwargs)
+        return {"Table": {"TableName": table.name, "TableStatus": "ACTIVE", "ItemCount": len(table.items)}}
+
+    def _op_GetItem(self, kwargs):
+        table = self._table(kwargs)
+        item = table.items.get(table.key_of(kwargs["Key"]))
+        if item is None:
+            return {}
+        return {"Item": _project(item, kwargs.get("ProjectionExpression"), kwargs.get("ExpressionAttributeNames"))}
+
+    def _op_PutItem(self, kwargs):
+        table = self._table(kwargs)
+        key = table.key_of(kwargs["Item"])
+        if not self._check(kwargs, table.items.get(key)):
+            raise _client_error("PutItem", "ConditionalCheckFailedException", "The conditional request failed")
+        table.items[key] = dict(kwargs["Item"])
+        return {}
+
+    def _op_UpdateItem(self, kwargs):
+        table = self._table(kwargs)
+        key = table.key_of(kwargs["Key"])
+        current = table.items.get(key)
+        if not self._check(kwargs, current):
+            raise _client_error("UpdateItem", "ConditionalCheckFailedException", "The conditional request failed")
+        updated = apply_update(current or dict(kwargs["Key"]), kwargs.get("UpdateExpression", ""),
+                               kwargs.get("ExpressionAttributeNames"), kwargs.get("ExpressionAttributeValues"))
+        table.items[key] = updated
+        return {"Attributes": updated} if kwargs.get("ReturnValues") == "ALL_NEW" else {}
+
+    def _op_DeleteItem(self, kwargs):
+        table = self._table(kwargs)
+        key = table.key_of(kwargs["Key"])
+        current = table.items.get(key)
+        if not self._check(kwargs, current):
+            raise _client_error("DeleteItem", "ConditionalCheckFailedException", "The conditional request failed")
+        table.items.pop(key, None)
+        return {"Attributes": current} if current and kwargs.get("ReturnValues") == "ALL_OLD" else {}
+
+    def _paginate(self, table: FakeTable, items: list, kwargs: dict, index_name: str = None) -> dict:
+        start = kwargs.get("ExclusiveStartKey")
+        if start:
+            start_key = table.key_of(start)
+            for position, item in enumerate(items):
+                if table.key_of(item) == start_key:
+                    items = items[position + 1:]
+                    break
+        limit = kwargs.get("Limit")
+        page = items[:limit] if limit else items
+        result_filter = compile_condition(kwargs.get("FilterExpression"), kwargs.get("ExpressionAttributeNames"),
+                                          kwargs.get("ExpressionAttributeValues"))
+        matched = [_project(item, kwargs.get("ProjectionExpression"), kwargs.get("ExpressionAttributeNames"))
+                   for item in page if result_filter(item)]
+        response = {"Items": matched, "Count": len(matched), "ScannedCount": len(page)}
+        if limit and len(items) > limit:
+            response["LastEvaluatedKey"] = table.key_dict(page[-1], index_name)
+        return response
+
+    def _op_Query(self, kwargs):
+        table = self._table(kwargs)
+        index_name = kwargs.get("IndexName")
+        hash_key, range_key = table.indexes[index_name] if index_name else (table.hash_key, table.range_key)
+        key_condition = compile_condition(kwargs["KeyConditionExpression"], kwargs.get("ExpressionAttributeNames"),
+                                          kwargs.get("ExpressionAttributeValues"))
+        items = [item for item in table.items.values()
+                 if hash_key in item and (range_key is None or range_key in item) and key_condition(item)]
+        if range_key:
+            items.sort(key=lambda item: to_python(item[range_key]), reverse=not kwargs.get("ScanIndexForward", True))
+        return self._paginate(table, items, kwargs, index_name)
+
+    def _op_Scan(self, kwargs):
+        table = self._table(kwargs)
+        items = list(table.items.values())
+        if "TotalSegments" in kwargs:
+            items = [item for item in items
+                     if zlib.crc32(repr(table.key_of(item)).encode()) % kwargs["TotalSegments"] == kwargs["Segment"]]
+        return self._paginate(table, items, kwargs)
+
+    def _op_BatchGetItem(self, kwargs):
+        responses = {}
+        for table_name, request in kwargs["RequestItems"].items():
+            table = self._table({"TableName": table_name})
+            found = [table.items.get(table.key_of(key)) for key in request["Keys"]]
+            responses[table_name] = [_project(item, request.get("ProjectionExpression"), request.get("ExpressionAttributeNames"))
+                                     for item in found if item is not None]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def _op_BatchWriteItem(self, kwargs):
+        for table_name, requests in kwargs["RequestItems"].items():
+            table = self._table({"TableName": table_name})
+            for request in requests:
+                if "PutRequest" in request:
+                    item = request["PutRequest"]["Item"]
+                    table.items[table.key_of(item)] = dict(item)
+                else:
+                    table.items.pop(table.key_of(request["DeleteRequest"]["Key"]), None)
+        return {"UnprocessedItems": {}}
+
+    def _op_TransactWriteItems(self, kwargs):
+        #check every condition first, then apply all writes, so the transaction is all-or-nothing
+        reasons, failed = [], False
+        for entry in kwargs["TransactItems"]:
+            (action, request), = entry.items()
+            table = self._table(request)
+            key = table.key_of(request["Item"] if action == "Put" else request["Key"])
+            if self._check(request, table.items.get(key)):
+                reasons.append({"Code": "None"})
+            else:
+                reasons.append({"Code": "ConditionalCheckFailed", "Message": "The conditional request failed"})
+                failed = True
+        if failed:
+            raise _client_error("TransactWriteItems", "TransactionCanceledException",
+                                "Transaction cancelled", CancellationReasons=reasons)
+        for entry in kwargs["TransactItems"]:
+            (action, request), = entry.items()
+            if action == "Put":
+                self._op_PutItem({key: value for key, value in request.items() if key != "ConditionExpression"})
+            elif action == "Update":
+                self._op_UpdateItem({key: value for key, value in request.items() if key != "ConditionExpression"})
+            elif action == "Delete":
+                self._op_DeleteItem({key: value for key, value in request.items() if key != "ConditionExpression"})
+        return {}
+
+
+def install(models: list = None) -> FakeDynamoDB:
+    """Routes every PynamoDB model through a new FakeDynamoDB and returns it.
+
+    Args:
+        models (list, optional): The model classes to create tables for. Defaults to every model in the app.
+    """
+    if models is None:
+        from models.pynamodb_model import ClickCounterEntry, IdCounterEntry, UrlEntry, UserEntry
+        models = [UrlEntry, UserEntry, IdCounterEntry, ClickCounterEntry]
+    fake = FakeDynamoDB.from_models(models)
+    aws_clients.set_client("dynamodb", fake, endpoint_url=aws_clients.DYNAMODB_HOST)
+    return fake
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+'''
+Replays JSONL request mixes against the FastAPI app and reports throughput,
+p50/p95/p99 latency and error rate per endpoint.
+
+Requests are sent in-process through a minimal ASGI client, so the numbers
+cover the app (routing, validation, auth, service layer, PynamoDB) and no
+network or server. By default DynamoDB is replaced by benchmarks.fake_dynamodb.
+With --dynamodb-host (e.g. http://localhost:8000 for DynamoDB Local) the real
+PynamoDB client is used against that endpoint and missing tables are created.
+With --storage memory or --storage sqlite the app runs on that storage engine
+from service.repository instead of DynamoDB.
+
+Use the command: python -m benchmarks.load benchmarks/workloads/mixed.jsonl --requests 5000 --concurrency 1,16,64 --output results.json
+
+Each workload line is one request template:
+    {"name": "redirect", "method": "GET", "path": "/r/{short_url}", "weight": 70, "expect": 307}
+- name groups results; weight sets its share of the mix; expect is the status
+  counted as success (default 200).
+- "auth": true sends a bearer token for the benchmark user.
+- "json" is the request body.
+- In path and body strings, {short_url} is a random seeded short URL and {n}
+  a number unique to the request. A body value of exactly "{short_urls}"
+  becomes a list of "batch" (default 10) seeded short URLs.
+
+Results are written as JSON with sorted keys so runs can be diffed, or
+compared with: python -m benchmarks.compare old.json new.json
+'''
+
+
+BENCH_USER = "benchuser"
+BENCH_SECRET = "benchmark-secret"
+
+
+def load_workload(path: str) -> list[dict]:
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    for line in lines:
+        line.setdefault("name", f"{line['method']} {line['path']}")
+        line.setdefault("weight", 1)
+        line.setdefault("expect", 200)
+    return lines
+
+
+def render(value, rng: random.Random, n: int, short_urls: list[str], batch: int):
+    #fills {short_url}, {n} and {short_urls} placeholders in a request template
+    if value == "{short_urls}":
+        return rng.sample(short_urls, min(batch, len(short_urls)))
+    if isinstance(value, str):
+        if "{short_url}" in value:
+            value = value.replace("{short_url}", rng.choice(short_urls))
+        return value.replace("{n}", str(n))
+    if isinstance(value, dict):
+        return {key: render(item, rng, n, short_urls, batch) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render(item, rng, n, short_urls, batch) for item in value]
+    return value
+
+
+def build_requests(workload: list[dict], count: int, seed: int, short_urls: list[str], token: str, offset: int = 0) -> list[tuple]:
+    """Draws count requests from the weighted mix. The same seed always yields the same requests."""
+    rng = random.Random(seed)
+    chosen = rng.choices(workload, weights=[line["weight"] for line in workload], k=count)
+    requests = []
+    for n, line in enumerate(chosen, start=offset):
+        headers = [(b"host", b"benchmark")]
+        if line.get("auth"):
+            headers.append((b"authorization", f"Bearer {token}".encode()))
+        body = b""
+        if "json" in line:
+            body = json.dumps(render(line["json"], rng, n, short_urls, line.get("batch", 10))).encode()
+            headers.append((b"content-type", b"application/json"))
+        path = render(line["path"], rng, n, short_urls, 0)
+        requests.append((line["name"], line["method"], path, headers, body, line["expect"]))
+    return requests
+
+
+async def call_asgi(app, method: str, path: str, headers: list, body: bytes) -> int:
+    """Sends one HTTP request straight to an ASGI app and returns the response status."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": headers + [(b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("benchmark", 80),
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_done.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+async def replay(app, requests: list[tuple], concurrency: int) -> tuple[list[tuple], float]:
+    """Runs requests with up to concurrency in flight. Returns (name, latency seconds, ok) per request and the wall time."""
+    results = []
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(requests):
+            name, method, path, headers, body, expect = requests[position]
+            position += 1
+            started = time.perf_counter()
+            try:
+                status = await call_asgi(app, method, path, headers, body)
+            except Exception:
+                status = 0
+            results.append((name, time.perf_counter() - started, status == expect))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values: list[float], quantile: float) -> float:
+    return sorted_values[int(quantile * (len(sorted_values) - 1))] if sorted_values else None
+
+
+def summarize(results: list[tuple], elapsed: float) -> dict:
+    """Aggregates raw results into per-endpoint and overall throughput, latency (ms) and error rate."""
+    groups = {}
+    for name, latency, ok in results:
+        groups.setdefault(name, []).append((latency, ok))
+    groups["ALL"] = [(latency, ok) for _, latency, ok in results]
+    summary = {}
+    for name, samples in groups.items():
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        summary[name] = {
+            "requests": len(samples),
+            "errors": errors,
+            "error_rate": round(errors / len(samples), 6),
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 4),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 4),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+            "max_ms": round(latencies[-1] * 1000, 4),
+        }
+    return summary
+
+
+def setup_backend(dynamodb_host: str = None, storage: str = "dynamodb", sqlite_path: str = None):
+    """Points the app at the fake, at dynamodb_host or at another storage engine. Must run before the app is imported."""
+    os.environ.setdefault("JWT_SECRET_PROVIDER", "env")
+    os.environ.setdefault("JWT_SECRET_KEY", BENCH_SECRET)
+    if storage != "dynamodb":
+        from service.repository import REPOSITORIES, set_repository
+        set_repository(REPOSITORIES[storage](sqlite_path) if storage == "sqlite" else REPOSITORIES[storage]())
+        return None
+    if dynamodb_host:
+        os.environ["DYNAMODB_HOST"] = dynamodb_host
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+        from models.pynamodb_model import IdCounterEntry, UrlEntry, UserEntry
+        for model in (UrlEntry, UserEntry, IdCounterEntry):
+            if not model.exists():
+                model.create_table(billing_mode="PAY_PER_REQUEST", wait=True)
+        return None
+    from benchmarks import fake_dynamodb
+    return fake_dynamodb.install()
+
+
+def seed_data(count: int, seed: int) -> list[str]:
+    """Creates the benchmark user and count short URLs it owns. Returns the short URLs."""
+    from models.pynamodb_model import UrlEntry, UserEntry
+    from service.id_generator import BASE62_ALPHABET
+    from service.repository import get_repository
+
+    rng = random.Random(seed)
+    repository = get_repository()
+    repository.create_user(UserEntry(user_id=BENCH_USER, hashed_password="not-used", url_limit=10**9, url_count=count))
+    short_urls = ["".join(rng.choice(BASE62_ALPHABET) for _ in range(10)) for _ in range(count)]
+    repository.put_urls([UrlEntry(short_url=short_url, original_url=f"https://example.com/seed/{i}", user_id=BENCH_USER)
+                         for i, short_url in enumerate(short_urls)])
+    return short_urls
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(workload: str, concurrency: int, summary: dict) -> None:
+    print(f"\n{workload} @ concurrency {concurrency}")
+    print(f"{'endpoint':<16}{'reqs':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for name, stats in sorted(summary.items(), key=lambda item: item[0] == "ALL"):
+        print(f"{name:<16}{stats['requests']:>8}{stats['throughput_rps']:>10.0f}{stats['p50_ms']:>10.3f}"
+              f"{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['error_rate']:>9.2%}")
+
+
+def run(workloads: list[str], requests: int, concurrency_levels: list[int], seed: int = 1, seed_urls: int = 1000,
+        warmup: int = 200, dynamodb_host: str = None, quiet: bool = False, storage: str = "dynamodb",
+        sqlite_path: str = None) -> dict:
+    """Runs every workload at every concurrency level and returns the results document."""
+    setup_backend(dynamodb_host, storage, sqlite_path)
+    from main import app
+    from service.utils import create_access_token
+    from datetime import timedelta
+
+    short_urls = seed_data(seed_urls, seed)
+    token = create_access_token({"sub": BENCH_USER}, timedelta(hours=1))
+    runs = []
+    for workload_path in workloads:
+        workload = load_workload(workload_path)
+        for concurrency in concurrency_levels:
+            if warmup:
+                asyncio.run(replay(app, build_requests(workload, warmup, seed + 1, short_urls, token, offset=10**8), concurrency))
+            planned = build_requests(workload, requests, seed, short_urls, token, offset=len(runs) * requests)
+            results, elapsed = asyncio.run(replay(app, planned, concurrency))
+            summary = summarize(results, elapsed)
+            if not quiet:
+                print_summary(os.path.basename(workload_path), concurrency, summary)
+            runs.append({
+                "workload": os.path.basename(workload_path),
+                "concurrency": concurrency,
+                "requests": requests,
+                "elapsed_seconds": round(elapsed, 4),
+                "endpoints": summary,
+            })
+    return {
+        "meta": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "backend": storage if storage != "dynamodb" else f"dynamodb:{dynamodb_host}" if dynamodb_host else "fake",
+            "seed": seed,
+            "seed_urls": seed_urls,
+            "warmup": warmup,
+        },
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay request mixes against the API and report latency percentiles.")
+    parser.add_argument("workloads", nargs="+", help="JSONL workload files")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per workload and concurrency level")
+    parser.add_argument("--concurrency", default="16", help="Comma-separated concurrency levels, e.g. 1,16,64")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix and data")
+    parser.add_argument("--seed-urls", type=int, default=1000, help="Short URLs created before the run")
+    parser.add_argument("--warmup", type=int, default=200, help="Unrecorded requests before each run")
+    parser.add_argument("--dynamodb-host", default=os.environ.get("DYNAMODB_HOST"),
+                        help="DynamoDB endpoint, e.g. http://localhost:8000. Defaults to the in-memory fake.")
+    parser.add_argument("--storage", choices=("dynamodb", "memory", "sqlite"), default="dynamodb",
+                        help="Storage engine. dynamodb uses the fake unless --dynamodb-host is set.")
+    parser.add_argument("--sqlite-path", default="benchmark.db", help="Database file for --storage sqlite")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.workloads, args.requests, [int(c) for c in args.concurrency.split(",")], args.seed,
+                  args.seed_urls, args.warmup, args.dynamodb_host, storage=args.storage, sqlite_path=args.sqlite_path)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nWrote {args.output}")
+    failed = any(run["endpoints"]["ALL"]["errors"] for run in results["runs"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+'''
+Micro-benchmarks for the CPU-bound hot paths of the service layer, with a
+stored baseline that fails the run when one of them regresses.
+
+Covered: short ID generation, generate_short_url against mocked models,
+HttpUrl validation, URLRequest/URLResponse (de)serialization, JWT encode and
+decode, cached redirect lookups and RedirectResponse construction.
+
+Use the command: python -m benchmarks.micro --threshold 25
+
+Each benchmark is timed with timeit in repeated rounds and the best round is
+kept, which filters out scheduling noise. Times are also divided by a fixed
+pure-Python calibration loop measured just before each benchmark, so a
+baseline recorded on one machine stays usable on another. Regressions are
+judged on that ratio unless --absolute is given.
+
+--save-baseline records the current numbers as the new baseline. Otherwise a
+benchmark more than --threshold percent slower than baseline is timed again up
+to --retries times, keeping its best result, and the exit status is 1 if it is
+still over the threshold.
+'''
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+DEFAULT_THRESHOLD = float(os.environ.get("MICRO_BENCHMARK_THRESHOLD", 25))
+BENCH_SECRET = "benchmark-secret"
+BENCH_USER = "benchuser"
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Registers a benchmark.
+
+    The decorated function is a generator: it does its setup (patches, inputs),
+    yields the zero-argument callable to time, and cleans up after the yield.
+    Only the yielded callable is timed.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = contextmanager(func)
+        return func
+    return decorator
+
+
+def calibration_loop():
+    #fixed pure-Python work that every result is expressed relative to
+    total = 0
+    for i in range(1000):
+        total += i * i
+    return total
+
+
+def time_call(func, rounds: int = 7, min_time: float = 0.1) -> float:
+    """Returns the best per-call time in nanoseconds over rounds rounds of about min_time seconds each."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=rounds, number=number)) / number * 1e9
+
+
+@contextmanager
+def mocked_environment():
+    #env-based JWT keys and a user served from mocked models, as in the unit tests
+    from models.pynamodb_model import UserEntry
+    from service.cache import principal_cache, url_cache
+    from service.secret_provider import EnvSecretProvider
+
+    with patch.dict(os.environ, {"JWT_SECRET_KEY": BENCH_SECRET}):
+        provider = EnvSecretProvider()
+        provider.get_keys()
+    user = UserEntry(user_id=BENCH_USER, hashed_password="fakehash", url_limit=10**12, url_count=0)
+    url_cache.clear()
+    principal_cache.clear()
+    with patch("service.utils.get_secret_provider", return_value=provider), \
+            patch("models.pynamodb_model.UserEntry.get", return_value=user):
+        try:
+            yield
+        finally:
+            url_cache.clear()
+            principal_cache.clear()
+
+
+@benchmark("id_generator.next_id")
+def bench_next_id():
+    from service.id_generator import SnowflakeIdGenerator
+    generator = SnowflakeIdGenerator(node_id=1)
+    yield lambda: generator.next_id(10)
+
+
+@benchmark("id_generator.next_id_15")
+def bench_next_id_long():
+    from service.id_generator import SnowflakeIdGenerator
+    generator = SnowflakeIdGenerator(node_id=1)
+    yield lambda: generator.next_id(15)
+
+
+@benchmark("url_service.generate_short_url")
+def bench_generate_short_url():
+    from service import url_service
+    with patch("service.url_service.save_url_entry", return_value=None):
+        yield lambda: url_service.generate_short_url("https://example.com/some/path?q=1", BENCH_USER)
+
+
+@benchmark("pydantic.HttpUrl")
+def bench_http_url():
+    from pydantic import HttpUrl
+    yield lambda: str(HttpUrl("HTTPS://Example.COM:443/some/path?q=1#frag"))
+
+
+@benchmark("pydantic.URLRequest.parse_json")
+def bench_url_request_json():
+    from models.url_pydantic_models import URLRequest
+    body = json.dumps({"url": "https://example.com/some/path?q=1", "length": 12})
+    yield lambda: URLRequest.model_validate_json(body)
+
+
+@benchmark("pydantic.URLRequest.validate_dict")
+def bench_url_request_dict():
+    from models.url_pydantic_models import URLRequest
+    body = {"url": "https://example.com/some/path?q=1", "custom_url": "mycustomurl1"}
+    yield lambda: URLRequest.model_validate(body)
+
+
+@benchmark("pydantic.URLResponse.dump_json")
+def bench_url_response_json():
+    from models.url_pydantic_models import URLResponse
+    response = URLResponse(short_url="abcdefghij", original_url="https://example.com/some/path", timestamp=datetime(2024, 1, 1))
+    yield response.model_dump_json
+
+
+@benchmark("utils.create_access_token")
+def bench_create_access_token():
+    from service.utils import create_access_token
+    yield lambda: create_access_token({"sub": BENCH_USER}, timedelta(minutes=30))
+
+
+@benchmark("utils.decode_access_token")
+def bench_decode_access_token():
+    from service.utils import create_access_token, decode_access_token
+    token = create_access_token({"sub": BENCH_USER}, timedelta(minutes=30))
+    yield lambda: decode_access_token(token, [BENCH_SECRET])
+
+
+@benchmark("utils.decode_access_token_rotated")
+def bench_decode_access_token_rotated():
+    #a token signed with the previous key is tried against the current key first
+    from service.utils import create_access_token, decode_access_token
+    token = create_access_token({"sub": BENCH_USER}, timedelta(minutes=30))
+    yield lambda: decode_access_token(token, ["rotated-" + BENCH_SECRET, BENCH_SECRET])
+
+
+@benchmark("url_service.get_original_url_cached")
+def bench_get_original_url_cached():
+    from service.cache import url_cache
+    from service.url_service import get_original_url
+    url_cache.set("abcdefghij", "https://example.com/some/path")
+    yield lambda: get_original_url("abcdefghij")
+
+
+@benchmark("hotkeys.record")
+def bench_hot_key_record():
+    #every lookup counted; the app samples, see url_service.get_original_url_cached
+    from service.hotkeys import HotKeyTracker
+    tracker = HotKeyTracker(threshold=10**9, window_seconds=3600, max_hot=64)
+    yield lambda: tracker.record("abcdefghij")
+
+
+@benchmark("analytics.record_click")
+def bench_record_click():
+    #the work a redirect adds for analytics; the pop keeps the queue from growing
+    from service.analytics import ClickAnalytics
+    analytics = ClickAnalytics(max_queue=1000, aggregate_seconds=1, flush_seconds=1)
+    queue = analytics._queue
+    yield lambda: (analytics.record("abcdefghij", "https://news.example.com/", "Mozilla/5.0"), queue.popleft())
+
+
+@benchmark("responses.RedirectResponse")
+def bench_redirect_response():
+    from fastapi.responses import RedirectResponse
+    yield lambda: RedirectResponse(url="https://example.com/some/path?q=1")
+
+
+def run(names: list[str] = None, rounds: int = 7, min_time: float = 0.1) -> dict:
+    """Times the selected benchmarks (all by default) and returns the results document."""
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+    results = {}
+    calibrations = []
+    with mocked_environment():
+        for name in names:
+            #calibrate next to every benchmark so drift in machine speed cancels out
+            calibration = time_call(calibration_loop, rounds, min_time)
+            calibrations.append(calibration)
+            with BENCHMARKS[name]() as func:
+                func()
+                ns = time_call(func, rounds, min_time)
+            results[name] = {"ns_per_call": round(ns, 1), "relative": round(ns / calibration, 5)}
+    return {
+        "meta": {"python": platform.python_version(), "calibration_ns": round(min(calibrations), 1)},
+        "benchmarks": results,
+    }
+
+
+def merge_best(results: dict, retry: dict, absolute: bool = False) -> dict:
+    """Keeps, per benchmark, whichever of two runs was faster."""
+    field = "ns_per_call" if absolute else "relative"
+    merged = {**results, "benchmarks": dict(results["benchmarks"])}
+    for name, stats in retry["benchmarks"].items():
+        if name not in merged["benchmarks"] or stats[field] < merged["benchmarks"][name][field]:
+            merged["benchmarks"][name] = stats
+    return merged
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD, absolute: bool = False) -> list[dict]:
+    """Returns one row per benchmark present in both documents, flagging those slower than threshold percent."""
+    field = "ns_per_call" if absolute else "relative"
+    rows = []
+    for name, stats in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        change = (stats[field] - before[field]) / before[field] * 100 if before[field] else 0.0
+        rows.append({"name": name, "before": before[field], "after": stats[field], "change": change,
+                     "regressed": change > threshold})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time service-layer hot paths and compare them with a stored baseline.")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run. Defaults to all.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown in percent")
+    parser.add_argument("--absolute", action="store_true", help="Compare raw times instead of calibration-relative ones")
+    parser.add_argument("--rounds", type=int, default=7, help="Timing rounds per benchmark; the best is kept")
+    parser.add_argument("--retries", type=int, default=2, help="Times a regressed benchmark is re-timed before failing")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return
+    results = run(args.names, args.rounds)
+    print(f"calibration {results['meta']['calibration_ns']:.0f} ns")
+    if args.save_baseline:
+        for name, stats in results["benchmarks"].items():
+            print(f"{name:<40}{stats['ns_per_call']:>12.0f} ns")
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nWrote {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; record one with --save-baseline")
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(baseline, results, args.threshold, args.absolute)
+    for _ in range(args.retries):
+        regressed = [row["name"] for row in rows if row["regressed"]]
+        if not regressed:
+            break
+        #a single slow measurement is usually noise; only a repeatable slowdown fails the run
+        results = merge_best(results, run(regressed, args.rounds), args.absolute)
+        rows = compare(baseline, results, args.threshold, args.absolute)
+    for row in rows:
+        ns = results["benchmarks"][row["name"]]["ns_per_call"]
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"{row['name']:<40}{ns:>12.0f} ns  {row['change']:+7.1f}%{flag}")
+    regressions = [row for row in rows if row["regressed"]]
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import time
+from service.pagination import DEFAULT_PAGE_SIZE
+from service.repository import get_repository
+from service.snapshot import build_snapshot
+'''
+Builds a memory-mapped redirect snapshot of every short URL for edge nodes.
+
+Use the command: python build_snapshot.py /var/lib/url-shortener/redirects.snap
+
+The snapshot is written next to the target and renamed over it, so nodes
+started with REDIRECT_SNAPSHOT_PATH pointing at the target pick it up on their
+next reload check without serving a partial file. URLs are read from the
+configured storage engine (STORAGE_ENGINE).
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a redirect snapshot from every stored short URL.")
+    parser.add_argument("path", help="Snapshot file to write or replace")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Items read per page")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = build_snapshot(args.path, get_repository().iter_urls(args.page_size))
+    print(f"Wrote {count} URLs to {args.path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import time
+from service.export import EXPORT_FORMATS, backfill_created_at, export_urls
+'''
+Exports every short URL to a gzip-compressed NDJSON or CSV file using a
+parallel segmented DynamoDB scan.
+
+Use the command: python export_urls.py urls.ndjson.gz --segments 16 --max-read-units 2000
+
+With --backfill-created-at it instead stamps created_at on legacy entries so
+they show up in the user_id/created_at index, and no file is written.
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export all short URLs with a parallel scan.")
+    parser.add_argument("path", nargs="?", help="Output file, written gzip-compressed (e.g. urls.ndjson.gz)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--segments", type=int, default=8, help="Number of parallel scan segments")
+    parser.add_argument("--max-read-units", type=float, default=None,
+                        help="Read capacity units per second to consume across all segments")
+    parser.add_argument("--page-size", type=int, default=None, help="Items per Scan call")
+    parser.add_argument("--backfill-created-at", action="store_true",
+                        help="Add created_at to entries missing it instead of exporting")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.backfill_created_at:
+        count = backfill_created_at(args.segments, args.max_read_units)
+        print(f"Backfilled created_at on {count} URLs in {time.perf_counter() - started:.1f}s")
+        return
+    if not args.path:
+        parser.error("path is required unless --backfill-created-at is given")
+    count = export_urls(args.path, args.format, args.segments, args.max_read_units, args.page_size)
+    print(f"Exported {count} URLs to {args.path} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import logging
+import math
+import os
+import tempfile
+'''
+Gunicorn settings for production: several uvicorn workers behind one socket.
+
+Use the command: gunicorn -c gunicorn.conf.py main:app
+
+One uvicorn process runs on one core however many vCPUs the task has, so this
+starts one worker per available CPU (WEB_CONCURRENCY overrides it). The CPU
+count honours the container's cgroup quota, not just the host's cores, so a
+task is not oversubscribed.
+
+The app is imported once in the master before forking (preload_app), so
+workers start from a warm copy: modules loaded and the JWT keys fetched once.
+Each worker then drops the AWS clients it inherited and opens its own
+connections, since connection pools must not be shared across processes. It
+also drops the inherited short ID generator. Every worker takes the lowest slot
+no live worker holds, so recycled workers reuse slots, and its node ID is
+NODE_ID plus its slot: no two live workers share one.
+
+Each scrape of /metrics reaches one worker, so workers write their metrics to
+METRICS_MULTIPROC_DIR and the one scraped reports all of them. The master
+empties the directory at start and archives the counters of workers that exit.
+
+Workers run uvloop and httptools when installed (uvicorn[standard]) and are
+recycled after a jittered number of requests, one at a time, with in-flight
+requests finishing first.
+'''
+
+
+def available_cpus() -> int:
+    """Returns how many CPUs this process may use: the smaller of its affinity mask and its cgroup quota."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = None
+    try:
+        #cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            #cgroup v1: quota is -1 when unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", available_cpus()))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+# Listen queue for connections not yet accepted by a worker
+backlog = int(os.environ.get("GUNICORN_BACKLOG", 2048))
+# Idle keep-alive seconds. Must exceed the load balancer's idle timeout (60s on
+# an ALB), or the worker closes connections the balancer is about to reuse.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 75))
+# A worker that does not check in with the master for this long is restarted
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# How long a recycled or stopping worker may spend finishing in-flight requests
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Recycle each worker after this many requests, jittered so they do not all restart at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+# Set before the app is preloaded, so service.metrics sees it. One directory per
+# server: two servers on one host must not share it.
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "url-shortener-metrics"))
+
+
+def when_ready(server):
+    #runs in the master after the preloaded app is imported, before any worker is forked
+    from service.metrics import clear_snapshots
+    clear_snapshots()
+    #forked workers inherit the cached keys
+    from service.secret_provider import get_secret_provider
+    try:
+        get_secret_provider().get_keys()
+    except Exception as e:
+        logging.getLogger("gunicorn.error").warning("Could not preload JWT keys, workers will load them: %s", e)
+
+
+def pre_fork(server, worker):
+    #runs in the master: give the new worker the lowest slot no live worker holds
+    taken = {getattr(other, "slot", None) for other in server.WORKERS.values()}
+    worker.slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    #pooled connections opened in the master must not be shared between processes
+    from service.aws_clients import reset_clients
+    reset_clients()
+    #the preloaded app would otherwise give every worker the same node ID
+    from service.id_generator import reset_id_generator, worker_node_id
+    if "NODE_ID" in os.environ:
+        os.environ["NODE_ID"] = str(worker_node_id(int(os.environ["NODE_ID"]), worker.slot))
+    reset_id_generator()
+
+
+def child_exit(server, worker):
+    #keep the exited worker's counters in the totals and drop its gauges
+    from service.metrics import mark_process_dead
+    try:
+        mark_process_dead(worker.pid)
+    except Exception as e:
+        logging.getLogger("gunicorn.error").warning("Could not archive metrics of worker %s: %s", worker.pid, e)
@@ -1,6 +1,61 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from api.middleware import MetricsMiddleware, TracingMiddleware
 from api.routes import router
+from models.pynamodb_model import UrlEntry, UserEntry
+from service.analytics import ANALYTICS_ENABLED, click_analytics
+from service.aws_clients import warm_clients
+from service.executors import run_in_db_pool
+from service.hashing import password_hasher
+from service.metrics import METRICS_MULTIPROC_DIR, monitor_event_loop_lag, write_snapshot, write_snapshots_periodically
+from service.repository import STORAGE_ENGINE
+from service.secret_provider import get_secret_provider
+from service.shared_cache import SHARED_CACHE_BACKEND, close_cache_backend, start_invalidation_listener
+from service.tracing import TRACING_ENABLED, configure_logging
+import asyncio
+import logging
 
-app = FastAPI()
 
+logger = logging.getLogger("main")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #open DynamoDB connections and load the JWT key before the first request needs them
+    try:
+        if STORAGE_ENGINE == "dynamodb":
+            await run_in_db_pool(warm_clients, [UrlEntry.Meta.table_name, UserEntry.Meta.table_name])
+        await run_in_db_pool(get_secret_provider().get_keys)
+    except Exception:
+        logger.warning("Startup warm-up failed, continuing cold", exc_info=True)
+    if SHARED_CACHE_BACKEND != "none":
+        #each worker subscribes its own local caches to invalidations from the others
+        try:
+            await run_in_db_pool(start_invalidation_listener)
+        except Exception:
+            logger.error("Shared cache invalidation listener failed to start", exc_info=True)
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    #under gunicorn, publish this worker's metrics for whichever worker gets scraped
+    snapshot_writer = asyncio.create_task(write_snapshots_periodically()) if METRICS_MULTIPROC_DIR else None
+    if ANALYTICS_ENABLED:
+        click_analytics.start()
+    yield
+    lag_monitor.cancel()
+    #write clicks still in memory before the worker exits
+    await click_analytics.stop()
+    password_hasher.shutdown()
+    close_cache_backend()
+    if snapshot_writer is not None:
+        snapshot_writer.cancel()
+        #the master folds this last snapshot into its archive once the worker exits
+        write_snapshot()
+
+
+if TRACING_ENABLED:
+    configure_logging()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(router)
@@ -1,17 +1,35 @@
 from pynamodb.models import Model
-from pynamodb.attributes import UnicodeAttribute, NumberAttribute, BooleanAttribute
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute, BooleanAttribute, UTCDateTimeAttribute
 from pynamodb.indexes import GlobalSecondaryIndex, AllProjection
+from service.aws_clients import use_shared_client
+from datetime import datetime, timezone
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+class SharedClientModel(Model):
+    #Base for every table model, so all of them go through the one pooled,
+    #tuned DynamoDB client from service.aws_clients instead of a client each.
+    @classmethod
+    def _get_connection(cls):
+        connection = super()._get_connection()
+        use_shared_client(connection.connection)
+        return connection
+
 
 class UserIdIndex(GlobalSecondaryIndex):
-    #Index for querying URL entries by user_id
+    #Index for querying URL entries by user_id, sorted by creation time so the
+    #most recent links are a single bounded query. Entries without created_at
+    #are not in this index until backfilled (see service.export.backfill_created_at).
     class Meta:
-        index_name = "user_id-index"
+        index_name = "user_id-created_at-index"
         projection = AllProjection()
         
     user_id = UnicodeAttribute(hash_key=True)
+    created_at = UTCDateTimeAttribute(range_key=True)
     
     
-class UrlEntry(Model):
+class UrlEntry(SharedClientModel):
     class Meta:
         table_name = "url-shortener"
         region = "us-east-2"
@@ -19,10 +37,11 @@ class UrlEntry(Model):
     short_url = UnicodeAttribute(hash_key=True)
     original_url = UnicodeAttribute()
     user_id = UnicodeAttribute()
+    created_at = UTCDateTimeAttribute(null=True, default_for_new=utc_now)
     user_id_index = UserIdIndex()
     
     
-class UserEntry(Model):
+class UserEntry(SharedClientModel):
     class Meta:
         table_name = "users"
         region = "us-east-2"
@@ -32,6 +51,30 @@ class UserEntry(Model):
     is_admin = BooleanAttribute(default=False)
     url_limit = NumberAttribute(default=20)
     url_count = NumberAttribute(default=0)
+
+    
+class IdCounterEntry(SharedClientModel):
+    #Counters handed out in blocks by the short ID generator
+    class Meta:
+        table_name = "url-shortener-counters"
+        region = "us-east-2"
+    
+    name = UnicodeAttribute(hash_key=True)
+    value = NumberAttribute(default=0)
+
+
+class ClickCounterEntry(SharedClientModel):
+    #Click counts per short URL, aggregated in process by service.analytics and
+    #added atomically. bucket is a UTC period rollup ("minute#2024-01-01T13:05",
+    #"hour#2024-01-01T13", "day#2024-01-01", "month#2024-01"), "total",
+    #"referrer#<host>" or "agent#<family>". A range of one rollup is one query.
+    class Meta:
+        table_name = "url-shortener-clicks"
+        region = "us-east-2"
+
+    short_url = UnicodeAttribute(hash_key=True)
+    bucket = UnicodeAttribute(range_key=True)
+    clicks = NumberAttribute(default=0)
     
         
         
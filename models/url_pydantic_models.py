@@ -1,11 +1,15 @@
-from pydantic import BaseModel, HttpUrl, Field, ValidationError, validator
+from pydantic import BaseModel, HttpUrl, Field, ValidationError, constr, validator
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
+
+BATCH_SHORTEN_MAX_ITEMS = 1000
+BATCH_RESOLVE_MAX_ITEMS = 1000
+SHORT_URL_MAX_LENGTH = 15
 
 class URLRequest(BaseModel):
     url: HttpUrl
-    custom_url: Optional[str] = Field(default=None, min_length=10, max_length=15, description="Length must be between 10 and 15")
-    length: int = Field(default=10, ge=10, le=15, description="Length must be between 10 and 15")
+    custom_url: Optional[str] = Field(default=None, min_length=10, max_length=SHORT_URL_MAX_LENGTH, description="Length must be between 10 and 15")
+    length: int = Field(default=10, ge=10, le=SHORT_URL_MAX_LENGTH, description="Length must be between 10 and 15")
 
 
 class URLResponse(BaseModel):
@@ -13,6 +17,62 @@ class URLResponse(BaseModel):
     original_url: str
     timestamp: datetime
     
+
+class BatchURLRequest(BaseModel):
+    items: List[URLRequest] = Field(min_length=1, max_length=BATCH_SHORTEN_MAX_ITEMS,
+        description=f"Between 1 and {BATCH_SHORTEN_MAX_ITEMS} URLs to shorten")
+
+
+class BatchURLResult(BaseModel):
+    short_url: Optional[str] = None
+    original_url: str
+    status_code: int
+    detail: Optional[str] = None
+
+
+class BatchURLResponse(BaseModel):
+    results: List[BatchURLResult]
+    created: int
+    failed: int
+    timestamp: datetime
+    
+
+class BatchResolveRequest(BaseModel):
+    short_urls: List[constr(min_length=1, max_length=SHORT_URL_MAX_LENGTH)] = Field(min_length=1, max_length=BATCH_RESOLVE_MAX_ITEMS,
+        description=f"Between 1 and {BATCH_RESOLVE_MAX_ITEMS} short URLs to resolve")
+
+
+class BatchResolveResponse(BaseModel):
+    urls: Dict[str, Optional[str]]
+    misses: List[str]
+    
+class StatsPoint(BaseModel):
+    period: str
+    clicks: int
+
+
+class LinkStatsResponse(BaseModel):
+    short_url: str
+    granularity: str
+    start: datetime
+    end: datetime
+    total_clicks: int
+    range_clicks: int
+    series: List[StatsPoint]
+    referrers: Dict[str, int]
+    agents: Dict[str, int]
+
+
+class TopUrl(BaseModel):
+    short_url: str
+    original_url: str
+    clicks: int
+
+
+class TopUrlsResponse(BaseModel):
+    period: str
+    urls: List[TopUrl]
+    
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,303 @@
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from service.executors import analytics_executor, run_in_executor
+from service.metrics import register_stats
+from service.repository import get_repository
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import os
+import time
+
+
+ANALYTICS_ENABLED = os.environ.get("ANALYTICS_ENABLED", "true").lower() == "true"
+ANALYTICS_QUEUE_SIZE = int(os.environ.get("ANALYTICS_QUEUE_SIZE", 50000))
+ANALYTICS_AGGREGATE_SECONDS = float(os.environ.get("ANALYTICS_AGGREGATE_SECONDS", 0.5))
+ANALYTICS_FLUSH_SECONDS = float(os.environ.get("ANALYTICS_FLUSH_SECONDS", 10))
+# Counters per database call; batches are written ANALYTICS_POOL_SIZE at a time in their own pool
+ANALYTICS_FLUSH_BATCH_SIZE = int(os.environ.get("ANALYTICS_FLUSH_BATCH_SIZE", 100))
+# Most counters held between flushes. While storage is failing, clicks on counters
+# beyond this are dropped and counted rather than growing memory without bound.
+ANALYTICS_MAX_COUNTERS = int(os.environ.get("ANALYTICS_MAX_COUNTERS", 200000))
+
+# Counter buckets for time are "<granularity>#<UTC period>". Every click is added
+# at each granularity as it is aggregated, so the hour, day and month rollups are
+# kept up to date incrementally and reading a range never sums raw minutes.
+PERIOD_FORMATS = {
+    "minute": "%Y-%m-%dT%H:%M",
+    "hour": "%Y-%m-%dT%H",
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+# All-time clicks per link, read by the per-user top links view
+TOTAL_BUCKET = "total"
+
+MAX_REFERRER_HOST_LENGTH = 253
+# Most referrer counters one link gets. Clicks from hosts beyond them add to
+# OTHER_REFERRER_BUCKET, so a link's referrer breakdown is a small, bounded read.
+ANALYTICS_MAX_REFERRERS = int(os.environ.get("ANALYTICS_MAX_REFERRERS", 50))
+DIRECT_REFERRER_BUCKET = "referrer#direct"
+OTHER_REFERRER_BUCKET = "referrer#other"
+BOT_MARKERS = ("bot", "crawl", "spider", "slurp", "curl", "wget", "python-", "httpclient", "headless", "preview")
+MOBILE_MARKERS = ("mobile", "android", "iphone", "ipad", "ipod")
+
+logger = logging.getLogger("analytics")
+
+
+def period_bucket(granularity: str, moment: datetime) -> str:
+    """Returns the counter bucket of the given granularity that contains moment (converted to UTC)."""
+    return f"{granularity}#{moment.astimezone(timezone.utc).strftime(PERIOD_FORMATS[granularity])}"
+
+
+def time_buckets(minute: int) -> tuple[str, ...]:
+    """Returns the minute, hour, day and month buckets for a minute given as whole minutes since the epoch."""
+    moment = datetime.fromtimestamp(minute * 60, timezone.utc)
+    return tuple(f"{granularity}#{moment.strftime(format)}" for granularity, format in PERIOD_FORMATS.items())
+
+
+@lru_cache(maxsize=4096)
+def referrer_bucket(referrer: str) -> str:
+    """Returns the counter bucket for a Referer header: its host, or "direct" without one."""
+    try:
+        host = urlsplit(referrer).hostname if referrer else None
+    except ValueError:
+        host = None
+    return f"referrer#{host[:MAX_REFERRER_HOST_LENGTH]}" if host else DIRECT_REFERRER_BUCKET
+
+
+@lru_cache(maxsize=4096)
+def agent_bucket(user_agent: str) -> str:
+    """Returns the counter bucket for a User-Agent header: bot, mobile, desktop, other or unknown.
+
+    Families are coarse on purpose, so the number of counters per link stays small.
+    """
+    if not user_agent:
+        return "agent#unknown"
+    agent = user_agent.lower()
+    if any(marker in agent for marker in BOT_MARKERS):
+        return "agent#bot"
+    if any(marker in agent for marker in MOBILE_MARKERS):
+        return "agent#mobile"
+    if agent.startswith("mozilla/"):
+        return "agent#desktop"
+    return "agent#other"
+
+
+class ClickAnalytics:
+    """Counts redirects per short URL off the request path.
+
+    record only appends the raw event to a bounded in-process queue, so a
+    redirect never waits on the database. A background task drains the queue
+    every aggregate_seconds into in-memory counters per (short_url, bucket):
+    one per minute, hour, day and month, an all-time total, one per referrer
+    host and one per user agent family. Every flush_seconds the counters are added to storage in batches of atomic
+    increments, so N clicks on a link in one interval cost one write per
+    bucket rather than N. When the queue is full, events are dropped and
+    counted rather than slowing redirects down.
+
+    A link gets a counter for at most max_referrers referrer hosts. Before a
+    flush writes a host counter the link does not have yet, it checks how many
+    the link has; when they are used up, the host's clicks go to the link's
+    "other" counter instead. The busiest hosts of each flush are let in first.
+    Workers flushing at once can each let one batch of hosts in, so the bound
+    is approximate.
+
+    Batches are written in the small analytics pool, never the DB pool that
+    serves redirects. Counters that fail to flush are kept and retried with the
+    next flush, up to max_counters in all; past that, clicks on counters not
+    already held are dropped and counted.
+    Counters are per worker process; each adds its own to the shared totals.
+
+    Args:
+        max_queue (int): The most events held before aggregation.
+        aggregate_seconds (float): How often the queue is drained into counters.
+        flush_seconds (float): How often counters are written to storage.
+        batch_size (int, optional): Counters per database call. Defaults to ANALYTICS_FLUSH_BATCH_SIZE.
+        max_counters (int, optional): The most counters held. Defaults to ANALYTICS_MAX_COUNTERS.
+        max_referrers (int, optional): The most referrer counters per link. Defaults to ANALYTICS_MAX_REFERRERS.
+    """
+
+    def __init__(self, max_queue: int, aggregate_seconds: float, flush_seconds: float,
+                 batch_size: int = ANALYTICS_FLUSH_BATCH_SIZE, max_counters: int = ANALYTICS_MAX_COUNTERS,
+                 max_referrers: int = ANALYTICS_MAX_REFERRERS):
+        self.max_queue = max_queue
+        self.aggregate_seconds = aggregate_seconds
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.max_counters = max_counters
+        self.max_referrers = max_referrers
+        self.folded_referrers = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.dropped_counts = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self._queue = deque()
+        #(short_url, bucket) -> clicks not yet written
+        self._counts = {}
+        self._task = None
+        self._flushing = None
+
+    def record(self, short_url: str, referrer: str = None, user_agent: str = None) -> bool:
+        """Queues one click without blocking. Returns False if the queue was full and the click was dropped."""
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+        self._queue.append((short_url, int(time.time() // 60), referrer, user_agent))
+        self.recorded += 1
+        return True
+
+    def aggregate(self) -> int:
+        """Moves every queued event into the counters. Returns the number of events moved."""
+        queue = self._queue
+        counts = self._counts
+        max_counters = self.max_counters
+        minutes = {}
+        moved = 0
+        #bounded by the length on entry, so events arriving meanwhile wait for the next pass
+        for _ in range(len(queue)):
+            short_url, minute, referrer, user_agent = queue.popleft()
+            buckets = minutes.get(minute)
+            if buckets is None:
+                buckets = minutes[minute] = time_buckets(minute) + (TOTAL_BUCKET,)
+            for bucket in buckets + (referrer_bucket(referrer), agent_bucket(user_agent)):
+                key = (short_url, bucket)
+                current = counts.get(key)
+                if current is not None:
+                    counts[key] = current + 1
+                elif len(counts) < max_counters:
+                    counts[key] = 1
+                else:
+                    self.dropped_counts += 1
+            moved += 1
+        return moved
+
+    def _requeue(self, failed: dict) -> None:
+        counts = self._counts
+        for key, clicks in failed.items():
+            if key in counts or len(counts) < self.max_counters:
+                counts[key] = counts.get(key, 0) + clicks
+            else:
+                self.dropped_counts += clicks
+
+    def admit_referrers(self, counts: dict) -> dict:
+        """Moves clicks from referrer hosts a link has no room for to its other counter. Reads storage, so it blocks.
+
+        Returns:
+            dict: The counters to write.
+        """
+        new_hosts = {}
+        for (short_url, bucket), clicks in counts.items():
+            if bucket.startswith("referrer#") and bucket not in (DIRECT_REFERRER_BUCKET, OTHER_REFERRER_BUCKET):
+                new_hosts.setdefault(short_url, {})[bucket] = clicks
+        if not new_hosts:
+            return counts
+        repository = get_repository()
+        existing = repository.batch_get_click_counts([(short_url, bucket) for short_url, buckets in new_hosts.items()
+                                                      for bucket in buckets])
+        for short_url, buckets in new_hosts.items():
+            candidates = sorted((bucket for bucket in buckets if (short_url, bucket) not in existing),
+                                key=lambda bucket: -buckets[bucket])
+            if not candidates:
+                continue
+            used = len(repository.get_click_counts(short_url, "referrer#", limit=self.max_referrers))
+            for bucket in candidates[max(0, self.max_referrers - used):]:
+                other = (short_url, OTHER_REFERRER_BUCKET)
+                counts[other] = counts.get(other, 0) + counts.pop((short_url, bucket))
+                self.folded_referrers += 1
+        return counts
+
+    async def flush(self) -> int:
+        """Aggregates queued events and adds every counter to storage.
+
+        Returns:
+            int: The number of counters written. Counters that failed are kept for the next flush.
+        """
+        self.aggregate()
+        counts, self._counts = self._counts, {}
+        if not counts:
+            return 0
+        try:
+            counts = await run_in_executor(analytics_executor, self.admit_referrers, counts)
+        except Exception as e:
+            logger.warning("Could not check referrer counters, keeping %d click counters: %s", len(counts), e)
+            self.flush_errors += 1
+            self._requeue(counts)
+            return 0
+        items = list(counts.items())
+        batches = [dict(items[start:start + self.batch_size]) for start in range(0, len(items), self.batch_size)]
+        repository = get_repository()
+        #the analytics pool runs ANALYTICS_POOL_SIZE batches at a time and queues the rest
+        results = await asyncio.gather(*(run_in_executor(analytics_executor, repository.add_click_counts, batch)
+                                         for batch in batches), return_exceptions=True)
+        written = 0
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                logger.warning("Could not write %d click counters: %s", len(batch), result)
+                failed = batch
+            else:
+                failed = result
+            if failed:
+                self.flush_errors += 1
+                self._requeue(failed)
+            written += len(batch) - len(failed)
+        self.flushed += written
+        return written
+
+    async def run(self) -> None:
+        """Aggregates and flushes on their intervals until cancelled. Run it as a background task."""
+        last_flush = time.monotonic()
+        while True:
+            await asyncio.sleep(self.aggregate_seconds)
+            self.aggregate()
+            #a slow flush must not hold up draining the queue, so it runs alongside
+            if time.monotonic() - last_flush >= self.flush_seconds and (self._flushing is None or self._flushing.done()):
+                last_flush = time.monotonic()
+                self._flushing = asyncio.create_task(self.flush())
+
+    def start(self) -> None:
+        """Starts the background task on the running loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stops the background task and writes whatever is still queued."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        try:
+            if self._flushing is not None:
+                await self._flushing
+            await self.flush()
+        except Exception as e:
+            logger.warning("Final click analytics flush failed: %s", e)
+
+    def stats(self) -> dict:
+        """Returns queue depth, pending counters, throughput counters and clicks dropped at either limit."""
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue,
+            "pending_counters": len(self._counts),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "max_counters": self.max_counters,
+            "dropped_counts": self.dropped_counts,
+            "folded_referrers": self.folded_referrers,
+            "flushed_counters": self.flushed,
+            "flush_errors": self.flush_errors,
+        }
+
+
+click_analytics = ClickAnalytics(ANALYTICS_QUEUE_SIZE, ANALYTICS_AGGREGATE_SECONDS, ANALYTICS_FLUSH_SECONDS)
+register_stats("click_analytics", "Click analytics queue", click_analytics.stats)
+
+
+def record_click(short_url: str, referrer: str = None, user_agent: str = None) -> None:
+    """Queues a click on short_url for the analytics pipeline, if analytics are enabled."""
+    if ANALYTICS_ENABLED:
+        click_analytics.record(short_url, referrer, user_agent)
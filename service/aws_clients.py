@@ -0,0 +1,159 @@
+from botocore.config import Config
+from botocore.exceptions import NoCredentialsError
+from concurrent.futures import ThreadPoolExecutor
+from botocore.session import get_session
+from pynamodb.connection import Connection
+from service import metrics, tracing
+from threading import Lock
+import logging
+import os
+import weakref
+
+
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-2")
+DYNAMODB_HOST = os.environ.get("DYNAMODB_HOST") or None
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 50))
+AWS_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("AWS_CONNECT_TIMEOUT_SECONDS", 2))
+AWS_READ_TIMEOUT_SECONDS = float(os.environ.get("AWS_READ_TIMEOUT_SECONDS", 5))
+AWS_RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "adaptive")
+AWS_MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", 3))
+AWS_TCP_KEEPALIVE = os.environ.get("AWS_TCP_KEEPALIVE", "true").lower() == "true"
+AWS_WARM_CONNECTIONS = int(os.environ.get("AWS_WARM_CONNECTIONS", 4))
+
+_session = None
+_clients = {}
+#every client get_client or set_client ever handed out, to tell them from clients PynamoDB built itself
+_issued = weakref.WeakSet()
+_lock = Lock()
+
+logger = logging.getLogger("aws_clients")
+
+
+def client_config() -> Config:
+    """Returns the botocore config every AWS client in the process is built with.
+
+    One client per service keeps a single urllib3 pool of up to
+    AWS_MAX_POOL_CONNECTIONS connections. The pool should be at least as large
+    as the number of threads making calls, or connections get discarded and
+    re-opened. TCP keep-alive stops idle pooled connections from being dropped
+    silently. Adaptive retries back off client-side when DynamoDB throttles.
+    """
+    return Config(
+        connect_timeout=AWS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=AWS_READ_TIMEOUT_SECONDS,
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        retries={"mode": AWS_RETRY_MODE, "total_max_attempts": AWS_MAX_ATTEMPTS},
+        tcp_keepalive=AWS_TCP_KEEPALIVE,
+    )
+
+
+def get_client(service_name: str, region_name: str = None, endpoint_url: str = None):
+    """Returns the process-wide botocore client for a service, creating it on first use.
+
+    botocore clients are thread-safe once created, but creating them is not, so
+    creation happens under a lock and the client is reused afterwards.
+    Credentials are resolved once, when the client is built. botocore keeps a
+    failed lookup (e.g. after a metadata service timeout) for the client's
+    lifetime, so a client whose call fails with NoCredentialsError is dropped
+    and the next call builds a new one, resolving credentials again.
+
+    Args:
+        service_name (str): The AWS service, e.g. "dynamodb".
+        region_name (str, optional): Defaults to AWS_REGION.
+        endpoint_url (str, optional): Overrides the service endpoint, e.g. for DynamoDB Local.
+
+    Returns:
+        BaseClient: The shared client.
+    """
+    global _session
+    key = (service_name, region_name or AWS_REGION, endpoint_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if _session is None:
+                    _session = get_session()
+                #the session retries a lookup that found nothing, and the client is built with its result
+                if _session.get_credentials() is None:
+                    logger.warning("No AWS credentials found for the shared %s client", service_name)
+                client = _session.create_client(service_name, region_name=key[1], endpoint_url=endpoint_url,
+                                                config=client_config())
+                metrics.instrument_client(client)
+                tracing.instrument_client(client)
+                client.meta.events.register("after-call-error", _drop_on_missing_credentials(key, client))
+                _clients[key] = client
+                _issued.add(client)
+    return client
+
+
+def _drop_on_missing_credentials(key: tuple, client):
+    #returns a botocore after-call-error handler that forgets the client once it has failed to sign a call
+    def handler(exception=None, **kwargs):
+        if isinstance(exception, NoCredentialsError):
+            with _lock:
+                if _clients.get(key) is client:
+                    logger.warning("The shared %s client has no credentials, creating it again on next use", key[0])
+                    del _clients[key]
+    return handler
+
+
+def set_client(service_name: str, client, region_name: str = None, endpoint_url: str = None) -> None:
+    """Installs a client in place of the one get_client would build, e.g. an in-memory fake."""
+    with _lock:
+        _clients[(service_name, region_name or AWS_REGION, endpoint_url)] = client
+        _issued.add(client)
+
+
+def get_dynamodb_client(region_name: str = None):
+    return get_client("dynamodb", region_name, DYNAMODB_HOST)
+
+
+def use_shared_client(connection) -> None:
+    """Points a PynamoDB Connection at the shared DynamoDB client instead of its own.
+
+    PynamoDB otherwise builds one client, and so one connection pool, per model.
+    It also builds its own in place of one without credentials. Should that
+    happen, it is logged and the shared client is put back.
+    """
+    client = get_dynamodb_client(connection.region)
+    if connection._client is not client:
+        if connection._client is not None and connection._client not in _issued:
+            logger.warning("PynamoDB replaced the shared DynamoDB client of a model connection, restoring it")
+        connection._client = client
+
+
+def warm_clients(table_names: list[str], connections: int = AWS_WARM_CONNECTIONS) -> None:
+    """Creates the shared DynamoDB client and opens pooled connections before traffic arrives.
+
+    Client creation (loading service models, resolving credentials and the
+    endpoint) and each new connection's TLS handshake would otherwise land on
+    the first requests a worker serves. DescribeTable calls are issued
+    concurrently, so up to `connections` connections are opened and left
+    in the pool.
+
+    Args:
+        table_names (list[str]): Tables to describe.
+        connections (int, optional): How many calls to run at once. Defaults to AWS_WARM_CONNECTIONS.
+    """
+    client = get_dynamodb_client()
+    calls = [table_names[i % len(table_names)] for i in range(max(connections, len(table_names)))]
+    with ThreadPoolExecutor(max_workers=max(connections, 1), thread_name_prefix="aws-warmup") as pool:
+        for future in [pool.submit(client.describe_table, TableName=name) for name in calls]:
+            future.result()
+
+
+class SharedClientConnection(Connection):
+    """A PynamoDB Connection that always uses the shared DynamoDB client, e.g. for transactions."""
+
+    @property
+    def client(self):
+        return get_dynamodb_client(self.region)
+
+
+def reset_clients() -> None:
+    """Drops every cached client. Call in a forked child so it opens its own connections."""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from threading import Lock
+import os
+import time
+
+
+URL_CACHE_MAXSIZE = int(os.environ.get("URL_CACHE_MAXSIZE", 10000))
+URL_CACHE_TTL_SECONDS = float(os.environ.get("URL_CACHE_TTL_SECONDS", 300))
+URL_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("URL_CACHE_NEGATIVE_TTL_SECONDS", 5))
+# TTL for keys pinned as hot by service.hotkeys
+URL_CACHE_PINNED_TTL_SECONDS = float(os.environ.get("URL_CACHE_PINNED_TTL_SECONDS", 3600))
+# Seconds past its TTL a URL may still be served while it is refreshed in the background
+URL_CACHE_STALE_SECONDS = float(os.environ.get("URL_CACHE_STALE_SECONDS", 60))
+PRINCIPAL_CACHE_MAXSIZE = int(os.environ.get("PRINCIPAL_CACHE_MAXSIZE", 10000))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", 30))
+
+# Marker stored for keys known not to exist, so repeated 404s skip the database too
+NOT_FOUND = object()
+
+
+class TTLCache:
+    """Bounded least-recently-used cache whose entries expire after a time-to-live.
+
+    Pinned keys are cached for pinned_ttl instead of ttl and are never evicted
+    to make room. Pins are for a handful of hot keys; NOT_FOUND markers keep
+    the negative TTL even when pinned.
+
+    An expired value is kept for stale_ttl more seconds. get treats it as a
+    miss, but get_stale returns it marked stale, so the caller can serve it
+    while it refreshes the key. NOT_FOUND markers are never served stale.
+
+    Args:
+        maxsize (int): The maximum number of entries kept before the least recently used one is evicted.
+        ttl (float): Seconds a cached value stays valid.
+        negative_ttl (float, optional): Seconds a NOT_FOUND marker stays valid. Defaults to ttl.
+        pinned_ttl (float, optional): Seconds a pinned key's value stays valid. Defaults to ttl.
+        stale_ttl (float, optional): Seconds an expired value can still be returned by get_stale. Defaults to 0.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float = None, pinned_ttl: float = None,
+                 stale_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.pinned_ttl = ttl if pinned_ttl is None else pinned_ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, NOT_FOUND for a cached miss, or default."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                if not self._servable_stale(value, expires_at, now):
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key, default=None) -> tuple:
+        """Like get, but also returns a value that expired less than stale_ttl ago.
+
+        Returns:
+            tuple: The cached value, NOT_FOUND or default, and whether the value is stale and should be refreshed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default, False
+            value, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value, False
+            if self._servable_stale(value, expires_at, now):
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return value, True
+            del self._entries[key]
+            self.misses += 1
+            return default, False
+
+    def _servable_stale(self, value, expires_at: float, now: float) -> bool:
+        return value is not NOT_FOUND and now < expires_at + self.stale_ttl
+
+    def set(self, key, value) -> None:
+        """Caches value for key, evicting the least recently used unpinned entry when full."""
+        with self._lock:
+            if value is NOT_FOUND:
+                ttl = self.negative_ttl
+            else:
+                ttl = self.pinned_ttl if key in self._pinned else self.ttl
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            #pinned keys met at the old end are moved to the new end; at most len(_pinned) of them
+            skipped = 0
+            while len(self._entries) > self.maxsize and skipped <= len(self._pinned):
+                oldest, entry = self._entries.popitem(last=False)
+                if oldest in self._pinned:
+                    self._entries[oldest] = entry
+                    skipped += 1
+
+    def pin(self, key) -> None:
+        """Keeps key's value for pinned_ttl and out of eviction, including a value cached already."""
+        with self._lock:
+            self._pinned.add(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not NOT_FOUND:
+                self._entries[key] = (entry[0], time.monotonic() + self.pinned_ttl)
+
+    def unpin(self, key) -> None:
+        """Returns key to normal expiry and eviction. A value cached while pinned expires within ttl."""
+        with self._lock:
+            self._pinned.discard(key)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], min(entry[1], time.monotonic() + self.ttl))
+
+    def pinned(self) -> set:
+        with self._lock:
+            return set(self._pinned)
+
+    def set_missing(self, key) -> None:
+        """Caches that key does not exist for the negative TTL."""
+        self.set(key, NOT_FOUND)
+
+    def invalidate(self, key) -> None:
+        """Drops key from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drops every entry and resets the hit/miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+url_cache = TTLCache(URL_CACHE_MAXSIZE, URL_CACHE_TTL_SECONDS, URL_CACHE_NEGATIVE_TTL_SECONDS, URL_CACHE_PINNED_TTL_SECONDS,
+                     URL_CACHE_STALE_SECONDS)
+# Authenticated users keyed by token subject. Kept short-lived because it holds
+# authorization fields (is_admin, url_limit, url_count).
+principal_cache = TTLCache(PRINCIPAL_CACHE_MAXSIZE, PRINCIPAL_CACHE_TTL_SECONDS)
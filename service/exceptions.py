@@ -8,4 +8,32 @@ class CustomUrlExistsError(Exception):
 
 class AdminPrivilegesRequiredError(Exception):
     """Raised when an action requires admin privileges."""
-    pass
\ No newline at end of file
+    pass
+
+class ShortIdUnavailableError(Exception):
+    """Raised when every generated short ID tried for a URL was already taken."""
+    pass
+
+class QuotaContentionError(Exception):
+    """Raised when a user's URL count keeps changing while quota is being reserved."""
+    pass
+
+class HashingUnavailableError(Exception):
+    """Raised when the password hashing pool is saturated."""
+    pass
+
+class InvalidCursorError(Exception):
+    """Raised when a pagination cursor cannot be decoded."""
+    pass
+
+class SecretUnavailableError(Exception):
+    """Raised when the JWT signing key cannot be loaded."""
+    pass
+
+class SnapshotFormatError(Exception):
+    """Raised when a redirect snapshot file is missing its header or is truncated."""
+    pass
+
+class InvalidStatsRangeError(Exception):
+    """Raised when a stats query asks for an unknown granularity or too long a range."""
+    pass
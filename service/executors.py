@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import os
+
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 16))
+# Threads writing click counters, kept apart from the DB pool so a large flush
+# cannot queue ahead of redirect lookups
+ANALYTICS_POOL_SIZE = int(os.environ.get("ANALYTICS_POOL_SIZE", 2))
+
+# Blocking PynamoDB calls run here instead of on the event loop. bcrypt work has
+# its own process pool in service.hashing.
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="dynamodb")
+analytics_executor = ThreadPoolExecutor(max_workers=ANALYTICS_POOL_SIZE, thread_name_prefix="analytics")
+
+
+async def run_in_executor(executor, func, *args, **kwargs):
+    """Runs a blocking function in the given executor and awaits its result.
+
+    The caller's context variables are copied into the worker thread.
+
+    Args:
+        executor (Executor): The pool to run the function in.
+        func (callable): The blocking function to call.
+
+    Returns:
+        Any: Whatever func returns. Exceptions raised by func are re-raised.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(executor, call)
+
+
+async def run_in_db_pool(func, *args, **kwargs):
+    """Runs a blocking database call in the DynamoDB thread pool."""
+    return await run_in_executor(db_executor, func, *args, **kwargs)
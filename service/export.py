@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+from models.pynamodb_model import UrlEntry
+from pynamodb.exceptions import UpdateError
+from datetime import datetime, timezone
+import csv
+import gzip
+import json
+import os
+import queue
+import threading
+
+
+EXPORT_FIELDS = ["short_url", "original_url", "user_id"]
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_BATCH_SIZE = 500
+EXPORT_QUEUE_DEPTH = 64
+
+_DONE = object()
+
+
+def scan_segment(segment: int, total_segments: int, rows: queue.Queue, rate_limit: float = None, page_size: int = None) -> int:
+    """Scans one segment of the URL table and hands its rows to the writer in batches.
+
+    Args:
+        segment (int): The zero-based segment to scan.
+        total_segments (int): How many segments the table is split into.
+        rows (queue.Queue): Where batches of row dicts are put for the writer.
+        rate_limit (float, optional): Read capacity units per second this segment may consume.
+        page_size (int, optional): Items requested per Scan call.
+
+    Returns:
+        int: The number of rows scanned.
+    """
+    count = 0
+    batch = []
+    for entry in UrlEntry.scan(segment=segment, total_segments=total_segments, rate_limit=rate_limit,
+                               page_size=page_size, attributes_to_get=EXPORT_FIELDS):
+        batch.append({field: getattr(entry, field) for field in EXPORT_FIELDS})
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            rows.put(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        rows.put(batch)
+        count += len(batch)
+    return count
+
+
+def write_rows(path: str, fmt: str, rows: queue.Queue) -> int:
+    """Writes row batches from the queue to a gzip-compressed file until _DONE is received."""
+    written = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as out:
+        writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        while True:
+            batch = rows.get()
+            if batch is _DONE:
+                return written
+            if writer:
+                writer.writerows(batch)
+            else:
+                out.writelines(json.dumps(row) + "\n" for row in batch)
+            written += len(batch)
+
+
+def export_urls(path: str, fmt: str = "ndjson", total_segments: int = 8, max_read_units: float = None, page_size: int = None) -> int:
+    """Exports every URL entry with a parallel segmented scan.
+
+    Each segment is scanned by its own worker thread. One writer thread streams
+    the rows to a gzip-compressed NDJSON or CSV file. The file is written under
+    a temporary name and moved into place once complete.
+
+    Args:
+        path (str): The output file path, e.g. urls.ndjson.gz.
+        fmt (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+        total_segments (int, optional): The number of parallel scan segments. Defaults to 8.
+        max_read_units (float, optional): Total read capacity units per second to consume,
+            shared evenly across segments. Defaults to None for no limit.
+        page_size (int, optional): Items requested per Scan call. Defaults to the DynamoDB maximum.
+
+    Raises:
+        ValueError: If fmt or total_segments is invalid.
+
+    Returns:
+        int: The number of rows exported.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(EXPORT_FORMATS)}.")
+    if total_segments < 1:
+        raise ValueError("total_segments must be at least 1.")
+    rate_limit = max_read_units / total_segments if max_read_units else None
+
+    tmp_path = f"{path}.tmp"
+    rows = queue.Queue(maxsize=EXPORT_QUEUE_DEPTH)
+    writer_result = {}
+
+    def run_writer():
+        try:
+            writer_result["written"] = write_rows(tmp_path, fmt, rows)
+        except Exception as e:
+            writer_result["error"] = e
+            #keep draining so scanners never block on a full queue
+            while rows.get() is not _DONE:
+                pass
+
+    writer = threading.Thread(target=run_writer, name="export-writer")
+    writer.start()
+    try:
+        try:
+            with ThreadPoolExecutor(max_workers=total_segments, thread_name_prefix="export-scan") as pool:
+                futures = [pool.submit(scan_segment, segment, total_segments, rows, rate_limit, page_size)
+                           for segment in range(total_segments)]
+                for future in futures:
+                    future.result()
+        finally:
+            rows.put(_DONE)
+            writer.join()
+        if "error" in writer_result:
+            raise writer_result["error"]
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return writer_result["written"]
+
+
+# Entries created before the user_id/created_at index existed have no created_at
+# and are invisible to it. They are stamped with this fixed time, so they sort
+# as the oldest links.
+BACKFILL_CREATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_segment(segment: int, total_segments: int, rate_limit: float = None) -> int:
+    """Sets created_at on every entry in one scan segment that is missing it."""
+    updated = 0
+    for entry in UrlEntry.scan(UrlEntry.created_at.does_not_exist(), segment=segment, total_segments=total_segments,
+                               rate_limit=rate_limit, attributes_to_get=["short_url"]):
+        try:
+            entry.update(actions=[UrlEntry.created_at.set(BACKFILL_CREATED_AT)],
+                         condition=UrlEntry.short_url.exists() & UrlEntry.created_at.does_not_exist())
+            updated += 1
+        except UpdateError as e:
+            #deleted or already stamped since the scan read it
+            if e.cause_response_code != "ConditionalCheckFailedException":
+                raise
+    return updated
+
+
+def backfill_created_at(total_segments: int = 8, max_read_units: float = None) -> int:
+    """Adds created_at to legacy entries so they appear in the user_id/created_at index.
+
+    Args:
+        total_segments (int, optional): The number of parallel scan segments. Defaults to 8.
+        max_read_units (float, optional): Total read capacity units per second to consume. Defaults to None.
+
+    Returns:
+        int: The number of entries updated.
+    """
+    rate_limit = max_read_units / total_segments if max_read_units else None
+    with ThreadPoolExecutor(max_workers=total_segments, thread_name_prefix="backfill-scan") as pool:
+        futures = [pool.submit(backfill_segment, segment, total_segments, rate_limit) for segment in range(total_segments)]
+        return sum(future.result() for future in futures)
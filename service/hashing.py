@@ -0,0 +1,134 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from service.exceptions import HashingUnavailableError
+from service.tracing import tracer
+from threading import Lock
+import asyncio
+import multiprocessing
+import os
+import time
+
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+HASH_POOL_SIZE = int(os.environ.get("HASH_POOL_SIZE", 2))
+HASH_QUEUE_DEPTH = int(os.environ.get("HASH_QUEUE_DEPTH", 32))
+HASH_LATENCY_SAMPLES = 1024
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+# These run inside the worker processes, so they must stay importable module-level functions.
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """Runs bcrypt in a dedicated process pool with a bounded queue.
+
+    bcrypt is CPU-bound, so running it in request workers competes with every
+    other request for the GIL. The pool limits how many hashes run at once, and
+    at most max_pending calls may be queued or running. Past that, calls fail
+    fast with HashingUnavailableError instead of piling up.
+
+    Args:
+        max_workers (int): The number of worker processes.
+        max_pending (int): The maximum number of queued plus running hash calls.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=HASH_LATENCY_SAMPLES)
+        self._executor = None
+        self._lock = Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        #created lazily so importing this module never starts processes
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def submit(self, func, *args):
+        """Queues func in the process pool.
+
+        Raises:
+            HashingUnavailableError: If max_pending calls are already queued or running.
+
+        Returns:
+            Future: The pending result.
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingUnavailableError("Password hashing is at capacity. Please retry shortly.")
+            self.pending += 1
+            #the span covers queue wait plus the hash itself
+            span = tracer.start_span(f"bcrypt.{func.__name__}", {"hash.queue_depth": self.pending})
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception as e:
+            with self._lock:
+                self.pending -= 1
+            span.record_exception(e)
+            span.end()
+            raise
+
+        def _done(_):
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self._latencies.append(elapsed)
+            span.end()
+
+        future.add_done_callback(_done)
+        return future
+
+    def hash(self, password: str) -> str:
+        return self.submit(hash_password, password).result()
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self.submit(check_password, plain_password, hashed_password).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(hash_password, password))
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self.submit(check_password, plain_password, hashed_password))
+
+    def stats(self) -> dict:
+        """Returns queue depth, throughput counters and recent latency percentiles in seconds."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "queue_depth": self.pending,
+                "max_queue_depth": self.max_pending,
+                "workers": self.max_workers,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+        for name, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            stats[f"latency_{name}"] = latencies[int(quantile * (len(latencies) - 1))] if latencies else None
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(HASH_POOL_SIZE, HASH_QUEUE_DEPTH)
@@ -0,0 +1,179 @@
+from service.cache import url_cache
+from service.metrics import register_stats
+from threading import Lock
+import logging
+import os
+import time
+
+
+HOT_KEY_TRACKING = os.environ.get("HOT_KEY_TRACKING", "true").lower() == "true"
+# Estimated lookups of one key at which it counts as hot. Estimates are halved every
+# window, so a steady r lookups per second settles near 2 * r * window: the defaults
+# pin a key at about 10 lookups per second in one worker.
+HOT_KEY_THRESHOLD = int(os.environ.get("HOT_KEY_THRESHOLD", 200))
+HOT_KEY_WINDOW_SECONDS = float(os.environ.get("HOT_KEY_WINDOW_SECONDS", 10))
+HOT_KEY_MAX = int(os.environ.get("HOT_KEY_MAX", 64))
+# Only one lookup in this many is counted, each standing for all of them. A viral key
+# is looked up far too often to be missed, and the rest pay a counter increment.
+HOT_KEY_SAMPLE_EVERY = int(os.environ.get("HOT_KEY_SAMPLE_EVERY", 8))
+# Counters per sketch row (a power of two) and number of rows
+HOT_KEY_SKETCH_WIDTH = int(os.environ.get("HOT_KEY_SKETCH_WIDTH", 4096))
+HOT_KEY_SKETCH_DEPTH = int(os.environ.get("HOT_KEY_SKETCH_DEPTH", 4))
+
+logger = logging.getLogger("hotkeys")
+
+
+class HotKeyTracker:
+    """Finds the keys looked up most often, in fixed memory.
+
+    Lookups are counted in a count-min sketch: depth rows of width
+    counters, each row indexed by a different slice of the key's hash. A key's
+    estimate is the smallest of its counters, which can only overstate its
+    count, and only by collisions with other keys. Every window the counters
+    are halved, so estimates track recent traffic and a link that stops being
+    viral cools off.
+
+    A key whose estimate reaches threshold joins the hot set, which holds at
+    most max_hot keys; when it is full, a hotter key replaces the coolest. A
+    hot key leaves once its estimate falls below half the threshold, so keys
+    near the line do not flap. on_hot and on_cold are called as keys join and
+    leave.
+
+    Only one lookup in sample_every is counted, with the weight of all of
+    them, which keeps record cheap on the redirect path. Counting takes no
+    lock: a lost increment between threads only makes the estimate slightly
+    low. Changes to the hot set are locked.
+
+    Args:
+        threshold (int): The estimate at which a key becomes hot.
+        window_seconds (float): How often the counters are halved.
+        max_hot (int): The most keys in the hot set.
+        width (int, optional): Counters per row, a power of two. Defaults to HOT_KEY_SKETCH_WIDTH.
+        depth (int, optional): Rows. width's bits times depth must fit in a 64-bit hash. Defaults to HOT_KEY_SKETCH_DEPTH.
+        sample_every (int, optional): Count one lookup in this many. Defaults to 1, every lookup.
+        on_hot (callable, optional): Called with a key when it becomes hot.
+        on_cold (callable, optional): Called with a key when it stops being hot.
+    """
+
+    def __init__(self, threshold: int, window_seconds: float, max_hot: int, width: int = HOT_KEY_SKETCH_WIDTH,
+                 depth: int = HOT_KEY_SKETCH_DEPTH, sample_every: int = 1, on_hot=None, on_cold=None):
+        bits = width.bit_length() - 1
+        if width != 1 << bits or bits * depth > 64:
+            raise ValueError("Sketch width must be a power of two, and its bits times depth at most 64.")
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_hot = max_hot
+        self.width = width
+        self.depth = depth
+        self.sample_every = sample_every
+        self.on_hot = on_hot
+        self.on_cold = on_cold
+        self.promotions = 0
+        self.demotions = 0
+        self._mask = width - 1
+        #(offset of the row in _counts, shift of its hash slice)
+        self._rows = tuple((row * width, row * bits) for row in range(depth))
+        self._counts = [0] * (width * depth)
+        self._skipped = 0
+        self._hot = set()
+        self._window_ends = time.monotonic() + window_seconds
+        self._lock = Lock()
+        self._decay_lock = Lock()
+
+    def record(self, key) -> None:
+        """Counts one lookup of key."""
+        if self.sample_every > 1:
+            self._skipped += 1
+            if self._skipped < self.sample_every:
+                return
+            self._skipped = 0
+        if time.monotonic() >= self._window_ends:
+            self.decay()
+        key_hash = hash(key)
+        mask = self._mask
+        counts = self._counts
+        sampled = None
+        for offset, shift in self._rows:
+            index = offset + ((key_hash >> shift) & mask)
+            count = counts[index] = counts[index] + 1
+            if sampled is None or count < sampled:
+                sampled = count
+        estimate = sampled * self.sample_every
+        if estimate >= self.threshold and key not in self._hot:
+            self._promote(key, estimate)
+
+    def estimate(self, key) -> int:
+        """Returns key's current estimated lookups without counting one."""
+        key_hash = hash(key)
+        sampled = min(self._counts[offset + ((key_hash >> shift) & self._mask)] for offset, shift in self._rows)
+        return sampled * self.sample_every
+
+    def _promote(self, key, estimate: int) -> None:
+        #callbacks run under the lock so pins always match the hot set
+        with self._lock:
+            if key in self._hot:
+                return
+            if len(self._hot) >= self.max_hot:
+                coolest = min(self._hot, key=self.estimate)
+                if self.estimate(coolest) >= estimate:
+                    return
+                self._hot.discard(coolest)
+                self.demotions += 1
+                self._notify(self.on_cold, coolest)
+            self._hot.add(key)
+            self.promotions += 1
+            self._notify(self.on_hot, key)
+        logger.info("Hot key %s, estimated %d lookups", key, estimate)
+
+    def _notify(self, callback, key) -> None:
+        if callback is not None:
+            try:
+                callback(key)
+            except Exception as e:
+                logger.warning("Hot key callback failed for %s: %s", key, e)
+
+    def decay(self) -> None:
+        """Halves every counter and drops hot keys that have cooled below half the threshold."""
+        if not self._decay_lock.acquire(blocking=False):
+            #another thread is already decaying this window
+            return
+        try:
+            self._window_ends = time.monotonic() + self.window_seconds
+            self._counts = [count >> 1 for count in self._counts]
+            with self._lock:
+                cooled = [key for key in self._hot if self.estimate(key) * 2 < self.threshold]
+                self._hot.difference_update(cooled)
+                self.demotions += len(cooled)
+                for key in cooled:
+                    self._notify(self.on_cold, key)
+        finally:
+            self._decay_lock.release()
+
+    def hot_keys(self) -> list[tuple[str, int]]:
+        """Returns the hot keys and their estimates, hottest first."""
+        with self._lock:
+            hot = list(self._hot)
+        return sorted(((key, self.estimate(key)) for key in hot), key=lambda item: -item[1])
+
+    def stats(self) -> dict:
+        """Returns the hot set size and how many keys have joined and left it."""
+        return {
+            "hot_keys": len(self._hot),
+            "max_hot_keys": self.max_hot,
+            "threshold": self.threshold,
+            "promotions": self.promotions,
+            "demotions": self.demotions,
+        }
+
+
+# Hot short URLs are pinned in url_cache: a longer TTL and no eviction, so a viral
+# link is read from DynamoDB once per pinned TTL instead of once per TTL per worker.
+hot_keys = HotKeyTracker(HOT_KEY_THRESHOLD, HOT_KEY_WINDOW_SECONDS, HOT_KEY_MAX, sample_every=HOT_KEY_SAMPLE_EVERY,
+                         on_hot=url_cache.pin, on_cold=url_cache.unpin)
+register_stats("url_hot_keys", "Hot short URL tracking", hot_keys.stats)
+
+
+def record_lookup(short_url: str) -> None:
+    """Counts a lookup of short_url towards hot key detection, if tracking is enabled."""
+    if HOT_KEY_TRACKING:
+        hot_keys.record(short_url)
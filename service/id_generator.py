@@ -0,0 +1,209 @@
+from service.repository import get_repository
+from threading import Lock
+import logging
+import os
+import secrets
+import socket
+import string
+import time
+import zlib
+
+
+BASE62_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+SHORT_ID_ENGINE = os.environ.get("SHORT_ID_ENGINE", "snowflake")
+ID_BLOCK_SIZE = int(os.environ.get("ID_BLOCK_SIZE", 1000))
+ID_COUNTER_NAME = os.environ.get("ID_COUNTER_NAME", "short_url")
+
+# Generated IDs are 59-bit integers, which always fit in the 10 base62 characters
+# of the shortest allowed short URL (62**10 > 2**59).
+ID_BITS = 59
+ID_MASK = (1 << ID_BITS) - 1
+MIN_ENCODED_LENGTH = 10
+# Odd multiplier, so multiplying modulo 2**59 is a bijection. Consecutive IDs
+# come out looking unrelated instead of sequential. This hides ordering but is
+# not a secret.
+SCRAMBLE_MULTIPLIER = 0x1B873593A5C7E2D
+
+logger = logging.getLogger("id_generator")
+
+
+def base62_encode(number: int, length: int) -> str:
+    """Encodes a non-negative integer as a fixed-width base62 string.
+
+    Args:
+        number (int): The integer to encode.
+        length (int): The exact number of characters to produce.
+
+    Raises:
+        ValueError: If number does not fit in length characters.
+
+    Returns:
+        str: The encoded string, left-padded with "0".
+    """
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62_ALPHABET[remainder])
+    if number:
+        raise ValueError(f"Number does not fit in {length} base62 characters.")
+    return "".join(reversed(chars))
+
+
+def scramble(number: int) -> int:
+    return (number * SCRAMBLE_MULTIPLIER) & ID_MASK
+
+
+def format_short_id(number: int, length: int) -> str:
+    """Turns a unique 59-bit integer into a short URL of the requested length.
+
+    The last 10 characters carry the unique integer. Any extra characters asked
+    for (lengths 11-15) are filled with random base62 characters, which only
+    widen the key space.
+    """
+    if length < MIN_ENCODED_LENGTH:
+        raise ValueError(f"Short IDs must be at least {MIN_ENCODED_LENGTH} characters.")
+    prefix = "".join(secrets.choice(BASE62_ALPHABET) for _ in range(length - MIN_ENCODED_LENGTH))
+    return prefix + base62_encode(scramble(number), MIN_ENCODED_LENGTH)
+
+
+class ShortIdGenerator:
+    """Base class for short ID engines. Subclasses implement next_number."""
+
+    def next_number(self) -> int:
+        raise NotImplementedError
+
+    def next_id(self, length: int = MIN_ENCODED_LENGTH) -> str:
+        return format_short_id(self.next_number(), length)
+
+
+class SnowflakeIdGenerator(ShortIdGenerator):
+    """Time-ordered IDs built from a millisecond timestamp, a node ID and a sequence.
+
+    Each process allocates from its own node ID, so several ECS tasks and workers
+    can generate IDs without coordinating. Layout (59 bits): 41 bits of
+    milliseconds since EPOCH_MS, 10 bits of node ID, 8 bits of per-millisecond
+    sequence.
+
+    Args:
+        node_id (int): A value in [0, 1023] that is unique among running processes.
+    """
+
+    EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+    NODE_BITS = 10
+    SEQUENCE_BITS = 8
+    MAX_NODE_ID = (1 << NODE_BITS) - 1
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+    def __init__(self, node_id: int):
+        if not 0 <= node_id <= self.MAX_NODE_ID:
+            raise ValueError(f"Node ID must be between 0 and {self.MAX_NODE_ID}.")
+        self.node_id = node_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = Lock()
+
+    def _now_ms(self) -> int:
+        return int(time.time() * 1000) - self.EPOCH_MS
+
+    def next_number(self) -> int:
+        with self._lock:
+            now = self._now_ms()
+            #never go backwards if the wall clock is adjusted
+            if now < self._last_ms:
+                now = self._last_ms
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & self.MAX_SEQUENCE
+                if self._sequence == 0:
+                    #sequence exhausted for this millisecond; wait for the next one
+                    while now <= self._last_ms:
+                        time.sleep(0.0001)
+                        now = self._now_ms()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (self.NODE_BITS + self.SEQUENCE_BITS)) | (self.node_id << self.SEQUENCE_BITS) | self._sequence
+
+
+class BlockCounterIdGenerator(ShortIdGenerator):
+    """Sequential IDs reserved from a shared counter in blocks.
+
+    One atomic increment of the counter (an ADD on DynamoDB) reserves block_size
+    IDs. The process then hands them out locally, so the counter sees one write
+    per block, not one per short URL.
+
+    Args:
+        block_size (int): How many IDs to reserve per counter update.
+        counter_name (str): The counter item to allocate from.
+    """
+
+    def __init__(self, block_size: int = ID_BLOCK_SIZE, counter_name: str = ID_COUNTER_NAME):
+        self.block_size = block_size
+        self.counter_name = counter_name
+        self._next = 0
+        self._end = 0
+        self._lock = Lock()
+
+    def allocate_block(self) -> tuple[int, int]:
+        """Reserves the next block from the counter table and returns its [start, end) range."""
+        end = get_repository().increment_counter(self.counter_name, self.block_size)
+        return end - self.block_size, end
+
+    def next_number(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self.allocate_block()
+            number = self._next
+            self._next += 1
+            return number
+
+
+def default_node_id() -> int:
+    """Returns NODE_ID if set, otherwise a value derived from the host name and process ID.
+
+    A derived node ID is one of only 1024 values, so a fleet of a few dozen
+    workers is likely to have two sharing one. Those two then generate the
+    same IDs whenever they create a URL in the same millisecond. Every write
+    of a generated short URL is conditional, so a duplicate is never stored;
+    it costs a retry with a new ID. Set NODE_ID in production; under gunicorn
+    each worker offsets it by its slot (see worker_node_id), so give servers
+    NODE_ID values at least one worker count apart.
+    """
+    if "NODE_ID" in os.environ:
+        return int(os.environ["NODE_ID"])
+    node_id = zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode()) & SnowflakeIdGenerator.MAX_NODE_ID
+    logger.warning("NODE_ID is not set, using derived node ID %d, which other workers may share", node_id)
+    return node_id
+
+
+def worker_node_id(base: int, slot: int) -> int:
+    """Returns the node ID of the worker in the given slot of a server whose NODE_ID is base."""
+    return (base + slot) % (SnowflakeIdGenerator.MAX_NODE_ID + 1)
+
+
+ID_GENERATORS = {
+    "snowflake": lambda: SnowflakeIdGenerator(default_node_id()),
+    "block": lambda: BlockCounterIdGenerator(),
+}
+
+_id_generator = None
+_id_generator_lock = Lock()
+
+
+def get_id_generator() -> ShortIdGenerator:
+    """Returns the process-wide generator selected by SHORT_ID_ENGINE."""
+    global _id_generator
+    if _id_generator is None:
+        with _id_generator_lock:
+            if _id_generator is None:
+                if SHORT_ID_ENGINE not in ID_GENERATORS:
+                    raise ValueError(f"Unknown short ID engine: {SHORT_ID_ENGINE}")
+                _id_generator = ID_GENERATORS[SHORT_ID_ENGINE]()
+    return _id_generator
+
+
+def reset_id_generator() -> None:
+    """Drops the process-wide generator. Call in a forked child so it picks its own node ID or ID block."""
+    global _id_generator
+    with _id_generator_lock:
+        _id_generator = None
@@ -0,0 +1,396 @@
+from bisect import bisect_left
+from service.cache import principal_cache, url_cache
+from service.hashing import password_hasher
+from service.singleflight import url_fetches
+from threading import Lock
+import asyncio
+import json
+import os
+import time
+
+
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL_SECONDS", 0.5))
+# Directory where each worker process writes its metrics so a scrape of any one of them
+# reports the whole server. Empty for a single process, which renders only its own.
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+# How often a worker writes its metrics to METRICS_MULTIPROC_DIR
+METRICS_WRITE_INTERVAL_SECONDS = float(os.environ.get("METRICS_WRITE_INTERVAL_SECONDS", 5))
+# Counters and histograms of workers that have exited, kept so totals never go backwards
+ARCHIVE_NAME = "archive"
+
+# Latency buckets in seconds, from a cache hit up to a slow retried AWS call.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing value per label set.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        labelnames (tuple, optional): The label names; inc takes their values in the same order.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def collect(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values: dict = None, labelnames: tuple = None) -> list[str]:
+        values = self.collect() if values is None else values
+        labelnames = labelnames or self.labelnames
+        return [f"{self.name}{format_labels(labelnames, labels)} {value}" for labels, value in values.items()]
+
+
+class Histogram:
+    """Counts observations into fixed buckets per label set.
+
+    observe is a dict lookup, a bisect over the bucket bounds and three additions
+    under a lock, so it costs around a microsecond.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        labelnames (tuple, optional): The label names; observe takes their values in the same order.
+        buckets (tuple, optional): Sorted upper bounds. Defaults to DEFAULT_BUCKETS.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        #per label set: [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *labelvalues) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues) -> int:
+        series = self._values.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def collect(self) -> dict:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._values.items()}
+
+    def render(self, values: dict = None, labelnames: tuple = None) -> list[str]:
+        values = self.collect() if values is None else values
+        labelnames = labelnames or self.labelnames
+        lines = []
+        for labels, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{format_labels(labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(labelnames, labels)} {cumulative}")
+        return lines
+
+
+class GaugeCallback:
+    """A gauge whose values are read from a callback when metrics are rendered.
+
+    Used for state that already lives elsewhere, e.g. cache counters, so the hot
+    path pays nothing for it.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        labelnames (tuple): The label names.
+        callback (callable): Returns a dict mapping label value tuples to numbers.
+        kind (str, optional): The TYPE to report, "gauge" or "counter". Defaults to "gauge".
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, callback, kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self) -> dict:
+        return {labels: value for labels, value in self.callback().items() if value is not None}
+
+    def render(self, values: dict = None, labelnames: tuple = None) -> list[str]:
+        values = self.collect() if values is None else values
+        labelnames = labelnames or self.labelnames
+        return [f"{self.name}{format_labels(labelnames, labels)} {value}" for labels, value in values.items()]
+
+
+def add_values(kind: str, current, value):
+    #a histogram's value is its list of bucket counts and sum
+    if current is None:
+        return value
+    if kind == "histogram":
+        return [a + b for a, b in zip(current, value)]
+    return current + value
+
+
+def merge_values(metric, snapshots: dict) -> tuple[tuple, dict]:
+    """Combines one metric's values from several processes' snapshots.
+
+    Counters and histograms are summed per label set. A gauge cannot be summed
+    meaningfully, so each process's value is kept under an extra worker label.
+
+    Returns:
+        tuple[tuple, dict]: The label names and the merged values.
+    """
+    labelnames = metric.labelnames + (("worker",) if metric.kind == "gauge" else ())
+    values = {}
+    for worker, snapshot in snapshots.items():
+        for labels, value in snapshot.get(metric.name, {}).get("values", []):
+            labels = tuple(labels)
+            if metric.kind == "gauge":
+                values[labels + (worker,)] = value
+            else:
+                values[labels] = add_values(metric.kind, values.get(labels), value)
+    return labelnames, values
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict:
+        """Returns every metric's current values in a form json can store."""
+        return {metric.name: {"kind": metric.kind, "values": [[list(labels), value] for labels, value in metric.collect().items()]}
+                for metric in self._metrics}
+
+    def render(self, snapshots: dict = None) -> str:
+        """Renders this process's metrics, or the merge of snapshots keyed by worker if given."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if snapshots is None:
+                lines.extend(metric.render())
+            else:
+                labelnames, values = merge_values(metric, snapshots)
+                lines.extend(metric.render(values, labelnames))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template.", ("method", "route", "status")))
+dynamodb_request_duration = registry.register(Histogram(
+    "dynamodb_request_duration_seconds", "DynamoDB API call latency, retries included.", ("operation", "table")))
+dynamodb_request_errors = registry.register(Counter(
+    "dynamodb_request_errors_total", "DynamoDB API calls that failed, by error code.", ("operation", "table", "error")))
+event_loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer scheduled every EVENT_LOOP_LAG_INTERVAL_SECONDS."))
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    http_request_duration.observe(seconds, method, route, status)
+
+
+# AWS calls are timed with botocore's own events on the shared clients, so every
+# model operation, batch and transaction is covered in one place.
+def _start_call(params, model, context, **kwargs) -> None:
+    context["metrics_call"] = (model.name, params.get("TableName", ""), time.perf_counter())
+
+
+def _end_call(context, error: str = None) -> None:
+    call = context.pop("metrics_call", None)
+    if call is None:
+        return
+    operation, table, started = call
+    dynamodb_request_duration.observe(time.perf_counter() - started, operation, table)
+    if error:
+        dynamodb_request_errors.inc(operation, table, error)
+
+
+def _after_call(parsed, context, **kwargs) -> None:
+    _end_call(context, parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None)
+
+
+def _after_call_error(exception, context, **kwargs) -> None:
+    _end_call(context, type(exception).__name__)
+
+
+def instrument_client(client) -> None:
+    """Records latency and errors for every DynamoDB API call made with a botocore client."""
+    events = client.meta.events
+    events.register("before-parameter-build.dynamodb", _start_call)
+    events.register("after-call.dynamodb", _after_call)
+    events.register("after-call-error.dynamodb", _after_call_error)
+
+
+def register_cache(name: str, cache) -> None:
+    """Exposes a TTLCache's hit, miss and size counters."""
+    registry.register(GaugeCallback(f"cache_{name}_hits_total", f"Hits on the {name} cache.", (),
+                                    lambda: {(): cache.hits}, kind="counter"))
+    registry.register(GaugeCallback(f"cache_{name}_misses_total", f"Misses on the {name} cache.", (),
+                                    lambda: {(): cache.misses}, kind="counter"))
+    registry.register(GaugeCallback(f"cache_{name}_stale_hits_total", f"Expired values served from the {name} cache while refreshing.", (),
+                                    lambda: {(): cache.stale_hits}, kind="counter"))
+    registry.register(GaugeCallback(f"cache_{name}_hit_ratio", f"Hit ratio of the {name} cache since start.", (),
+                                    lambda: {(): cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else None}))
+    registry.register(GaugeCallback(f"cache_{name}_entries", f"Entries held in the {name} cache.", (),
+                                    lambda: {(): len(cache)}))
+
+
+def register_stats(prefix: str, documentation: str, stats) -> None:
+    """Exposes each numeric field of a stats() dict as a gauge named prefix_field."""
+    for field, value in stats().items():
+        if value is None or isinstance(value, (int, float)):
+            registry.register(GaugeCallback(f"{prefix}_{field}", f"{documentation} ({field}).", (),
+                                            lambda field=field: {(): stats().get(field)}))
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS) -> None:
+    """Sleeps for interval in a loop and records how much later than asked each wake-up came.
+
+    Anything that blocks the loop, e.g. a synchronous DynamoDB or bcrypt call,
+    shows up as lag. Run it as a background task for the life of the app.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - started - interval))
+
+
+
+# Multiprocess mode: gunicorn hands each scrape to whichever worker accepts it, so
+# every worker writes its snapshot to METRICS_MULTIPROC_DIR and a scrape renders
+# the merge of all of them.
+def _snapshot_path(directory: str, name) -> str:
+    return os.path.join(directory, f"{name}.json")
+
+
+def _write_json(path: str, data: dict) -> None:
+    #readers never see a half-written file
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        #the worker exited and its file was archived since the directory was listed
+        return None
+
+
+def write_snapshot(directory: str = None) -> None:
+    """Writes this process's metrics to its file in the multiprocess directory."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_snapshot_path(directory, os.getpid()), registry.snapshot())
+
+
+def read_snapshots(directory: str = None) -> dict:
+    """Returns every snapshot in the multiprocess directory, keyed by worker PID or ARCHIVE_NAME."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    snapshots = {}
+    for filename in os.listdir(directory):
+        if filename.endswith(".json"):
+            snapshot = _read_json(os.path.join(directory, filename))
+            if snapshot is not None:
+                snapshots[filename[:-len(".json")]] = snapshot
+    return snapshots
+
+
+def render_metrics() -> str:
+    """Renders this process's metrics, or every worker's when METRICS_MULTIPROC_DIR is set."""
+    if not METRICS_MULTIPROC_DIR:
+        return registry.render()
+    #this worker's own values are current; the others' are at most METRICS_WRITE_INTERVAL_SECONDS old
+    write_snapshot()
+    return registry.render(read_snapshots())
+
+
+def mark_process_dead(pid: int, directory: str = None) -> None:
+    """Folds an exited worker's counters and histograms into the archive and drops its gauges.
+
+    Call from the gunicorn master when a worker exits, so recycled workers
+    neither pile up files nor make totals go backwards.
+    """
+    directory = directory or METRICS_MULTIPROC_DIR
+    path = _snapshot_path(directory, pid)
+    snapshot = _read_json(path)
+    if snapshot is None:
+        return
+    archive_path = _snapshot_path(directory, ARCHIVE_NAME)
+    archive = _read_json(archive_path) or {}
+    for name, metric in snapshot.items():
+        if metric["kind"] == "gauge":
+            continue
+        merged = {tuple(labels): value for labels, value in archive.get(name, {}).get("values", [])}
+        for labels, value in metric["values"]:
+            merged[tuple(labels)] = add_values(metric["kind"], merged.get(tuple(labels)), value)
+        archive[name] = {"kind": metric["kind"], "values": [[list(labels), value] for labels, value in merged.items()]}
+    _write_json(archive_path, archive)
+    os.remove(path)
+
+
+def clear_snapshots(directory: str = None) -> None:
+    """Creates the multiprocess directory, removing snapshots left over from a previous server."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        if filename.endswith((".json", ".json.tmp")):
+            os.remove(os.path.join(directory, filename))
+
+
+async def write_snapshots_periodically(interval: float = METRICS_WRITE_INTERVAL_SECONDS) -> None:
+    """Writes this worker's snapshot every interval, off the event loop. Run it as a background task."""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(write_snapshot)
+
+
+register_cache("url", url_cache)
+register_cache("principal", principal_cache)
+register_stats("password_hash", "Password hashing pool", password_hasher.stats)
+register_stats("url_fetch", "Coalesced short URL database reads", url_fetches.stats)
@@ -0,0 +1,48 @@
+from service.exceptions import InvalidCursorError
+import base64
+import binascii
+import json
+import os
+
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(last_evaluated_key: dict) -> str:
+    """Turns a DynamoDB LastEvaluatedKey into an opaque URL-safe cursor.
+
+    Args:
+        last_evaluated_key (dict): The key returned by a scan or query, or None.
+
+    Returns:
+        str: The cursor, or None when there are no more pages.
+    """
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Turns a cursor produced by encode_cursor back into an ExclusiveStartKey.
+
+    Args:
+        cursor (str): The cursor from a previous page, or None for the first page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+
+    Returns:
+        dict: The LastEvaluatedKey to resume from, or None.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_evaluated_key = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidCursorError("Invalid cursor.")
+    if not isinstance(last_evaluated_key, dict):
+        raise InvalidCursorError("Invalid cursor.")
+    return last_evaluated_key
@@ -0,0 +1,750 @@
+from models.pynamodb_model import ClickCounterEntry, IdCounterEntry, UrlEntry, UserEntry
+from service.aws_clients import SharedClientConnection
+from service.exceptions import CustomUrlExistsError, InvalidCursorError, UrlLimitReachedError
+from pynamodb.exceptions import PutError, TransactWriteError, UpdateError
+from pynamodb.transactions import TransactWrite
+from bisect import bisect_right
+from datetime import datetime, timezone
+from threading import Lock
+import os
+import sqlite3
+import threading
+
+
+STORAGE_ENGINE = os.environ.get("STORAGE_ENGINE", "dynamodb")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "url_shortener.db")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# TransactWriteItems takes up to 100 items
+TRANSACT_WRITE_CHUNK_SIZE = 100
+# Sorts after every other character, so prefix + BUCKET_MAX closes a prefix range
+BUCKET_MAX = "\U0010ffff"
+
+transaction_connection = SharedClientConnection(region=UrlEntry.Meta.region)
+
+
+def format_timestamp(value: datetime) -> str:
+    #fixed-width UTC text, so string order is time order
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ") if value else ""
+
+
+def parse_timestamp(text: str) -> datetime:
+    return datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc) if text else None
+
+
+class UrlRepository:
+    """Storage for short URLs, users and ID counters. Subclasses implement every method.
+
+    UrlEntry and UserEntry double as the value types every engine accepts and
+    returns, so the service layer is the same whichever engine is selected.
+    Engines other than DynamoDB build fresh instances and never call their
+    persistence methods.
+
+    Paginated methods take and return last_key, an engine-specific dict the
+    service layer turns into an opaque cursor. None means no more pages.
+    """
+
+    def get_original_url(self, short_url: str) -> str:
+        """Returns the original URL for short_url, or None if it does not exist."""
+        raise NotImplementedError
+
+    def get_url(self, short_url: str) -> UrlEntry:
+        """Returns the entry for short_url, owner included, or None if it does not exist."""
+        raise NotImplementedError
+
+    def batch_get_original_urls(self, short_urls: list[str]) -> dict[str, str]:
+        """Returns the original URL of every short URL that exists. Missing ones are left out."""
+        raise NotImplementedError
+
+    def create_url(self, url_entry: UrlEntry, charge_owner: bool = True) -> None:
+        """Stores a new short URL, never overwriting an existing one.
+
+        Args:
+            url_entry (UrlEntry): The entry to store.
+            charge_owner (bool, optional): Also add one to the owner's url_count, in the same
+                atomic step, provided it stays within url_limit. Defaults to True.
+
+        Raises:
+            CustomUrlExistsError: If the short URL is already in use.
+            UrlLimitReachedError: If charge_owner is set and the owner is at their limit.
+        """
+        raise NotImplementedError
+
+    def put_urls(self, url_entries: list[UrlEntry]) -> tuple[set[str], set[str]]:
+        """Stores many new short URLs, never overwriting an existing one. Owners are not charged.
+
+        Returns:
+            tuple[set[str], set[str]]: The short URLs that already existed and were left alone, and
+                those that could not be written for any other reason.
+        """
+        raise NotImplementedError
+
+    def delete_url(self, short_url: str) -> bool:
+        """Deletes a short URL. Returns False if it did not exist."""
+        raise NotImplementedError
+
+    def list_urls(self, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        """Returns up to limit (short_url, original_url) pairs after last_key, and the key to resume from."""
+        raise NotImplementedError
+
+    def iter_urls(self, page_size: int):
+        """Yields every (short_url, original_url) pair, reading page_size at a time."""
+        last_key = None
+        while True:
+            pairs, last_key = self.list_urls(page_size, last_key)
+            yield from pairs
+            if last_key is None:
+                return
+
+    def list_user_urls(self, user_id: str, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        """Returns up to limit of the user's (short_url, original_url) pairs, newest first, and the key to resume from."""
+        raise NotImplementedError
+
+    def iter_user_urls(self, user_id: str):
+        """Yields every (short_url, original_url) pair the user owns."""
+        raise NotImplementedError
+
+    def get_user(self, user_id: str, consistent_read: bool = False) -> UserEntry:
+        """Returns the user, or None if it does not exist.
+
+        consistent_read asks for a read that reflects every write acknowledged
+        before it; engines whose reads are always consistent ignore it.
+        """
+        raise NotImplementedError
+
+    def create_user(self, user: UserEntry) -> None:
+        raise NotImplementedError
+
+    def update_user(self, user: UserEntry, **fields) -> None:
+        """Sets the given attributes on the stored user and on the user object."""
+        raise NotImplementedError
+
+    def add_url_count(self, user_id: str, amount: int, expected_count: int = None) -> bool:
+        """Atomically adds amount (which may be negative) to the user's url_count.
+
+        Args:
+            user_id (str): The user to update.
+            amount (int): What to add.
+            expected_count (int, optional): Only apply the change if url_count still equals this.
+
+        Returns:
+            bool: False if expected_count did not match, otherwise True.
+        """
+        raise NotImplementedError
+
+    def increment_counter(self, name: str, amount: int) -> int:
+        """Atomically adds amount to a named counter, creating it at 0, and returns the new value."""
+        raise NotImplementedError
+
+    def add_click_counts(self, counts: dict[tuple[str, str], int]) -> dict[tuple[str, str], int]:
+        """Atomically adds click counts, creating counters at 0.
+
+        Args:
+            counts (dict): Clicks to add per (short_url, bucket).
+
+        Returns:
+            dict: The counts that could not be added, to retry later.
+        """
+        raise NotImplementedError
+
+    def get_click_counts(self, short_url: str, prefix: str = "", start: str = None, end: str = None,
+                         limit: int = None) -> dict[str, int]:
+        """Returns click counts of short_url's buckets that start with prefix, in bucket order.
+
+        Args:
+            short_url (str): The link whose counters to read.
+            prefix (str, optional): Only buckets starting with this. Defaults to all buckets.
+            start (str, optional): Only buckets from prefix + start on.
+            end (str, optional): Only buckets up to prefix + end, inclusive.
+            limit (int, optional): The most buckets to read.
+
+        Returns:
+            dict[str, int]: Clicks per bucket. Buckets never clicked are absent.
+        """
+        raise NotImplementedError
+
+    def batch_get_click_counts(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        """Returns the click count of each (short_url, bucket) that has one. Missing ones are left out."""
+        raise NotImplementedError
+
+
+class DynamoDBRepository(UrlRepository):
+    """The PynamoDB models on DynamoDB, through the shared client from service.aws_clients."""
+
+    def get_original_url(self, short_url: str) -> str:
+        try:
+            return UrlEntry.get(short_url).original_url
+        except UrlEntry.DoesNotExist:
+            return None
+
+    def get_url(self, short_url: str) -> UrlEntry:
+        try:
+            return UrlEntry.get(short_url)
+        except UrlEntry.DoesNotExist:
+            return None
+
+    def batch_get_original_urls(self, short_urls: list[str]) -> dict[str, str]:
+        return {entry.short_url: entry.original_url
+                for entry in UrlEntry.batch_get(short_urls, attributes_to_get=["short_url", "original_url"])}
+
+    def create_url(self, url_entry: UrlEntry, charge_owner: bool = True) -> None:
+        if not charge_owner:
+            try:
+                url_entry.save(condition=UrlEntry.short_url.does_not_exist())
+            except PutError as e:
+                if e.cause_response_code != "ConditionalCheckFailedException":
+                    raise
+                raise CustomUrlExistsError("This custom URL is already in use.")
+            return
+        owner = UserEntry(url_entry.user_id)
+        try:
+            with TransactWrite(connection=transaction_connection) as transaction:
+                transaction.save(url_entry, condition=UrlEntry.short_url.does_not_exist())
+                transaction.update(owner, actions=[UserEntry.url_count.add(1)], condition=UserEntry.url_count < UserEntry.url_limit)
+        except TransactWriteError as e:
+            #reasons follow the order items are sent in: the put, then the update
+            reasons = e.cancellation_reasons
+            if len(reasons) > 0 and reasons[0] is not None and reasons[0].code == "ConditionalCheckFailed":
+                raise CustomUrlExistsError("This custom URL is already in use.")
+            if len(reasons) > 1 and reasons[1] is not None and reasons[1].code == "ConditionalCheckFailed":
+                raise UrlLimitReachedError("URL limit reached.")
+            raise
+
+    def put_urls(self, url_entries: list[UrlEntry]) -> tuple[set[str], set[str]]:
+        #BatchWriteItem cannot take conditions, so conditional puts go in transactions of up to 100.
+        #One existing short URL cancels its whole transaction, which is then resent without it.
+        taken, failed = set(), set()
+        for start in range(0, len(url_entries), TRANSACT_WRITE_CHUNK_SIZE):
+            pending = url_entries[start:start + TRANSACT_WRITE_CHUNK_SIZE]
+            while pending:
+                try:
+                    with TransactWrite(connection=transaction_connection) as transaction:
+                        for url_entry in pending:
+                            transaction.save(url_entry, condition=UrlEntry.short_url.does_not_exist())
+                    break
+                except TransactWriteError as e:
+                    #reasons follow the order items are sent in
+                    collided = {url_entry.short_url for url_entry, reason in zip(pending, e.cancellation_reasons or [])
+                                if reason is not None and reason.code == "ConditionalCheckFailed"}
+                    if not collided:
+                        failed.update(url_entry.short_url for url_entry in pending)
+                        break
+                    taken.update(collided)
+                    pending = [url_entry for url_entry in pending if url_entry.short_url not in collided]
+        return taken, failed
+
+    def delete_url(self, short_url: str) -> bool:
+        try:
+            UrlEntry.get(short_url).delete()
+            return True
+        except UrlEntry.DoesNotExist:
+            return False
+
+    def list_urls(self, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        check_dynamodb_last_key(last_key, short_url=None)
+        url_entries = UrlEntry.scan(limit=limit, last_evaluated_key=last_key, attributes_to_get=["short_url", "original_url"])
+        pairs = [(entry.short_url, entry.original_url) for entry in url_entries]
+        return pairs, url_entries.last_evaluated_key
+
+    def iter_urls(self, page_size: int):
+        #one scan iterator pages through the table on its own
+        for entry in UrlEntry.scan(page_size=page_size, attributes_to_get=["short_url", "original_url"]):
+            yield entry.short_url, entry.original_url
+
+    def list_user_urls(self, user_id: str, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        #an index key carries the table key too, and must resume this user's query
+        check_dynamodb_last_key(last_key, short_url=None, user_id=user_id, created_at=None)
+        url_entries = UrlEntry.user_id_index.query(user_id, scan_index_forward=False, limit=limit, last_evaluated_key=last_key)
+        pairs = [(entry.short_url, entry.original_url) for entry in url_entries]
+        return pairs, url_entries.last_evaluated_key
+
+    def iter_user_urls(self, user_id: str):
+        for entry in UrlEntry.user_id_index.query(user_id):
+            yield entry.short_url, entry.original_url
+
+    def get_user(self, user_id: str, consistent_read: bool = False) -> UserEntry:
+        try:
+            return UserEntry.get(user_id, consistent_read=consistent_read)
+        except UserEntry.DoesNotExist:
+            return None
+
+    def create_user(self, user: UserEntry) -> None:
+        user.save()
+
+    def update_user(self, user: UserEntry, **fields) -> None:
+        user.update(actions=[getattr(UserEntry, name).set(value) for name, value in fields.items()])
+
+    def add_url_count(self, user_id: str, amount: int, expected_count: int = None) -> bool:
+        condition = UserEntry.url_count == expected_count if expected_count is not None else None
+        try:
+            UserEntry(user_id).update(actions=[UserEntry.url_count.add(amount)], condition=condition)
+            return True
+        except UpdateError as e:
+            if condition is None or e.cause_response_code != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def increment_counter(self, name: str, amount: int) -> int:
+        counter = IdCounterEntry(name)
+        counter.update(actions=[IdCounterEntry.value.add(amount)])
+        return int(counter.value)
+
+    def add_click_counts(self, counts: dict[tuple[str, str], int]) -> dict[tuple[str, str], int]:
+        #DynamoDB has no batch update, so each counter is its own ADD
+        failed = {}
+        for (short_url, bucket), clicks in counts.items():
+            try:
+                ClickCounterEntry(short_url, bucket).update(actions=[ClickCounterEntry.clicks.add(clicks)])
+            except UpdateError:
+                failed[(short_url, bucket)] = clicks
+        return failed
+
+    def get_click_counts(self, short_url: str, prefix: str = "", start: str = None, end: str = None,
+                         limit: int = None) -> dict[str, int]:
+        if start is not None or end is not None:
+            condition = ClickCounterEntry.bucket.between(prefix + (start or ""), prefix + (end if end is not None else BUCKET_MAX))
+        else:
+            condition = ClickCounterEntry.bucket.startswith(prefix) if prefix else None
+        return {entry.bucket: int(entry.clicks) for entry in ClickCounterEntry.query(short_url, condition, limit=limit)}
+
+    def batch_get_click_counts(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        return {(entry.short_url, entry.bucket): int(entry.clicks) for entry in ClickCounterEntry.batch_get(keys)}
+
+
+USER_FIELDS = ("hashed_password", "is_admin", "url_limit", "url_count")
+USER_DEFAULTS = {"is_admin": False, "url_limit": 20, "url_count": 0}
+
+
+def check_last_key(last_key: dict, *fields) -> None:
+    #cursors are opaque to clients, so a key of the wrong shape is their error, not ours
+    if last_key is not None and not all(isinstance(last_key.get(field), str) for field in fields):
+        raise InvalidCursorError("Invalid cursor.")
+
+
+def check_dynamodb_last_key(last_key: dict, **fields) -> None:
+    #DynamoDB rejects an ExclusiveStartKey that is not exactly the key attributes, as a server error.
+    #Each field must be a string attribute value, equal to the given value unless that is None.
+    if last_key is None:
+        return
+    if set(last_key) != set(fields) or not all(
+            isinstance(last_key[field], dict) and list(last_key[field]) == ["S"] and isinstance(last_key[field]["S"], str)
+            and (value is None or last_key[field]["S"] == value) for field, value in fields.items()):
+        raise InvalidCursorError("Invalid cursor.")
+
+
+class InMemoryRepository(UrlRepository):
+    """Plain dicts in process memory, for tests, benchmarks and single-process runs.
+
+    Reads take no lock: a dict lookup is atomic under the GIL and stored rows
+    are immutable tuples. Writes, which check before they change, share one
+    lock. Nothing survives the process.
+    """
+
+    def __init__(self):
+        #short_url -> (original_url, user_id, created_at text)
+        self._urls = {}
+        #user_id -> {short_url: created_at text}
+        self._user_urls = {}
+        #user_id -> dict of USER_FIELDS
+        self._users = {}
+        self._counters = {}
+        #short_url -> {bucket: clicks}
+        self._clicks = {}
+        self._lock = Lock()
+
+    def get_original_url(self, short_url: str) -> str:
+        row = self._urls.get(short_url)
+        return row[0] if row is not None else None
+
+    def get_url(self, short_url: str) -> UrlEntry:
+        row = self._urls.get(short_url)
+        if row is None:
+            return None
+        original_url, user_id, created_at = row
+        return UrlEntry(short_url=short_url, original_url=original_url, user_id=user_id,
+                        created_at=parse_timestamp(created_at))
+
+    def batch_get_original_urls(self, short_urls: list[str]) -> dict[str, str]:
+        urls = self._urls
+        return {short_url: urls[short_url][0] for short_url in short_urls if short_url in urls}
+
+    def _store_url(self, url_entry: UrlEntry) -> None:
+        created_at = format_timestamp(url_entry.created_at)
+        self._urls[url_entry.short_url] = (url_entry.original_url, url_entry.user_id, created_at)
+        self._user_urls.setdefault(url_entry.user_id, {})[url_entry.short_url] = created_at
+
+    def create_url(self, url_entry: UrlEntry, charge_owner: bool = True) -> None:
+        with self._lock:
+            if url_entry.short_url in self._urls:
+                raise CustomUrlExistsError("This custom URL is already in use.")
+            if charge_owner:
+                owner = self._users.get(url_entry.user_id)
+                if owner is None or owner["url_count"] >= owner["url_limit"]:
+                    raise UrlLimitReachedError("URL limit reached.")
+                self._users[url_entry.user_id] = {**owner, "url_count": owner["url_count"] + 1}
+            self._store_url(url_entry)
+
+    def put_urls(self, url_entries: list[UrlEntry]) -> tuple[set[str], set[str]]:
+        taken = set()
+        with self._lock:
+            for url_entry in url_entries:
+                if url_entry.short_url in self._urls:
+                    taken.add(url_entry.short_url)
+                else:
+                    self._store_url(url_entry)
+        return taken, set()
+
+    def delete_url(self, short_url: str) -> bool:
+        with self._lock:
+            row = self._urls.pop(short_url, None)
+            if row is None:
+                return False
+            self._user_urls.get(row[1], {}).pop(short_url, None)
+            return True
+
+    def list_urls(self, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        check_last_key(last_key, "short_url")
+        urls = self._urls
+        keys = sorted(urls)
+        start = bisect_right(keys, last_key["short_url"]) if last_key else 0
+        page = keys[start:start + limit]
+        #rows deleted since keys was taken are skipped
+        pairs = [(short_url, urls[short_url][0]) for short_url in page if short_url in urls]
+        more = start + limit < len(keys)
+        return pairs, {"short_url": page[-1]} if more and page else None
+
+    def _user_order(self, user_id: str) -> list[tuple[str, str]]:
+        #(created_at, short_url), newest first
+        return sorted(((created_at, short_url) for short_url, created_at in list(self._user_urls.get(user_id, {}).items())),
+                      reverse=True)
+
+    def list_user_urls(self, user_id: str, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        check_last_key(last_key, "created_at", "short_url")
+        order = self._user_order(user_id)
+        start = 0
+        if last_key:
+            resume = (last_key["created_at"], last_key["short_url"])
+            while start < len(order) and order[start] >= resume:
+                start += 1
+        page = order[start:start + limit]
+        urls = self._urls
+        pairs = [(short_url, urls[short_url][0]) for _, short_url in page if short_url in urls]
+        if start + limit >= len(order) or not page:
+            return pairs, None
+        return pairs, {"created_at": page[-1][0], "short_url": page[-1][1]}
+
+    def iter_user_urls(self, user_id: str):
+        urls = self._urls
+        for _, short_url in reversed(self._user_order(user_id)):
+            if short_url in urls:
+                yield short_url, urls[short_url][0]
+
+    def get_user(self, user_id: str, consistent_read: bool = False) -> UserEntry:
+        fields = self._users.get(user_id)
+        return UserEntry(user_id=user_id, **fields) if fields is not None else None
+
+    def create_user(self, user: UserEntry) -> None:
+        fields = {**USER_DEFAULTS, **{name: getattr(user, name) for name in USER_FIELDS if getattr(user, name) is not None}}
+        with self._lock:
+            self._users[user.user_id] = fields
+
+    def update_user(self, user: UserEntry, **fields) -> None:
+        with self._lock:
+            stored = self._users.get(user.user_id)
+            if stored is None:
+                raise ValueError("User does not exist.")
+            self._users[user.user_id] = {**stored, **fields}
+        for name, value in fields.items():
+            setattr(user, name, value)
+
+    def add_url_count(self, user_id: str, amount: int, expected_count: int = None) -> bool:
+        with self._lock:
+            stored = self._users.get(user_id)
+            if stored is None:
+                return expected_count is None
+            if expected_count is not None and stored["url_count"] != expected_count:
+                return False
+            self._users[user_id] = {**stored, "url_count": stored["url_count"] + amount}
+            return True
+
+    def increment_counter(self, name: str, amount: int) -> int:
+        with self._lock:
+            value = self._counters[name] = self._counters.get(name, 0) + amount
+            return value
+
+    def add_click_counts(self, counts: dict[tuple[str, str], int]) -> dict[tuple[str, str], int]:
+        with self._lock:
+            for (short_url, bucket), clicks in counts.items():
+                buckets = self._clicks.setdefault(short_url, {})
+                buckets[bucket] = buckets.get(bucket, 0) + clicks
+        return {}
+
+    def get_click_counts(self, short_url: str, prefix: str = "", start: str = None, end: str = None,
+                         limit: int = None) -> dict[str, int]:
+        with self._lock:
+            buckets = dict(self._clicks.get(short_url, {}))
+        low = prefix + (start or "")
+        high = prefix + (end if end is not None else BUCKET_MAX)
+        selected = [(bucket, clicks) for bucket, clicks in sorted(buckets.items())
+                    if bucket.startswith(prefix) and low <= bucket <= high]
+        return dict(selected[:limit])
+
+    def batch_get_click_counts(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        clicks = self._clicks
+        return {(short_url, bucket): clicks[short_url][bucket] for short_url, bucket in keys
+                if bucket in clicks.get(short_url, {})}
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    short_url TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    created_at TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS urls_user_id_created_at ON urls (user_id, created_at, short_url);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    hashed_password TEXT NOT NULL,
+    is_admin INTEGER NOT NULL DEFAULT 0,
+    url_limit INTEGER NOT NULL DEFAULT 20,
+    url_count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS click_counters (
+    short_url TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    clicks INTEGER NOT NULL,
+    PRIMARY KEY (short_url, bucket)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteRepository(UrlRepository):
+    """A single SQLite file in WAL mode, for single-node deployments without DynamoDB.
+
+    Each thread gets its own connection. WAL lets readers run alongside the
+    one writer, and synchronous=NORMAL only syncs at checkpoints, so a commit
+    costs no fsync. An OS crash can lose the last few commits but never
+    corrupts the file. Conditional writes run inside BEGIN IMMEDIATE, which
+    takes the write lock up front, so check-then-write steps are atomic across
+    processes sharing the file.
+
+    Args:
+        path (str): The database file. Created with its tables if missing. Must be a
+            file, not ":memory:", since every thread opens its own connection.
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            #autocommit; multi-statement writes open their own transactions
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, statements):
+        #runs statements(connection) in one immediate transaction and returns its result
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    def close(self) -> None:
+        """Closes this thread's connection."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def get_original_url(self, short_url: str) -> str:
+        row = self._connection().execute("SELECT original_url FROM urls WHERE short_url = ?", (short_url,)).fetchone()
+        return row[0] if row else None
+
+    def get_url(self, short_url: str) -> UrlEntry:
+        row = self._connection().execute("SELECT original_url, user_id, created_at FROM urls WHERE short_url = ?",
+                                         (short_url,)).fetchone()
+        if row is None:
+            return None
+        return UrlEntry(short_url=short_url, original_url=row[0], user_id=row[1],
+                        created_at=parse_timestamp(row[2]))
+
+    def batch_get_original_urls(self, short_urls: list[str]) -> dict[str, str]:
+        resolved = {}
+        connection = self._connection()
+        #stay under SQLite's default limit on bound parameters
+        for start in range(0, len(short_urls), 500):
+            chunk = short_urls[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            resolved.update(connection.execute(
+                f"SELECT short_url, original_url FROM urls WHERE short_url IN ({placeholders})", chunk).fetchall())
+        return resolved
+
+    def create_url(self, url_entry: UrlEntry, charge_owner: bool = True) -> None:
+        row = (url_entry.short_url, url_entry.original_url, url_entry.user_id, format_timestamp(url_entry.created_at))
+
+        def statements(connection):
+            if connection.execute("SELECT 1 FROM urls WHERE short_url = ?", (url_entry.short_url,)).fetchone():
+                raise CustomUrlExistsError("This custom URL is already in use.")
+            if charge_owner:
+                charged = connection.execute("UPDATE users SET url_count = url_count + 1 WHERE user_id = ? AND url_count < url_limit",
+                                             (url_entry.user_id,)).rowcount
+                if not charged:
+                    raise UrlLimitReachedError("URL limit reached.")
+            connection.execute("INSERT INTO urls (short_url, original_url, user_id, created_at) VALUES (?, ?, ?, ?)", row)
+
+        self._write(statements)
+
+    def put_urls(self, url_entries: list[UrlEntry]) -> tuple[set[str], set[str]]:
+        rows = [(url_entry.short_url, url_entry.original_url, url_entry.user_id, format_timestamp(url_entry.created_at))
+                for url_entry in url_entries]
+
+        def statements(connection):
+            #a row that is not inserted already existed
+            return {row[0] for row in rows if not connection.execute(
+                "INSERT INTO urls (short_url, original_url, user_id, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (short_url) DO NOTHING", row).rowcount}
+
+        return self._write(statements), set()
+
+    def delete_url(self, short_url: str) -> bool:
+        return self._connection().execute("DELETE FROM urls WHERE short_url = ?", (short_url,)).rowcount > 0
+
+    def list_urls(self, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        check_last_key(last_key, "short_url")
+        after = last_key["short_url"] if last_key else ""
+        #one extra row tells whether another page follows
+        rows = self._connection().execute("SELECT short_url, original_url FROM urls WHERE short_url > ? ORDER BY short_url LIMIT ?",
+                                          (after, limit + 1)).fetchall()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, {"short_url": rows[-1][0]}
+
+    def list_user_urls(self, user_id: str, limit: int, last_key: dict = None) -> tuple[list[tuple[str, str]], dict]:
+        check_last_key(last_key, "created_at", "short_url")
+        if last_key:
+            rows = self._connection().execute(
+                "SELECT short_url, original_url, created_at FROM urls WHERE user_id = ? AND (created_at, short_url) < (?, ?) "
+                "ORDER BY created_at DESC, short_url DESC LIMIT ?",
+                (user_id, last_key["created_at"], last_key["short_url"], limit + 1)).fetchall()
+        else:
+            rows = self._connection().execute(
+                "SELECT short_url, original_url, created_at FROM urls WHERE user_id = ? "
+                "ORDER BY created_at DESC, short_url DESC LIMIT ?", (user_id, limit + 1)).fetchall()
+        pairs = [(short_url, original_url) for short_url, original_url, _ in rows[:limit]]
+        if len(rows) <= limit:
+            return pairs, None
+        return pairs, {"created_at": rows[limit - 1][2], "short_url": rows[limit - 1][0]}
+
+    def iter_user_urls(self, user_id: str):
+        yield from self._connection().execute(
+            "SELECT short_url, original_url FROM urls WHERE user_id = ? ORDER BY created_at, short_url", (user_id,)).fetchall()
+
+    def get_user(self, user_id: str, consistent_read: bool = False) -> UserEntry:
+        row = self._connection().execute(
+            "SELECT hashed_password, is_admin, url_limit, url_count FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        return UserEntry(user_id=user_id, hashed_password=row[0], is_admin=bool(row[1]), url_limit=row[2], url_count=row[3])
+
+    def create_user(self, user: UserEntry) -> None:
+        fields = {**USER_DEFAULTS, **{name: getattr(user, name) for name in USER_FIELDS if getattr(user, name) is not None}}
+        self._connection().execute(
+            "INSERT OR REPLACE INTO users (user_id, hashed_password, is_admin, url_limit, url_count) VALUES (?, ?, ?, ?, ?)",
+            (user.user_id, fields["hashed_password"], int(fields["is_admin"]), int(fields["url_limit"]), int(fields["url_count"])))
+
+    def update_user(self, user: UserEntry, **fields) -> None:
+        unknown = set(fields) - set(USER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown user attributes: {', '.join(sorted(unknown))}")
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        updated = self._connection().execute(f"UPDATE users SET {assignments} WHERE user_id = ?",
+                                             (*fields.values(), user.user_id)).rowcount
+        if not updated:
+            raise ValueError("User does not exist.")
+        for name, value in fields.items():
+            setattr(user, name, value)
+
+    def add_url_count(self, user_id: str, amount: int, expected_count: int = None) -> bool:
+        if expected_count is None:
+            self._connection().execute("UPDATE users SET url_count = url_count + ? WHERE user_id = ?", (amount, user_id))
+            return True
+        return self._connection().execute("UPDATE users SET url_count = url_count + ? WHERE user_id = ? AND url_count = ?",
+                                          (amount, user_id, int(expected_count))).rowcount > 0
+
+    def increment_counter(self, name: str, amount: int) -> int:
+        return self._connection().execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value "
+            "RETURNING value", (name, amount)).fetchone()[0]
+
+    def add_click_counts(self, counts: dict[tuple[str, str], int]) -> dict[tuple[str, str], int]:
+        rows = [(short_url, bucket, clicks) for (short_url, bucket), clicks in counts.items()]
+        self._write(lambda connection: connection.executemany(
+            "INSERT INTO click_counters (short_url, bucket, clicks) VALUES (?, ?, ?) "
+            "ON CONFLICT (short_url, bucket) DO UPDATE SET clicks = clicks + excluded.clicks", rows))
+        return {}
+
+    def get_click_counts(self, short_url: str, prefix: str = "", start: str = None, end: str = None,
+                         limit: int = None) -> dict[str, int]:
+        #a range on the primary key, so only the selected rows are read
+        low = prefix + (start or "")
+        high = prefix + (end if end is not None else BUCKET_MAX)
+        return dict(self._connection().execute(
+            "SELECT bucket, clicks FROM click_counters WHERE short_url = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket LIMIT ?",
+            (short_url, low, high, -1 if limit is None else limit)).fetchall())
+
+    def batch_get_click_counts(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], int]:
+        connection = self._connection()
+        counts = {}
+        for short_url, bucket in keys:
+            row = connection.execute("SELECT clicks FROM click_counters WHERE short_url = ? AND bucket = ?",
+                                     (short_url, bucket)).fetchone()
+            if row is not None:
+                counts[(short_url, bucket)] = row[0]
+        return counts
+
+
+REPOSITORIES = {
+    "dynamodb": DynamoDBRepository,
+    "memory": InMemoryRepository,
+    "sqlite": SQLiteRepository,
+}
+
+_repository = None
+_repository_lock = Lock()
+
+
+def get_repository() -> UrlRepository:
+    """Returns the process-wide repository selected by STORAGE_ENGINE."""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                if STORAGE_ENGINE not in REPOSITORIES:
+                    raise ValueError(f"Unknown storage engine: {STORAGE_ENGINE}")
+                _repository = REPOSITORIES[STORAGE_ENGINE]()
+    return _repository
+
+
+def set_repository(repository: UrlRepository) -> None:
+    """Replaces the process-wide repository, e.g. with an InMemoryRepository in tests."""
+    global _repository
+    with _repository_lock:
+        _repository = repository
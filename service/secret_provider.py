@@ -0,0 +1,174 @@
+from botocore.exceptions import ClientError
+from service.aws_clients import get_client
+from service.exceptions import SecretUnavailableError
+from threading import Lock
+import json
+import logging
+import os
+import time
+
+
+JWT_SECRET_PROVIDER = os.environ.get("JWT_SECRET_PROVIDER", "aws")
+JWT_SECRET_NAME = os.environ.get("JWT_SECRET_NAME", "url-shortener/jwt_secret")
+JWT_SECRET_REGION = os.environ.get("JWT_SECRET_REGION", "us-east-2")
+JWT_SECRET_REFRESH_SECONDS = float(os.environ.get("JWT_SECRET_REFRESH_SECONDS", 300))
+JWT_SECRET_FIELD = "JWT_SECRET_KEY"
+
+logger = logging.getLogger("secret_provider")
+
+
+class SecretProvider:
+    """Loads the JWT signing keys on first use and caches them for refresh_seconds.
+
+    Keys are returned newest first. During a rotation the previous key is kept
+    alongside the current one, so tokens signed before the rotation still
+    verify. New tokens are always signed with the current key.
+
+    If a refresh fails after keys have been loaded once, the cached keys keep
+    being served and the refresh is retried on the next call.
+
+    Subclasses implement load_keys.
+
+    Args:
+        refresh_seconds (float): How long loaded keys are used before reloading them.
+    """
+
+    def __init__(self, refresh_seconds: float = JWT_SECRET_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._keys = None
+        self._loaded_at = 0.0
+        self._lock = Lock()
+
+    def load_keys(self) -> list[str]:
+        """Returns the current key followed by any previous keys still accepted."""
+        raise NotImplementedError
+
+    def cached_keys(self) -> list[str]:
+        """Returns the cached keys if they are still fresh, otherwise None. Never does I/O."""
+        if self._keys is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return self._keys
+        return None
+
+    def get_keys(self) -> list[str]:
+        """Returns the accepted keys, loading them if the cache is empty or stale.
+
+        Raises:
+            SecretUnavailableError: If the keys have never been loaded and loading fails.
+        """
+        keys = self.cached_keys()
+        if keys is not None:
+            return keys
+        with self._lock:
+            #another thread may have refreshed while we waited
+            keys = self.cached_keys()
+            if keys is not None:
+                return keys
+            try:
+                keys = [key for key in self.load_keys() if key]
+                if not keys:
+                    raise SecretUnavailableError("No JWT secret key is configured.")
+            except Exception as e:
+                if self._keys is None:
+                    if isinstance(e, SecretUnavailableError):
+                        raise
+                    raise SecretUnavailableError(f"Could not load JWT secret: {e}") from e
+                logger.warning("Could not refresh JWT secret, using cached keys", exc_info=True)
+                #retry on the next call instead of waiting a whole refresh interval
+                self._loaded_at = time.monotonic() - self.refresh_seconds + 1
+                return self._keys
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+            return keys
+
+    def current_key(self) -> str:
+        """Returns the key new tokens are signed with."""
+        return self.get_keys()[0]
+
+    def invalidate(self) -> None:
+        """Forces the next call to reload the keys, e.g. right after a rotation."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+class SecretsManagerSecretProvider(SecretProvider):
+    """Reads the JWT key from AWS Secrets Manager.
+
+    The secret is a JSON object with a JWT_SECRET_KEY field. Both the AWSCURRENT
+    and AWSPREVIOUS versions are read, so tokens signed with the previous key
+    stay valid while a rotation is in progress.
+
+    Args:
+        secret_name (str): The secret ID.
+        region_name (str): The region the secret lives in.
+        refresh_seconds (float): How long loaded keys are used before reloading them.
+    """
+
+    def __init__(self, secret_name: str = JWT_SECRET_NAME, region_name: str = JWT_SECRET_REGION,
+                 refresh_seconds: float = JWT_SECRET_REFRESH_SECONDS):
+        super().__init__(refresh_seconds)
+        self.secret_name = secret_name
+        self.region_name = region_name
+
+    def _get_client(self):
+        #looked up on every use, not kept: importing this module never touches AWS, and a
+        #forked worker gets its own client once reset_clients has dropped the master's
+        return get_client("secretsmanager", self.region_name)
+
+    def _get_version(self, version_stage: str) -> str:
+        response = self._get_client().get_secret_value(SecretId=self.secret_name, VersionStage=version_stage)
+        return json.loads(response["SecretString"])[JWT_SECRET_FIELD]
+
+    def load_keys(self) -> list[str]:
+        keys = [self._get_version("AWSCURRENT")]
+        try:
+            previous = self._get_version("AWSPREVIOUS")
+        except ClientError as e:
+            #a secret that has never been rotated has no AWSPREVIOUS version
+            if e.response["Error"]["Code"] != "ResourceNotFoundException":
+                raise
+            previous = None
+        if previous and previous != keys[0]:
+            keys.append(previous)
+        return keys
+
+
+class EnvSecretProvider(SecretProvider):
+    """Reads the JWT key from environment variables or files, for local runs and tests.
+
+    JWT_SECRET_FILE and JWT_PREVIOUS_SECRET_FILE are read first. They suit mounted
+    secrets and are re-read on every refresh, so replacing the file rotates the
+    key. Otherwise JWT_SECRET_KEY and JWT_PREVIOUS_SECRET_KEY are used.
+    """
+
+    def _read(self, file_var: str, key_var: str) -> str:
+        path = os.environ.get(file_var)
+        if path:
+            with open(path) as f:
+                return f.read().strip()
+        return os.environ.get(key_var)
+
+    def load_keys(self) -> list[str]:
+        current = self._read("JWT_SECRET_FILE", "JWT_SECRET_KEY")
+        previous = self._read("JWT_PREVIOUS_SECRET_FILE", "JWT_PREVIOUS_SECRET_KEY")
+        return [current, previous] if previous and previous != current else [current]
+
+
+SECRET_PROVIDERS = {
+    "aws": SecretsManagerSecretProvider,
+    "env": EnvSecretProvider,
+}
+
+_secret_provider = None
+_secret_provider_lock = Lock()
+
+
+def get_secret_provider() -> SecretProvider:
+    """Returns the process-wide provider selected by JWT_SECRET_PROVIDER."""
+    global _secret_provider
+    if _secret_provider is None:
+        with _secret_provider_lock:
+            if _secret_provider is None:
+                if JWT_SECRET_PROVIDER not in SECRET_PROVIDERS:
+                    raise ValueError(f"Unknown JWT secret provider: {JWT_SECRET_PROVIDER}")
+                _secret_provider = SECRET_PROVIDERS[JWT_SECRET_PROVIDER]()
+    return _secret_provider
@@ -0,0 +1,363 @@
+from models.pynamodb_model import UserEntry
+from service.cache import NOT_FOUND, PRINCIPAL_CACHE_TTL_SECONDS, URL_CACHE_NEGATIVE_TTL_SECONDS, TTLCache, principal_cache, url_cache
+from service.metrics import register_stats
+from threading import Lock
+import json
+import logging
+import os
+import time
+
+
+# "none" keeps every cache in-process; "redis" shares a second level across workers and nodes
+SHARED_CACHE_BACKEND = os.environ.get("SHARED_CACHE_BACKEND", "none")
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", "redis://localhost:6379/0")
+# Keys and the invalidation channel are namespaced, so several deployments can share one server
+SHARED_CACHE_PREFIX = os.environ.get("SHARED_CACHE_PREFIX", "url-shortener")
+# A shared cache call slower than this counts as failed; the database is always the fallback
+SHARED_CACHE_TIMEOUT_SECONDS = float(os.environ.get("SHARED_CACHE_TIMEOUT_SECONDS", 0.05))
+# After a failure the shared cache is skipped this long, so an outage costs one timeout per window
+SHARED_CACHE_RETRY_SECONDS = float(os.environ.get("SHARED_CACHE_RETRY_SECONDS", 5))
+# Deletes are published and applied to the shared copy directly, so it can outlive the local one
+SHARED_CACHE_URL_TTL_SECONDS = float(os.environ.get("SHARED_CACHE_URL_TTL_SECONDS", 3600))
+# How long an invalidated key refuses read-through writes. Must outlast the slowest
+# database read, retries included, that could have started before the invalidation.
+SHARED_CACHE_TOMBSTONE_SECONDS = float(os.environ.get("SHARED_CACHE_TOMBSTONE_SECONDS", 60))
+SHARED_CACHE_CHANNEL = f"{SHARED_CACHE_PREFIX}:invalidate"
+
+# Stored for keys known not to exist; no original URL or principal encodes to it
+MISSING_MARKER = ""
+# Stored for invalidated keys; read as a miss, and never overwritten by a read-through
+TOMBSTONE_MARKER = "-"
+
+logger = logging.getLogger("shared_cache")
+
+
+class CacheBackend:
+    """A key-value cache shared by every worker and node, plus a channel to broadcast invalidations on.
+
+    Values are strings. Subclasses implement every method; any of them may
+    raise, and SharedCacheTier treats that as a miss.
+    """
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Returns the value of every key that is cached. Missing ones are left out."""
+        raise NotImplementedError
+
+    def set_many(self, items: dict[str, str], ttl: float, only_new: bool = False) -> None:
+        """Caches every key's value for ttl seconds. With only_new, keys that hold a value are left alone."""
+        raise NotImplementedError
+
+    def publish(self, message: str) -> None:
+        """Sends message to every subscriber on every node, this one included."""
+        raise NotImplementedError
+
+    def subscribe(self, callback) -> None:
+        """Calls callback with every message published from now on, on a background thread if the backend needs one."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Stops listening and closes connections."""
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """A process-local CacheBackend for tests and development.
+
+    Everything sharing one instance behaves like nodes sharing one server:
+    published messages are delivered to every subscriber synchronously.
+    """
+
+    def __init__(self):
+        #key -> (value, expires_at)
+        self._entries = {}
+        self._callbacks = []
+        self._lock = Lock()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        now = time.monotonic()
+        with self._lock:
+            entries = {key: self._entries.get(key) for key in keys}
+        return {key: entry[0] for key, entry in entries.items() if entry is not None and entry[1] > now}
+
+    def set_many(self, items: dict[str, str], ttl: float, only_new: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items.items():
+                entry = self._entries.get(key)
+                if not only_new or entry is None or entry[1] <= now:
+                    self._entries[key] = (value, now + ttl)
+
+    def publish(self, message: str) -> None:
+        for callback in list(self._callbacks):
+            callback(message)
+
+    def subscribe(self, callback) -> None:
+        self._callbacks.append(callback)
+
+
+class RedisCacheBackend(CacheBackend):
+    """A CacheBackend on any server speaking the Redis protocol (Redis, Valkey, ElastiCache).
+
+    Reads are one MGET and writes one pipelined SET ... PX per batch, with NX
+    for read-through writes.
+    Invalidations go over pub/sub, received on a daemon thread. If that
+    connection drops, redis-py reconnects and resubscribes; messages published
+    meanwhile are lost, so a deleted link can live on in another node's local
+    cache until its local TTL runs out.
+
+    Needs the redis package, which is only imported when this backend is selected.
+
+    Args:
+        url (str, optional): The server, e.g. redis://host:6379/0 or rediss:// for TLS. Defaults to SHARED_CACHE_URL.
+        channel (str, optional): The pub/sub channel for invalidations. Defaults to SHARED_CACHE_CHANNEL.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to SHARED_CACHE_TIMEOUT_SECONDS.
+    """
+
+    def __init__(self, url: str = SHARED_CACHE_URL, channel: str = SHARED_CACHE_CHANNEL,
+                 timeout: float = SHARED_CACHE_TIMEOUT_SECONDS):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SHARED_CACHE_BACKEND=redis needs the redis package.") from e
+        self.channel = channel
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout,
+                                            decode_responses=True, health_check_interval=30)
+        self._callbacks = []
+        self._pubsub = None
+        self._listener = None
+        self._lock = Lock()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        return {key: value for key, value in zip(keys, self._client.mget(keys)) if value is not None}
+
+    def set_many(self, items: dict[str, str], ttl: float, only_new: bool = False) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(key, value, px=max(1, int(ttl * 1000)), nx=only_new)
+        pipeline.execute()
+
+    def publish(self, message: str) -> None:
+        self._client.publish(self.channel, message)
+
+    def subscribe(self, callback) -> None:
+        with self._lock:
+            self._callbacks.append(callback)
+            if self._listener is None:
+                self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(**{self.channel: self._dispatch})
+                self._listener = self._pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                            exception_handler=self._listener_failed)
+
+    def _dispatch(self, message: dict) -> None:
+        for callback in list(self._callbacks):
+            callback(message["data"])
+
+    def _listener_failed(self, error, pubsub, thread) -> None:
+        #the next read reconnects and resubscribes; pause so a down server is not hammered
+        logger.warning("Shared cache invalidation listener failed: %s", error)
+        time.sleep(SHARED_CACHE_RETRY_SECONDS)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._pubsub.close()
+                self._listener = None
+        self._client.close()
+
+
+CACHE_BACKENDS = {
+    "memory": InMemoryCacheBackend,
+    "redis": RedisCacheBackend,
+}
+
+_backend = None
+_backend_lock = Lock()
+
+
+def get_cache_backend() -> CacheBackend:
+    """Returns the process-wide backend selected by SHARED_CACHE_BACKEND, or None when it is "none"."""
+    global _backend
+    if _backend is None and SHARED_CACHE_BACKEND != "none":
+        with _backend_lock:
+            if _backend is None:
+                if SHARED_CACHE_BACKEND not in CACHE_BACKENDS:
+                    raise ValueError(f"Unknown shared cache backend: {SHARED_CACHE_BACKEND}")
+                _backend = CACHE_BACKENDS[SHARED_CACHE_BACKEND]()
+    return _backend
+
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """Replaces the process-wide backend, e.g. with an InMemoryCacheBackend in tests. None restores the configured one."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+class SharedCacheTier:
+    """The shared second level behind one in-process TTLCache.
+
+    Lookups check local first, on the event loop; only its misses come here,
+    from the DynamoDB pool, before the database is read. Whatever the database
+    returns is written to both levels, so the next miss on any worker or node
+    is answered without a database read. Misses are shared too, for the local
+    cache's negative TTL.
+
+    invalidate drops the key everywhere: from local, from the shared copy, and,
+    through a published message, from the local cache of every other worker.
+    The shared copy is replaced by a tombstone for tombstone_seconds rather than
+    deleted, and read-through writes only fill keys that hold nothing. A read
+    that started before a delete therefore cannot put the deleted value back
+    for everyone once the delete has gone through.
+
+    Any backend failure is logged and treated as a miss, and the backend is
+    then skipped for retry_seconds. Without a backend every call is a no-op
+    apart from invalidating local.
+
+    Args:
+        namespace (str): Distinguishes these keys and messages from other tiers'.
+        local (TTLCache): The in-process first level.
+        ttl (float): Seconds a value stays in the shared cache.
+        negative_ttl (float, optional): Seconds a known miss stays in the shared cache. Defaults to ttl.
+        encode (callable, optional): Turns a value into a string. Defaults to str.
+        decode (callable, optional): Turns a string back into a value. Defaults to returning it unchanged.
+        backend (CacheBackend, optional): Defaults to get_cache_backend() on every call.
+        retry_seconds (float, optional): Defaults to SHARED_CACHE_RETRY_SECONDS.
+        tombstone_seconds (float, optional): Defaults to SHARED_CACHE_TOMBSTONE_SECONDS.
+    """
+
+    def __init__(self, namespace: str, local: TTLCache, ttl: float, negative_ttl: float = None, encode=str,
+                 decode=None, backend: CacheBackend = None, retry_seconds: float = SHARED_CACHE_RETRY_SECONDS,
+                 tombstone_seconds: float = SHARED_CACHE_TOMBSTONE_SECONDS):
+        self.namespace = namespace
+        self.local = local
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.tombstone_seconds = tombstone_seconds
+        self.encode = encode
+        self.decode = decode
+        self.retry_seconds = retry_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations_received = 0
+        self._backend = backend
+        self._prefix = f"{SHARED_CACHE_PREFIX}:{namespace}:"
+        self._skip_until = 0.0
+
+    def _call(self, method: str, *args):
+        #returns None when there is no backend, it is being skipped, or the call failed
+        if time.monotonic() < self._skip_until:
+            return None
+        try:
+            backend = self._backend or get_cache_backend()
+            if backend is None:
+                return None
+            return getattr(backend, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            self._skip_until = time.monotonic() + self.retry_seconds
+            logger.warning("Shared %s cache %s failed, skipping it for %ss: %s", self.namespace, method, self.retry_seconds, e)
+            return None
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Returns the shared value of every key that is cached, NOT_FOUND for known misses."""
+        if not keys:
+            return {}
+        found = self._call("get_many", [self._prefix + key for key in keys]) or {}
+        result = {}
+        for key in keys:
+            text = found.get(self._prefix + key)
+            if text is None or text == TOMBSTONE_MARKER:
+                continue
+            if text == MISSING_MARKER:
+                result[key] = NOT_FOUND
+            else:
+                result[key] = self.decode(text) if self.decode else text
+        self.hits += len(result)
+        self.misses += len(keys) - len(result)
+        return result
+
+    def get(self, key: str):
+        """Returns the shared value for key, NOT_FOUND for a known miss, or None."""
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: dict) -> None:
+        """Shares every key's value read from the database, unless the key holds something already.
+
+        NOT_FOUND values are shared as misses for negative_ttl. A key invalidated
+        within tombstone_seconds is left alone, since the value may predate the
+        invalidation.
+        """
+        found = {self._prefix + key: self.encode(value) for key, value in items.items() if value is not NOT_FOUND}
+        missing = {self._prefix + key: MISSING_MARKER for key, value in items.items() if value is NOT_FOUND}
+        if found:
+            self._call("set_many", found, self.ttl, True)
+        if missing:
+            self._call("set_many", missing, self.negative_ttl, True)
+
+    def set(self, key: str, value) -> None:
+        self.set_many({key: value})
+
+    def invalidate(self, key: str) -> None:
+        """Drops key from local, from the shared cache and from every other worker's local cache."""
+        self.local.invalidate(key)
+        self._call("set_many", {self._prefix + key: TOMBSTONE_MARKER}, self.tombstone_seconds)
+        self._call("publish", json.dumps([self.namespace, key]))
+
+    def handle_message(self, message: str) -> None:
+        """Applies a published invalidation to local, ignoring other tiers' messages."""
+        try:
+            namespace, key = json.loads(message)
+        except (TypeError, ValueError):
+            logger.warning("Ignoring malformed shared cache message: %r", message)
+            return
+        if namespace == self.namespace:
+            self.invalidations_received += 1
+            self.local.invalidate(key)
+
+    def listen(self) -> None:
+        """Subscribes local to invalidations published by every worker."""
+        backend = self._backend or get_cache_backend()
+        if backend is not None:
+            backend.subscribe(self.handle_message)
+
+    def stats(self) -> dict:
+        """Returns shared hits and misses, backend errors and invalidations received."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "invalidations_received": self.invalidations_received,
+        }
+
+
+def encode_principal(user: UserEntry) -> str:
+    #principals only authorize requests, so the password hash is left out of the shared copy
+    return json.dumps({"user_id": user.user_id, "is_admin": user.is_admin, "url_limit": user.url_limit,
+                       "url_count": user.url_count})
+
+
+def decode_principal(text: str) -> UserEntry:
+    return UserEntry(**json.loads(text))
+
+
+shared_url_cache = SharedCacheTier("url", url_cache, SHARED_CACHE_URL_TTL_SECONDS, URL_CACHE_NEGATIVE_TTL_SECONDS)
+# Shared for no longer than locally, since principals carry is_admin and url_limit
+shared_principal_cache = SharedCacheTier("principal", principal_cache, PRINCIPAL_CACHE_TTL_SECONDS,
+                                         encode=encode_principal, decode=decode_principal)
+SHARED_CACHE_TIERS = (shared_url_cache, shared_principal_cache)
+register_stats("shared_cache_url", "Shared URL cache", shared_url_cache.stats)
+register_stats("shared_cache_principal", "Shared principal cache", shared_principal_cache.stats)
+
+
+def start_invalidation_listener() -> None:
+    """Subscribes every tier's local cache to published invalidations. Call once per worker process."""
+    for tier in SHARED_CACHE_TIERS:
+        tier.listen()
+
+
+def close_cache_backend() -> None:
+    """Closes the process-wide backend, if one was opened."""
+    backend = _backend
+    if backend is not None:
+        backend.close()
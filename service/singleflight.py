@@ -0,0 +1,113 @@
+from threading import Event, Lock
+import asyncio
+
+
+class Flight:
+    #one blocking call in progress; followers wait on done
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one.
+
+    While a call for a key is in flight, further calls for that key do not
+    start their own; they wait for the one in flight and get its result, or
+    its exception. Once it finishes, the next call starts a new one, so
+    results are never cached here.
+
+    Blocking callers on different threads use do. Coroutines use do_async,
+    whose flights are tasks on the running loop; a caller that is cancelled
+    stops waiting without cancelling the flight the others share. Coalescing
+    happens within one process only.
+    """
+
+    def __init__(self):
+        self.flights = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._flights = {}
+        self._tasks = {}
+        self._lock = Lock()
+
+    def do(self, key, func, *args):
+        """Calls func(*args) unless a call for key is already in flight, then returns its result.
+
+        Raises:
+            Exception: Whatever the shared call raised.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.flights += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = func(*args)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def start_async(self, key, func, *args) -> asyncio.Task:
+        """Starts the coroutine func(*args) as key's flight on the running loop, or returns the one in flight.
+
+        The flight runs to completion even if nobody awaits it, which makes this
+        the way to refresh a key in the background.
+        """
+        loop = asyncio.get_running_loop()
+        #flights are per loop; a task cannot be awaited from another one
+        flight_key = (loop, key)
+        task = self._tasks.get(flight_key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = self._tasks[flight_key] = loop.create_task(func(*args))
+        self.flights += 1
+        task.add_done_callback(lambda done: self._finish(flight_key, done))
+        return task
+
+    def _finish(self, flight_key, task: asyncio.Task) -> None:
+        self._tasks.pop(flight_key, None)
+        #retrieving the exception keeps an unawaited background flight from warning at exit
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+
+    async def do_async(self, key, func, *args):
+        """Awaits the coroutine func(*args) unless a call for key is already in flight, then shares its result.
+
+        Raises:
+            Exception: Whatever the shared call raised.
+        """
+        return await asyncio.shield(self.start_async(key, func, *args))
+
+    def in_flight(self, key) -> bool:
+        """Returns whether a blocking call for key is running."""
+        return key in self._flights
+
+    def stats(self) -> dict:
+        """Returns how many calls are in flight, how many were started and how many joined one."""
+        return {
+            "in_flight": len(self._flights) + len(self._tasks),
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
+
+
+# Database reads of short URLs that missed url_cache or went stale, keyed by short URL
+url_fetches = SingleFlight()
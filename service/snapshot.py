@@ -0,0 +1,219 @@
+from service.exceptions import SnapshotFormatError
+from threading import Lock
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+
+REDIRECT_SNAPSHOT_PATH = os.environ.get("REDIRECT_SNAPSHOT_PATH")
+REDIRECT_SNAPSHOT_RELOAD_SECONDS = float(os.environ.get("REDIRECT_SNAPSHOT_RELOAD_SECONDS", 5))
+# When false, a short URL missing from the snapshot is a 404 without asking the database
+REDIRECT_SNAPSHOT_FALLBACK = os.environ.get("REDIRECT_SNAPSHOT_FALLBACK", "true").lower() == "true"
+
+logger = logging.getLogger("snapshot")
+
+# File layout, little-endian:
+#   header   64 bytes: magic, version, record count, slot count, index offset, records offset
+#   index    one 12-byte slot per bucket: crc32 of the key, record offset (0 = empty)
+#   records  sorted by short URL: key length (u16), value length (u32), key, value, both UTF-8
+# The index is open-addressed with linear probing at a load factor of at most 0.5.
+MAGIC = b"URLSNAP1"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQQQ")
+HEADER_SIZE = 64
+SLOT = struct.Struct("<IQ")
+RECORD = struct.Struct("<HI")
+
+
+def slot_count(count: int) -> int:
+    #smallest power of two at least twice the record count, so probes stay short
+    slots = 1
+    while slots < count * 2:
+        slots *= 2
+    return slots
+
+
+def build_snapshot(path: str, pairs) -> int:
+    """Writes short-original URL pairs to a snapshot file, replacing any existing one atomically.
+
+    The file is written next to path and renamed over it, so a resolver never
+    sees a partial file.
+
+    Args:
+        path (str): Where to write the snapshot.
+        pairs (iterable[tuple[str, str]]): Short URLs and their original URLs.
+
+    Returns:
+        int: The number of records written.
+    """
+    records = sorted((short_url.encode(), original_url.encode()) for short_url, original_url in dict(pairs).items())
+    slots = slot_count(len(records))
+    index_offset = HEADER_SIZE
+    records_offset = index_offset + slots * SLOT.size
+    index = bytearray(slots * SLOT.size)
+    mask = slots - 1
+    offset = records_offset
+    for key, value in records:
+        key_hash = zlib.crc32(key)
+        i = key_hash & mask
+        while SLOT.unpack_from(index, i * SLOT.size)[1]:
+            i = (i + 1) & mask
+        SLOT.pack_into(index, i * SLOT.size, key_hash, offset)
+        offset += RECORD.size + len(key) + len(value)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, len(records), slots, index_offset, records_offset).ljust(HEADER_SIZE, b"\0"))
+            out.write(index)
+            for key, value in records:
+                out.write(RECORD.pack(len(key), len(value)))
+                out.write(key)
+                out.write(value)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(records)
+
+
+class RedirectSnapshot:
+    """A read-only, memory-mapped snapshot of short URL to original URL mappings.
+
+    The file is mapped, not read, so every worker process on a host shares one
+    copy in the page cache and a worker's memory does not grow with the number
+    of links. A lookup hashes the key, probes the index and decodes the one
+    matching value. Nothing else is loaded into Python objects.
+
+    Args:
+        path (str): A file written by build_snapshot.
+
+    Raises:
+        SnapshotFormatError: If the file is not a snapshot this version can read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        if len(self._mm) < HEADER_SIZE:
+            raise SnapshotFormatError(f"{path} is too short to be a redirect snapshot.")
+        magic, version, self.count, slots, self._index_offset, self._records_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotFormatError(f"{path} is not a version {VERSION} redirect snapshot.")
+        if self._records_offset != self._index_offset + slots * SLOT.size or self._records_offset > len(self._mm):
+            raise SnapshotFormatError(f"{path} is truncated.")
+        self._mask = slots - 1
+
+    def get(self, short_url: str) -> str:
+        """Returns the original URL for short_url, or None if the snapshot does not have it."""
+        key = short_url.encode()
+        key_hash = zlib.crc32(key)
+        mm = self._mm
+        index_offset = self._index_offset
+        mask = self._mask
+        i = key_hash & mask
+        while True:
+            slot_hash, offset = SLOT.unpack_from(mm, index_offset + i * SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == key_hash:
+                key_length, value_length = RECORD.unpack_from(mm, offset)
+                start = offset + RECORD.size
+                if key_length == len(key) and mm[start:start + key_length] == key:
+                    start += key_length
+                    return mm[start:start + value_length].decode()
+            i = (i + 1) & mask
+
+    def __iter__(self):
+        """Yields every (short_url, original_url) pair in short URL order."""
+        mm = self._mm
+        offset = self._records_offset
+        for _ in range(self.count):
+            key_length, value_length = RECORD.unpack_from(mm, offset)
+            start = offset + RECORD.size
+            yield mm[start:start + key_length].decode(), mm[start + key_length:start + key_length + value_length].decode()
+            offset = start + key_length + value_length
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class SnapshotResolver:
+    """Serves lookups from the snapshot at path and swaps in a replaced file.
+
+    At most every reload_seconds, a lookup stats the path. If the file was
+    replaced (build_snapshot renames a new file over it), the new file is
+    mapped and swapped in with one reference assignment, so lookups in flight
+    finish on the old mapping and later ones see only the new one. The old
+    mapping is released when its last reader is done.
+
+    Args:
+        path (str): The snapshot file.
+        reload_seconds (float, optional): How often to check for a new file.
+    """
+
+    def __init__(self, path: str, reload_seconds: float = REDIRECT_SNAPSHOT_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._snapshot = None
+        self._checked_at = float("-inf")
+        self._lock = Lock()
+
+    def current(self) -> RedirectSnapshot:
+        """Returns the snapshot to serve from, or None if the file is missing or unreadable."""
+        if time.monotonic() - self._checked_at >= self.reload_seconds:
+            self.reload()
+        return self._snapshot
+
+    def reload(self) -> bool:
+        """Maps the file again if it changed. Returns True if a new snapshot was swapped in."""
+        if not self._lock.acquire(blocking=False):
+            #another thread is already checking
+            return False
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            current = self._snapshot
+            if current is not None and current.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                return False
+            try:
+                snapshot = RedirectSnapshot(self.path)
+            except (OSError, SnapshotFormatError) as e:
+                #keep serving the previous snapshot rather than nothing
+                logger.warning("Could not load redirect snapshot %s: %s", self.path, e)
+                return False
+            self._snapshot = snapshot
+            logger.info("Loaded redirect snapshot %s with %d URLs", self.path, len(snapshot))
+            return True
+        finally:
+            self._lock.release()
+
+    def get(self, short_url: str) -> str:
+        snapshot = self.current()
+        return snapshot.get(short_url) if snapshot is not None else None
+
+
+_resolver = SnapshotResolver(REDIRECT_SNAPSHOT_PATH) if REDIRECT_SNAPSHOT_PATH else None
+
+
+def get_snapshot_resolver() -> SnapshotResolver:
+    """Returns the resolver for REDIRECT_SNAPSHOT_PATH, or None when snapshot mode is off."""
+    return _resolver
+
+
+def set_snapshot_resolver(resolver: SnapshotResolver) -> None:
+    global _resolver
+    _resolver = resolver
@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta, timezone
+from models.pynamodb_model import UserEntry
+from service.analytics import PERIOD_FORMATS, TOTAL_BUCKET, period_bucket
+from service.exceptions import InvalidStatsRangeError
+from service.executors import run_in_db_pool
+from service.repository import get_repository
+from service.tracing import traced
+import os
+
+
+# The most points one stats query may return, so every query reads a bounded number of rows
+STATS_MAX_POINTS = int(os.environ.get("STATS_MAX_POINTS", 1000))
+# Referrer and user agent buckets read per link. Analytics keeps at most
+# ANALYTICS_MAX_REFERRERS referrer counters per link, and agent families are a
+# fixed handful, so this only guards against rows written before that limit.
+STATS_MAX_BREAKDOWN_ROWS = int(os.environ.get("STATS_MAX_BREAKDOWN_ROWS", 200))
+TOP_URLS_MAX = 100
+# The top links view ranks this many of the user's newest links
+TOP_URLS_CANDIDATES = int(os.environ.get("TOP_URLS_CANDIDATES", 1000))
+
+GRANULARITIES = tuple(PERIOD_FORMATS)
+# Points shown when no start is given
+DEFAULT_POINTS = {"minute": 60, "hour": 24, "day": 30, "month": 12}
+# Fixed-length periods; months are stepped by calendar
+PERIOD_STEPS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Which counter the top links view ranks by
+TOP_PERIODS = ("all", "month", "day", "hour")
+
+
+def as_utc(moment: datetime) -> datetime:
+    #naive datetimes from the query string are taken to be UTC
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    """Returns the start of the period of the given granularity that contains moment, in UTC."""
+    moment = as_utc(moment)
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_period(moment: datetime, granularity: str) -> datetime:
+    """Returns the start of the period after the one starting at moment."""
+    if granularity == "month":
+        return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1)
+    return moment + PERIOD_STEPS[granularity]
+
+
+def period_count(first: datetime, last: datetime, granularity: str) -> int:
+    """Returns how many periods there are from the one starting at first to the one starting at last."""
+    if granularity == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first) // PERIOD_STEPS[granularity] + 1
+
+
+def periods(start: datetime, end: datetime, granularity: str) -> list[datetime]:
+    """Returns the start of every period from the one containing start to the one containing end."""
+    current = truncate(start, granularity)
+    last = truncate(end, granularity)
+    result = []
+    while current <= last:
+        result.append(current)
+        current = next_period(current, granularity)
+    return result
+
+
+def default_start(end: datetime, granularity: str) -> datetime:
+    start = truncate(end, granularity)
+    for _ in range(DEFAULT_POINTS[granularity] - 1):
+        #step back one period at a time; months have no fixed length
+        start = truncate(start - timedelta(microseconds=1), granularity)
+    return start
+
+
+@traced()
+def get_link_stats(short_url: str, user: UserEntry, granularity: str = "day", start: datetime = None,
+                   end: datetime = None) -> dict:
+    """Returns click statistics for one short URL, read from the pre-aggregated counters.
+
+    The time series is read from the rollup of the requested granularity, so
+    the query reads at most one row per point however many clicks the link
+    has. Periods without clicks are returned as zero. Referrers are the hosts
+    that got their own counter, most clicked first; clicks from hosts past
+    analytics' per-link limit are reported under "other".
+
+    Args:
+        short_url (str): The link to report on.
+        user (UserEntry): The caller. Must own the link or be an admin.
+        granularity (str, optional): "minute", "hour", "day" or "month". Defaults to "day".
+        start (datetime, optional): The first moment to include. Defaults to DEFAULT_POINTS periods before end.
+        end (datetime, optional): The last moment to include. Defaults to now.
+
+    Raises:
+        ValueError: If the short URL does not exist or belongs to someone else.
+        InvalidStatsRangeError: If the range is reversed or spans more than STATS_MAX_POINTS periods.
+
+    Returns:
+        dict: The link's all-time total, the series of {"period", "clicks"} points, the total over
+            the series, and clicks by referrer host and by user agent family.
+    """
+    if granularity not in PERIOD_FORMATS:
+        raise InvalidStatsRangeError(f"Granularity must be one of: {', '.join(GRANULARITIES)}.")
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else default_start(end, granularity)
+    if start > end:
+        raise InvalidStatsRangeError("start must not be after end.")
+    #checked before any period is built, so an absurd range costs nothing
+    first, last = truncate(start, granularity), truncate(end, granularity)
+    if period_count(first, last, granularity) > STATS_MAX_POINTS:
+        raise InvalidStatsRangeError(f"The range spans more than {STATS_MAX_POINTS} {granularity}s.")
+
+    repository = get_repository()
+    url_entry = repository.get_url(short_url)
+    if url_entry is None or (url_entry.user_id != user.user_id and not user.is_admin):
+        raise ValueError("Short URL not found")
+
+    prefix = f"{granularity}#"
+    form = PERIOD_FORMATS[granularity]
+    counts = repository.get_click_counts(short_url, prefix, first.strftime(form), last.strftime(form))
+    series = []
+    for moment in periods(first, last, granularity):
+        label = moment.strftime(form)
+        series.append({"period": label, "clicks": counts.get(prefix + label, 0)})
+    referrers = repository.get_click_counts(short_url, "referrer#", limit=STATS_MAX_BREAKDOWN_ROWS)
+    agents = repository.get_click_counts(short_url, "agent#", limit=STATS_MAX_BREAKDOWN_ROWS)
+    total = repository.batch_get_click_counts([(short_url, TOTAL_BUCKET)]).get((short_url, TOTAL_BUCKET), 0)
+    return {
+        "short_url": short_url,
+        "granularity": granularity,
+        "start": first,
+        "end": last,
+        "total_clicks": total,
+        "range_clicks": sum(point["clicks"] for point in series),
+        "series": series,
+        "referrers": {bucket.split("#", 1)[1]: clicks for bucket, clicks in sorted(referrers.items(), key=lambda item: -item[1])},
+        "agents": {bucket.split("#", 1)[1]: clicks for bucket, clicks in sorted(agents.items(), key=lambda item: -item[1])},
+    }
+
+
+@traced()
+def get_top_urls(username: str, limit: int = 10, period: str = "all") -> list[dict]:
+    """Returns the user's most clicked links, most clicked first.
+
+    The candidates are the user's TOP_URLS_CANDIDATES newest links, one bounded
+    read of the user_id/created_at index, and each one's count is a counter row
+    read in a batch. The cost does not grow with the user's link count or
+    clicks. Older links than that, and links created before created_at was
+    recorded that have not been backfilled (see service.export.backfill_created_at),
+    are not in the ranking.
+
+    Args:
+        username (str): The user whose links to rank.
+        limit (int, optional): How many links to return. Defaults to 10.
+        period (str, optional): Rank by clicks "all" time, or in the current "month", "day" or "hour".
+            Defaults to "all".
+
+    Raises:
+        InvalidStatsRangeError: If period is not one of TOP_PERIODS.
+
+    Returns:
+        list[dict]: Up to limit {"short_url", "original_url", "clicks"} entries.
+    """
+    if period not in TOP_PERIODS:
+        raise InvalidStatsRangeError(f"Period must be one of: {', '.join(TOP_PERIODS)}.")
+    bucket = TOTAL_BUCKET if period == "all" else period_bucket(period, datetime.now(timezone.utc))
+    repository = get_repository()
+    links = dict(repository.list_user_urls(username, TOP_URLS_CANDIDATES)[0])
+    counts = repository.batch_get_click_counts([(short_url, bucket) for short_url in links])
+    ranked = sorted(links.items(), key=lambda pair: (-counts.get((pair[0], bucket), 0), pair[0]))
+    return [{"short_url": short_url, "original_url": original_url, "clicks": counts.get((short_url, bucket), 0)}
+            for short_url, original_url in ranked[:limit]]
+
+
+async def get_link_stats_async(short_url: str, user: UserEntry, granularity: str = "day", start: datetime = None,
+                               end: datetime = None) -> dict:
+    return await run_in_db_pool(get_link_stats, short_url, user, granularity, start, end)
+
+
+async def get_top_urls_async(username: str, limit: int = 10, period: str = "all") -> list[dict]:
+    return await run_in_db_pool(get_top_urls, username, limit, period)
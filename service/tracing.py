@@ -0,0 +1,286 @@
+from contextlib import contextmanager
+from threading import Lock
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import time
+
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "log")
+TRACING_MAX_SPANS = int(os.environ.get("TRACING_MAX_SPANS", 10000))
+
+logger = logging.getLogger("tracing")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation in a trace.
+
+    Method names follow the OpenTelemetry Span API (set_attribute, set_status,
+    record_exception, update_name, end), so call sites carry over if the
+    OpenTelemetry SDK replaces this module.
+
+    Args:
+        name (str): What the span measures, e.g. "url_service.generate_short_url".
+        trace_id (str): 32 hex characters shared by every span in the trace.
+        parent_id (str, optional): The span_id of the parent, or None for a root span.
+        attributes (dict, optional): Initial attributes.
+    """
+
+    def __init__(self, tracer, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "UNSET"
+        self.events = []
+        self.start_time = time.time_ns()
+        self.end_time = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def update_name(self, name: str) -> None:
+        self.name = name
+
+    def set_status(self, status: str, description: str = None) -> None:
+        self.status = status
+        if description:
+            self.attributes["status.description"] = description
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.events.append({"name": "exception", "time": time.time_ns(),
+                            "exception.type": type(exception).__name__, "exception.message": str(exception)})
+
+    def end(self) -> None:
+        if self.end_time is None:
+            self.end_time = time.time_ns()
+            self._tracer.exporter.export([self])
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e6
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start_time": self.start_time, "duration_ms": round(self.duration_ms, 3), "status": self.status,
+                "attributes": self.attributes, "events": self.events}
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in memory, for tests. Holds at most max_spans, oldest dropped first."""
+
+    def __init__(self, max_spans: int = TRACING_MAX_SPANS):
+        self.max_spans = max_spans
+        self._spans = []
+        self._lock = Lock()
+
+    def export(self, spans: list) -> None:
+        with self._lock:
+            self._spans.extend(spans)
+            del self._spans[:-self.max_spans]
+
+    def get_finished_spans(self) -> list:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class LogSpanExporter:
+    """Writes each finished span as one JSON log line on the "tracing" logger."""
+
+    def export(self, spans: list) -> None:
+        for span in spans:
+            logger.info(json.dumps(span.to_dict(), default=str))
+
+
+SPAN_EXPORTERS = {
+    "log": LogSpanExporter,
+    "memory": InMemorySpanExporter,
+}
+
+
+class _NoopSpan:
+    #stands in for a span when tracing is off, so call sites need no checks
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value): pass
+    def update_name(self, name): pass
+    def set_status(self, status, description=None): pass
+    def record_exception(self, exception): pass
+    def end(self): pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Creates spans and tracks the current one per request through a context variable.
+
+    When disabled every call returns NOOP_SPAN, so instrumented code costs a
+    flag check.
+
+    Args:
+        enabled (bool): Whether spans are recorded.
+        exporter: Receives finished spans through export(spans).
+    """
+
+    def __init__(self, enabled: bool, exporter):
+        self.enabled = enabled
+        self.exporter = exporter
+
+    def start_span(self, name: str, attributes: dict = None, trace_id: str = None, parent_id: str = None):
+        """Starts a child of the current span without making it current. The caller must end() it.
+
+        Args:
+            name (str): The span name.
+            attributes (dict, optional): Initial attributes.
+            trace_id (str, optional): With no current span, continues a trace started elsewhere,
+                e.g. from a traceparent header.
+            parent_id (str, optional): The remote parent span_id that goes with trace_id.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+        if trace_id:
+            return Span(self, name, trace_id, parent_id, attributes)
+        return Span(self, name, secrets.token_hex(16), None, attributes)
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: dict = None, trace_id: str = None, parent_id: str = None):
+        """Runs the with-block inside a new span that is current for its duration.
+
+        Exceptions are recorded on the span, which is marked ERROR, and re-raised.
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        span = self.start_span(name, attributes, trace_id, parent_id)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            span.set_status("ERROR", str(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+
+tracer = Tracer(TRACING_ENABLED, SPAN_EXPORTERS.get(TRACING_EXPORTER, LogSpanExporter)())
+
+
+def get_current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: str = None):
+    """Decorates a sync or async function so each call runs in its own span.
+
+    Args:
+        name (str, optional): The span name. Defaults to module.function.
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.start_as_current_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.start_as_current_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_traceparent(header: str) -> tuple[str, str]:
+    """Returns (trace_id, parent_span_id) from a W3C traceparent header, or (None, None)."""
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None, None
+    return parts[1], parts[2]
+
+
+# Every log record gets trace_id and span_id attributes, empty outside a span,
+# so a format string can include them for any logger, uvicorn's included.
+_base_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs):
+    record = _base_record_factory(*args, **kwargs)
+    span = _current_span.get()
+    record.trace_id = span.trace_id if span is not None else ""
+    record.span_id = span.span_id if span is not None else ""
+    return record
+
+
+logging.setLogRecordFactory(_record_factory)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s trace_id=%(trace_id)s span_id=%(span_id)s %(message)s"
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Sends application logs to stderr with the current trace and span IDs on every line."""
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+# DynamoDB calls get a span each from botocore's events on the shared client,
+# the same hook points the latency metrics use.
+def _start_call(params, model, context, **kwargs) -> None:
+    if tracer.enabled:
+        context["tracing_span"] = tracer.start_span(f"dynamodb.{model.name}",
+                                                    {"db.system": "dynamodb", "db.operation": model.name,
+                                                     "aws.dynamodb.table_names": params.get("TableName", "")})
+
+
+def _after_call(parsed, context, **kwargs) -> None:
+    span = context.pop("tracing_span", None)
+    if span is not None:
+        error = parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None
+        if error:
+            span.set_status("ERROR", error)
+        span.end()
+
+
+def _after_call_error(exception, context, **kwargs) -> None:
+    span = context.pop("tracing_span", None)
+    if span is not None:
+        span.record_exception(exception)
+        span.set_status("ERROR", str(exception))
+        span.end()
+
+
+def instrument_client(client) -> None:
+    """Adds a span for every DynamoDB API call made with a botocore client."""
+    events = client.meta.events
+    events.register("before-parameter-build.dynamodb", _start_call)
+    events.register("after-call.dynamodb", _after_call)
+    events.register("after-call-error.dynamodb", _after_call_error)
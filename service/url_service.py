@@ -2,9 +2,30 @@ from models.pynamodb_model import UrlEntry, UserEntry
 from service.utils import *
 from pydantic import HttpUrl, ValidationError
 from service.exceptions import *
-import uuid
+from service.cache import url_cache, principal_cache, NOT_FOUND
+from service.executors import db_executor, run_in_db_pool
+from service.hotkeys import record_lookup
+from service.id_generator import get_id_generator
+from service.pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+from service.repository import get_repository
+from service.shared_cache import shared_principal_cache, shared_url_cache
+from service.singleflight import url_fetches
+from service.snapshot import REDIRECT_SNAPSHOT_FALLBACK, get_snapshot_resolver
+from service.tracing import traced
+import asyncio
+import random
+import time
 
 
+BATCH_GET_CHUNK_SIZE = 100
+QUOTA_RESERVE_ATTEMPTS = 5
+# Upper bound of the first jittered pause between quota attempts; it doubles after each attempt
+QUOTA_RESERVE_BACKOFF_SECONDS = 0.01
+# How many generated IDs a URL may try before giving up because each one is already taken
+GENERATED_ID_ATTEMPTS = 5
+
+
+@traced()
 def generate_short_url(url: str, username: str, custom_url: str = None, short_id_length: int = 10) -> str:
     """Generates a short URL for a given original URL.
 
@@ -15,9 +36,10 @@ def generate_short_url(url: str, username: str, custom_url: str = None, short_id
         short_id_length (int, optional): The length of the generated short URL if not using a custom URL. Defaults to 10.
 
     Raises:
-        ValueError: If the user's URL limit is reached.
-        ValueError: If the custom URL already exists in the database.
-        ValueError: If the provided URL format is invalid or there is an error generating a unique ID.
+        UrlLimitReachedError: If the user's URL limit is reached.
+        CustomUrlExistsError: If the custom URL already exists in the database.
+        ShortIdUnavailableError: If GENERATED_ID_ATTEMPTS generated IDs in a row were already taken.
+        ValueError: If the provided URL format is invalid.
 
     Returns:
         str: The generated or custom short URL that maps to the original URL.
@@ -25,45 +47,194 @@ def generate_short_url(url: str, username: str, custom_url: str = None, short_id
     valid_url = HttpUrl(url=url)
     url = valid_url.__str__()
     
-    user = get_user(username)
+    user = get_cached_user(username)
     
+    #cheap early rejection; the transactional write below is what enforces the limit
     if user.url_limit <= user.url_count:
         raise UrlLimitReachedError("URL limit reached.")
     
     if custom_url:
-        #check if custom url already exists in db
-        try:
-            UrlEntry.get(custom_url)
-            raise CustomUrlExistsError("This custom URL is already in use.")
-        #if custom_url not in database:
-        except UrlEntry.DoesNotExist:
-            url_entry = UrlEntry(short_url=custom_url, original_url=url, user_id=user.user_id)            
-            url_entry.save()   
-            user.url_count += 1
-            user.save()         
-            return custom_url
+        url_entry = UrlEntry(short_url=custom_url, original_url=url, user_id=user.user_id)
+        save_url_entry(url_entry)
     else:
-        unique_id = str(uuid.uuid4())[:short_id_length]
-        #check if the unique id already exists in db
-        while True:
-            try: 
-                UrlEntry.get(unique_id)
-                #if the above line executes, the unique id was already in db and a new one needs to be generated
-                unique_id = str(uuid.uuid4())[:short_id_length]
-            #A unique id has been found
-            except UrlEntry.DoesNotExist:
-                #save the unique id to the db
-                url_entry = UrlEntry(short_url=unique_id, original_url=url, user_id=user.user_id)                 
-                url_entry.save() 
-                user.url_count += 1
-                user.save()                   
-                return unique_id
+        #generated IDs are unique by construction, so write without a pre-read; the
+        #condition only guards against a custom URL that already took the same ID
+        id_generator = get_id_generator()
+        for _ in range(GENERATED_ID_ATTEMPTS):
+            url_entry = UrlEntry(short_url=id_generator.next_id(short_id_length), original_url=url, user_id=user.user_id)
+            try:
+                save_url_entry(url_entry)
+                break
+            except CustomUrlExistsError:
+                continue
+        else:
+            raise ShortIdUnavailableError("Could not find a free short URL. Please retry.")
+    
+    shared_url_cache.invalidate(url_entry.short_url)
+    #keep the cached principal in step with the counter that was just incremented
+    user.url_count += 1
+    return url_entry.short_url
+
+
+@traced()
+def save_url_entry(url_entry: UrlEntry) -> None:
+    """Stores a new short URL and charges it to its owner's URL limit in one transaction.
+
+    The put only succeeds if the short URL does not exist yet, and the owner's
+    url_count is only incremented while it is below url_limit. Both happen or
+    neither does, so concurrent creates cannot overwrite each other or exceed
+    the limit.
+
+    Args:
+        url_entry (UrlEntry): The entry to store. Its user_id is charged.
+
+    Raises:
+        CustomUrlExistsError: If the short URL is already in use.
+        UrlLimitReachedError: If the owner's URL limit is reached.
+    """
+    get_repository().create_url(url_entry)
+
         
+
+@traced()
+def generate_short_urls(requests: list, username: str) -> list[dict]:
+    """Creates short URLs for a batch of requests on behalf of one user.
+
+    The user's limit is checked and reserved once for the whole batch. Items past
+    the remaining limit are rejected individually. Generated short URLs are
+    written together (conditional puts in transactions of up to 100 on
+    DynamoDB), and one that turns out to be taken is retried with a new ID.
+    Custom URLs need a conditional put each. An existing short URL is never
+    overwritten. Quota reserved for items that are not created is released,
+    even if the batch fails part way.
+
+    Args:
+        requests (list[URLRequest]): The validated URL requests.
+        username (str): The user creating the short URLs.
+
+    Returns:
+        list[dict]: One result per request, in request order, with short_url,
+            original_url, status_code and detail keys.
+    """
+    results = [{"short_url": None, "original_url": str(request.url), "status_code": 201, "detail": None} for request in requests]
+    
+    #duplicate custom URLs inside the batch can never all succeed
+    seen_custom_urls = set()
+    accepted = []
+    for index, request in enumerate(requests):
+        if request.custom_url:
+            if request.custom_url in seen_custom_urls:
+                results[index].update(status_code=409, detail="This custom URL is already in use.")
+                continue
+            seen_custom_urls.add(request.custom_url)
+        accepted.append(index)
+    
+    granted = reserve_url_quota(username, len(accepted))
+    for index in accepted[granted:]:
+        results[index].update(status_code=403, detail="URL limit reached.")
+    accepted = accepted[:granted]
+    
+    created = 0
+    try:
+        repository = get_repository()
+        id_generator = get_id_generator()
+        generated = []
+        for index in accepted:
+            request = requests[index]
+            if not request.custom_url:
+                generated.append(index)
+                continue
+            url_entry = UrlEntry(short_url=request.custom_url, original_url=results[index]["original_url"], user_id=username)
+            try:
+                #quota was reserved above, so the owner is not charged again
+                repository.create_url(url_entry, charge_owner=False)
+            except CustomUrlExistsError as e:
+                results[index].update(status_code=409, detail=str(e))
+                continue
+            results[index]["short_url"] = url_entry.short_url
+            created += 1
         
+        for _ in range(GENERATED_ID_ATTEMPTS):
+            if not generated:
+                break
+            entries = {index: UrlEntry(short_url=id_generator.next_id(requests[index].length),
+                                       original_url=results[index]["original_url"], user_id=username)
+                       for index in generated}
+            taken, failed = repository.put_urls(list(entries.values()))
+            generated = []
+            for index, url_entry in entries.items():
+                if url_entry.short_url in taken:
+                    generated.append(index)
+                elif url_entry.short_url in failed:
+                    results[index].update(status_code=503, detail="Could not store this URL. Please retry.")
+                else:
+                    results[index]["short_url"] = url_entry.short_url
+                    created += 1
+        for index in generated:
+            results[index].update(status_code=503, detail="Could not store this URL. Please retry.")
+        
+        for index in accepted:
+            if results[index]["status_code"] == 201:
+                shared_url_cache.invalidate(results[index]["short_url"])
+    finally:
+        if created < granted:
+            release_url_quota(username, granted - created)
+        shared_principal_cache.invalidate(username)
+    return results
+
+
+@traced()
+def reserve_url_quota(username: str, requested: int) -> int:
+    """Atomically adds up to requested URLs to a user's url_count.
+
+    The increment is conditional on url_count still holding the value that was
+    read, so concurrent reservations cannot push a user past url_limit. The
+    count is read consistently, so a release that just happened is never seen
+    stale, and attempts that lose a race back off with jitter before retrying.
+
+    Args:
+        username (str): The user to charge.
+        requested (int): How many URLs the caller wants to create.
+
+    Raises:
+        ValueError: If the user does not exist.
+        QuotaContentionError: If the counter keeps changing underneath.
+
+    Returns:
+        int: How many URLs were reserved, between 0 and requested.
+    """
+    if requested <= 0:
+        return 0
+    repository = get_repository()
+    for attempt in range(QUOTA_RESERVE_ATTEMPTS):
+        if attempt:
+            time.sleep(random.uniform(0, QUOTA_RESERVE_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+        user = repository.get_user(username, consistent_read=True)
+        if user is None:
+            raise ValueError("User does not exist.")
+        granted = max(0, min(requested, int(user.url_limit - user.url_count)))
+        if granted == 0:
+            return 0
+        if repository.add_url_count(username, granted, expected_count=user.url_count):
+            return granted
+    raise QuotaContentionError("Could not reserve URL quota. Please retry.")
+
 
+@traced()
+def release_url_quota(username: str, count: int) -> None:
+    """Gives back quota reserved by reserve_url_quota for URLs that were not created."""
+    get_repository().add_url_count(username, -count)
+
+
+@traced()
 def get_original_url(short_url: str) -> str:
     """Retrieves the original URL associated with a given short URL.
 
+    Lookups are served from the in-process url_cache when possible. Misses are
+    cached for a short time as well, so repeated requests for unknown short URLs
+    do not reach the database either. Concurrent misses on one short URL share
+    a single database read.
+
     Args:
         short_url (str): The short URL to look up in the database.
 
@@ -73,16 +244,170 @@ def get_original_url(short_url: str) -> str:
     Returns:
         str: The original URL associated with the short URL.
     """
+    cached_url = get_cached_original_url(short_url)
+    if cached_url is not None:
+        return cached_url
+    return url_fetches.do(short_url, fetch_original_url, short_url)
+
+
+def get_current_snapshot():
+    #the redirect snapshot to consult, or None when snapshot mode is off or no file is loaded
+    resolver = get_snapshot_resolver()
+    return resolver.current() if resolver is not None else None
+
+
+@traced()
+def get_cached_original_url(short_url: str) -> str:
+    """Returns the cached original URL, or None if the short URL is not cached.
+
+    In snapshot mode (REDIRECT_SNAPSHOT_PATH) the memory-mapped snapshot is
+    checked before url_cache. Lookups that reach url_cache count towards hot
+    key detection, which pins viral links in the cache. A value that expired
+    less than URL_CACHE_STALE_SECONDS ago is still returned, and the short URL
+    is re-read in the background, so an expiring popular link never makes its
+    callers wait on the database.
+
+    Raises:
+        ValueError: If the short URL is cached as not existing, or is missing from the
+            snapshot and REDIRECT_SNAPSHOT_FALLBACK is off.
+    """
+    snapshot = get_current_snapshot()
+    if snapshot is not None:
+        original_url = snapshot.get(short_url)
+        if original_url is not None:
+            return original_url
+        if not REDIRECT_SNAPSHOT_FALLBACK:
+            raise ValueError("Short URL does not exist.")
+    record_lookup(short_url)
+    cached_url, stale = url_cache.get_stale(short_url)
+    if cached_url is NOT_FOUND:
+        raise ValueError("Short URL does not exist.")
+    if stale:
+        refresh_original_url(short_url)
+    return cached_url
+
+
+def refresh_original_url(short_url: str) -> None:
+    """Re-reads short_url into url_cache in the background, unless a read of it is already in flight.
+
+    On the event loop the read is a task sharing the async flight for the key;
+    elsewhere it is queued on the DynamoDB pool.
+    """
     try:
-        #retrieve og url from db
-        response = UrlEntry.get(short_url)
-        return response.original_url
-    except UrlEntry.DoesNotExist:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        if not url_fetches.in_flight(short_url):
+            db_executor.submit(url_fetches.do, short_url, fetch_original_url, short_url)
+        return
+    url_fetches.start_async(short_url, run_in_db_pool, fetch_original_url, short_url)
+
+
+@traced()
+def fetch_original_url(short_url: str) -> str:
+    """Reads the original URL from the shared cache or the database and stores the result in url_cache.
+
+    What the database returns, misses included, is shared with every other
+    worker through shared_url_cache.
+
+    Raises:
+        ValueError: If the short URL does not exist in the database.
+    """
+    original_url = shared_url_cache.get(short_url)
+    if original_url is None:
+        try:
+            #retrieve og url from db
+            original_url = get_repository().get_original_url(short_url) or NOT_FOUND
+        except Exception as e:
+            raise ValueError(f"Error: {str(e)}")
+        shared_url_cache.set(short_url, original_url)
+    if original_url is NOT_FOUND:
+        url_cache.set_missing(short_url)
         raise ValueError("Short URL does not exist.")
-    except Exception as e:
-        raise ValueError(f"Error: {str(e)}")
+    url_cache.set(short_url, original_url)
+    return original_url
     
     
+@traced()
+def get_original_urls(short_urls: list[str]) -> dict[str, str]:
+    """Resolves many short URLs at once.
+
+    Cached entries are answered from url_cache. The rest are read in batches of
+    up to 100 keys (one BatchGetItem each on DynamoDB), and their results
+    (including misses) are cached.
+
+    Args:
+        short_urls (list[str]): The short URLs to look up.
+
+    Raises:
+        ValueError: If there is an error fetching data from the database.
+
+    Returns:
+        dict[str, str]: Every requested short URL mapped to its original URL, or to None if it does not exist.
+    """
+    resolved, uncached = get_cached_original_urls(short_urls)
+    for start in range(0, len(uncached), BATCH_GET_CHUNK_SIZE):
+        resolved.update(fetch_original_urls(uncached[start:start + BATCH_GET_CHUNK_SIZE]))
+    return resolved
+
+
+@traced()
+def get_cached_original_urls(short_urls: list[str]) -> tuple[dict[str, str], list[str]]:
+    """Splits short URLs into those answered by url_cache and those that need a database read.
+
+    Returns:
+        tuple[dict[str, str], list[str]]: The cached results (None for cached misses) and the
+            de-duplicated short URLs that were not cached.
+    """
+    resolved = {}
+    uncached = []
+    snapshot = get_current_snapshot()
+    for short_url in dict.fromkeys(short_urls):
+        if snapshot is not None:
+            original_url = snapshot.get(short_url)
+            if original_url is not None or not REDIRECT_SNAPSHOT_FALLBACK:
+                resolved[short_url] = original_url
+                continue
+        cached_url = url_cache.get(short_url)
+        if cached_url is NOT_FOUND:
+            resolved[short_url] = None
+        elif cached_url is not None:
+            resolved[short_url] = cached_url
+        else:
+            uncached.append(short_url)
+    return resolved, uncached
+
+
+@traced()
+def fetch_original_urls(short_urls: list[str]) -> dict[str, str]:
+    """Reads up to 100 short URLs in one batch and caches the results.
+
+    Short URLs found in the shared cache are not read from the database; the
+    rest are, and their results are shared.
+
+    Raises:
+        ValueError: If there is an error fetching data from the database.
+    """
+    resolved = dict.fromkeys(short_urls)
+    resolved.update(shared_url_cache.get_many(short_urls))
+    unshared = [short_url for short_url, original_url in resolved.items() if original_url is None]
+    if unshared:
+        try:
+            found = get_repository().batch_get_original_urls(unshared)
+        except Exception as e:
+            raise ValueError(f"Error: {str(e)}")
+        fetched = {short_url: found.get(short_url, NOT_FOUND) for short_url in unshared}
+        shared_url_cache.set_many(fetched)
+        resolved.update(fetched)
+    for short_url, original_url in resolved.items():
+        if original_url is NOT_FOUND:
+            url_cache.set_missing(short_url)
+            resolved[short_url] = None
+        else:
+            url_cache.set(short_url, original_url)
+    return resolved
+    
+    
+@traced()
 def get_url_list() -> dict[str, str]:
     """Retrieves all short-original URL pairs from the database.
 
@@ -93,13 +418,52 @@ def get_url_list() -> dict[str, str]:
         dict[str, str]: A dictionary with short URLs as keys and their original URLs as values.
     """
     try:
-        url_entries = UrlEntry.scan()
-        url_dict = {entry.short_url: entry.original_url for entry in url_entries}
-        return url_dict
+        return dict(get_repository().iter_urls(DEFAULT_PAGE_SIZE))
     except Exception as e:
         raise ValueError(f"Error: {str(e)}")
     
     
+@traced()
+def get_url_page(page_size: int = DEFAULT_PAGE_SIZE, cursor: str = None) -> tuple[dict[str, str], str]:
+    """Retrieves one page of short-original URL pairs from the database.
+
+    Args:
+        page_size (int, optional): The maximum number of pairs to return. Defaults to DEFAULT_PAGE_SIZE.
+        cursor (str, optional): The next_cursor from the previous page. Defaults to None for the first page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+        ValueError: If there is an error fetching data from the database.
+
+    Returns:
+        tuple[dict[str, str], str]: The page of pairs and the cursor for the next page, or None on the last page.
+    """
+    last_evaluated_key = decode_cursor(cursor)
+    try:
+        pairs, last_evaluated_key = get_repository().list_urls(page_size, last_evaluated_key)
+        return dict(pairs), encode_cursor(last_evaluated_key)
+    except InvalidCursorError:
+        #a cursor that decodes but is not a key of this listing is still the client's error
+        raise
+    except Exception as e:
+        raise ValueError(f"Error: {str(e)}")
+
+
+def iter_url_pairs(page_size: int = DEFAULT_PAGE_SIZE):
+    """Yields every short-original URL pair as the table is scanned.
+
+    Only one page of results is held in memory at a time, whatever the table size.
+
+    Args:
+        page_size (int, optional): How many items to request per Scan call. Defaults to DEFAULT_PAGE_SIZE.
+
+    Yields:
+        tuple[str, str]: A short URL and its original URL.
+    """
+    yield from get_repository().iter_urls(page_size)
+    
+    
+@traced()
 def get_user_url_list(username: str) -> dict[str, str]:
     """Retrieves all short-original URL pairs for the given user.
     
@@ -113,13 +477,42 @@ def get_user_url_list(username: str) -> dict[str, str]:
         dict[str, str]: A dictionary with short URLs as keys and their original URLs as values.
     """
     try:
-        url_entries = UrlEntry.user_id_index.query(username)
-        url_dict = {entry.short_url: entry.original_url for entry in url_entries}
-        return url_dict
+        return dict(get_repository().iter_user_urls(username))
     except Exception as e:
         raise ValueError(f"Error: {str(e)}")
     
     
+@traced()
+def get_user_url_page(username: str, page_size: int = DEFAULT_PAGE_SIZE, cursor: str = None) -> tuple[dict[str, str], str]:
+    """Retrieves one page of the given user's short-original URL pairs, most recent first.
+
+    Reads at most page_size items from the user_id/created_at index, so the
+    cost does not grow with the number of links the user owns.
+
+    Args:
+        username (str): The username whose URLs to retrieve.
+        page_size (int, optional): The maximum number of pairs to return. Defaults to DEFAULT_PAGE_SIZE.
+        cursor (str, optional): The next_cursor from the previous page. Defaults to None for the first page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+        ValueError: If there is an error fetching data from the database.
+
+    Returns:
+        tuple[dict[str, str], str]: The page of pairs, newest first, and the cursor for the next page,
+            or None on the last page.
+    """
+    last_evaluated_key = decode_cursor(cursor)
+    try:
+        pairs, last_evaluated_key = get_repository().list_user_urls(username, page_size, last_evaluated_key)
+        return dict(pairs), encode_cursor(last_evaluated_key)
+    except InvalidCursorError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error: {str(e)}")
+    
+    
+@traced()
 def delete_url(short_url: str) -> dict:
     """Deletes a given short URL from the database.
 
@@ -133,24 +526,22 @@ def delete_url(short_url: str) -> dict:
         dict: A message confirming whether the deletion was successful.
     """
     try:
-        
-        url_entry = UrlEntry.get(short_url)        
-        url_entry.delete()
-        
-        if UrlEntry.exists(short_url):
-            return f"Failed to delete {short_url}."
-        else:
-            return {"message": f"{short_url} was successfully deleted."}
-        
-    except UrlEntry.DoesNotExist:
-        raise ValueError("Short URL not found")
+        deleted = get_repository().delete_url(short_url)
     except Exception as e:
         raise ValueError(f"Error: {str(e)}")
+    if not deleted:
+        raise ValueError("Short URL not found")
+    shared_url_cache.invalidate(short_url)
+    return {"message": f"{short_url} was successfully deleted."}
     
     
+@traced()
 def create_new_user(username: str, password: str) -> UrlEntry:
     """Creates a new user entry in the database if the username does not already exist.
 
+    Hashes in the calling thread. The API uses create_new_user_async, which
+    keeps bcrypt out of the DynamoDB pool.
+
     Args:
         username (str): The desired username.
         password (str): The user's password, which will be hashed for storage.
@@ -162,37 +553,54 @@ def create_new_user(username: str, password: str) -> UrlEntry:
     Returns:
         UserEntry: The created user object.
     """  
+    check_username_available(username)
+    return save_new_user(username, get_password_hash(password))
+
+
+@traced()
+def check_username_available(username: str) -> None:
+    """Raises ValueError if the username is taken or malformed."""
     #check if username already exists in db
     try:
-        UserEntry.get(username)
-        raise ValueError("This username is taken.")
-    #if username not in database:
-    except UserEntry.DoesNotExist:
-        hashed_password = get_password_hash(password)
-        new_user = UserEntry(
-            user_id=username,
-            hashed_password=hashed_password,
-            url_limit=20,
-            url_count=0,
-            is_admin=False                   
-        )
-        
-        try:
-            new_user.save()
-        except Exception as e:
-            raise RuntimeError(f"Failed to create user due to: {str(e)}")
-        
-        return new_user
-                   
+        existing_user = get_repository().get_user(username)
     except ValidationError:
         raise ValueError("Invalid User format")
     except Exception as e:
         raise ValueError(f"Error: {str(e)}")
+    if existing_user is not None:
+        raise ValueError("Error: This username is taken.")
+
+
+@traced()
+def save_new_user(username: str, hashed_password: str) -> UserEntry:
+    """Stores a new user with an already hashed password.
+
+    Raises:
+        RuntimeError: If an error occurs during user creation in the database.
+    """
+    new_user = UserEntry(
+        user_id=username,
+        hashed_password=hashed_password,
+        url_limit=20,
+        url_count=0,
+        is_admin=False                   
+    )
+    
+    try:
+        get_repository().create_user(new_user)
+    except Exception as e:
+        raise RuntimeError(f"Failed to create user due to: {str(e)}")
+    
+    return new_user
     
 
+@traced()
 def update_password(username: str, new_password: str) -> dict:
     """Updates the password for an authorized user.
 
+    Hashes in the calling thread. The API uses update_password_async, which
+    keeps bcrypt out of the DynamoDB pool.
+
     Args:
         username (str): The username whose password is being updated.
         new_password (str): The new password, which will be hashed for storage.
@@ -203,20 +611,133 @@ def update_password(username: str, new_password: str) -> dict:
     Returns:
         dict: A message confirming the password update.
     """
-    
-    new_hashed_password = get_password_hash(new_password)
-    
+    return save_password_hash(username, get_password_hash(new_password))
+
+
+@traced()
+def save_password_hash(username: str, new_hashed_password: str) -> dict:
+    """Stores an already hashed password for the user.
+
+    Raises:
+        ValueError: If the user does not exist in the database.
+    """
+    repository = get_repository()
     try:
-        user = UserEntry.get(username)
-        user.update(actions=[UserEntry.hashed_password.set(new_hashed_password)])
-        return {"message": "Password has been updated."}
-    except UserEntry.DoesNotExist:
-            raise HTTPException(status_code=404, detail="User not found.")
+        user = repository.get_user(username)
+        if user is not None:
+            repository.update_user(user, hashed_password=new_hashed_password)
     except Exception as e:
         raise ValueError(f"Error: {str(e)}")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found.")
+    shared_principal_cache.invalidate(username)
+    return {"message": "Password has been updated."}
+    
+@traced()
+def update_user_url_limit(username: str, new_limit: int) -> UserEntry:
+    """Sets a new URL limit for the given user.
+
+    Args:
+        username (str): The username whose limit is being updated.
+        new_limit (int): The new URL limit.
+
+    Raises:
+        UserEntry.DoesNotExist: If the user does not exist in the database.
+
+    Returns:
+        UserEntry: The updated user object.
+    """
+    repository = get_repository()
+    user = repository.get_user(username)
+    if user is None:
+        raise UserEntry.DoesNotExist()
+    repository.update_user(user, url_limit=new_limit)
+    shared_principal_cache.invalidate(username)
+    return user
     
+@traced()
 def validate_admin_user(user: UserEntry) -> bool:
     if not user.is_admin:
         raise AdminPrivilegesRequiredError("Admin privileges required.")
     return True
+
+
+# Async interface for the API layer. Each coroutine runs its blocking
+# counterpart above in the DynamoDB thread pool so the event loop stays free.
+
+async def generate_short_url_async(url: str, username: str, custom_url: str = None, short_id_length: int = 10) -> str:
+    return await run_in_db_pool(generate_short_url, url, username, custom_url, short_id_length)
+
+
+async def generate_short_urls_async(requests: list, username: str) -> list[dict]:
+    return await run_in_db_pool(generate_short_urls, requests, username)
+
+
+@traced()
+async def get_original_url_async(short_url: str) -> str:
+    """Resolves a short URL, answering cache hits directly on the event loop.
+
+    Concurrent misses on one short URL await a single read in the DynamoDB pool.
+    """
+    cached_url = get_cached_original_url(short_url)
+    if cached_url is not None:
+        return cached_url
+    return await url_fetches.do_async(short_url, run_in_db_pool, fetch_original_url, short_url)
+
+
+@traced()
+async def get_original_urls_async(short_urls: list[str]) -> dict[str, str]:
+    """Resolves many short URLs, fetching the uncached ones in concurrent 100-key chunks."""
+    resolved, uncached = get_cached_original_urls(short_urls)
+    chunks = [uncached[start:start + BATCH_GET_CHUNK_SIZE] for start in range(0, len(uncached), BATCH_GET_CHUNK_SIZE)]
+    for chunk_result in await asyncio.gather(*(run_in_db_pool(fetch_original_urls, chunk) for chunk in chunks)):
+        resolved.update(chunk_result)
+    return resolved
+
+
+async def get_url_list_async() -> dict[str, str]:
+    return await run_in_db_pool(get_url_list)
+
+
+async def get_url_page_async(page_size: int = DEFAULT_PAGE_SIZE, cursor: str = None) -> tuple[dict[str, str], str]:
+    return await run_in_db_pool(get_url_page, page_size, cursor)
+
+
+async def iter_url_pages_async(page_size: int = DEFAULT_PAGE_SIZE):
+    """Yields the whole table one page at a time, each page read in the DynamoDB pool."""
+    cursor = None
+    while True:
+        url_dict, cursor = await get_url_page_async(page_size, cursor)
+        if url_dict:
+            yield url_dict
+        if cursor is None:
+            break
+
+
+async def get_user_url_list_async(username: str) -> dict[str, str]:
+    return await run_in_db_pool(get_user_url_list, username)
+
+
+async def get_user_url_page_async(username: str, page_size: int = DEFAULT_PAGE_SIZE, cursor: str = None) -> tuple[dict[str, str], str]:
+    return await run_in_db_pool(get_user_url_page, username, page_size, cursor)
+
+
+async def delete_url_async(short_url: str) -> dict:
+    return await run_in_db_pool(delete_url, short_url)
+
+
+async def create_new_user_async(username: str, password: str) -> UserEntry:
+    #bcrypt runs in the hashing pool between the two database calls, never in a DynamoDB thread
+    await run_in_db_pool(check_username_available, username)
+    hashed_password = await get_password_hash_async(password)
+    return await run_in_db_pool(save_new_user, username, hashed_password)
+
+
+async def update_password_async(username: str, new_password: str) -> dict:
+    new_hashed_password = await get_password_hash_async(new_password)
+    return await run_in_db_pool(save_password_hash, username, new_hashed_password)
+
+
+async def update_user_url_limit_async(username: str, new_limit: int) -> UserEntry:
+    return await run_in_db_pool(update_user_url_limit, username, new_limit)
     
@@ -2,55 +2,45 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from datetime import datetime, timedelta
 from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
 from models.url_pydantic_models import TokenData
 from models.pynamodb_model import UserEntry
-import boto3
-import json
-from botocore.exceptions import ClientError
+from service.cache import principal_cache
+from service.executors import run_in_db_pool
+from service.hashing import password_hasher, pwd_context
+from service.exceptions import SecretUnavailableError
+from service.repository import get_repository
+from service.shared_cache import shared_principal_cache
+from service.secret_provider import get_secret_provider
 
 
 def get_secret():
+    """Returns the key new access tokens are signed with, loading it on first use."""
+    return get_secret_provider().current_key()
 
-    secret_name = "url-shortener/jwt_secret"
-    region_name = "us-east-2"
+async def get_secret_keys_async() -> list[str]:
+    """Returns the accepted JWT keys, current first, without blocking the event loop on a reload."""
+    provider = get_secret_provider()
+    keys = provider.cached_keys()
+    if keys is None:
+        keys = await run_in_db_pool(provider.get_keys)
+    return keys
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
-
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except ClientError as e:
-        # For a list of exceptions thrown, see
-        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        print(f"Error retrieving secret: {e}") 
-        raise e
-
-    secret = get_secret_value_response['SecretString']
-    secret_dict = json.loads(secret)
-    
-    jwt_key =secret_dict['JWT_SECRET_KEY']
-    
-    return jwt_key
-
-SECRET_KEY = get_secret()
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth_2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await password_hasher.verify_async(plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await password_hasher.hash_async(password)
 
 def get_user(user_id: str) -> UserEntry:
     """Retrieves user.
@@ -64,11 +54,40 @@ def get_user(user_id: str) -> UserEntry:
     Returns:
         UserEntry: The user object.
     """
-    try:
-        user = UserEntry.get(user_id)
-        return user
-    except UserEntry.DoesNotExist:
+    user = get_repository().get_user(user_id)
+    if user is None:
         raise ValueError("User does not exist.")
+    return user
+    
+def get_cached_user(user_id: str) -> UserEntry:
+    """Retrieves user through the short-lived principal cache.
+
+    Args:
+        user_id (str): The user ID to look up.
+
+    Raises:
+        ValueError: If the user does not exist in the database.
+
+    Returns:
+        UserEntry: The cached or freshly read user object.
+    """
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = load_user(user_id)
+    return user
+
+def load_user(user_id: str) -> UserEntry:
+    """Reads user from the shared principal cache or the database and stores it in the principal cache.
+
+    Raises:
+        ValueError: If the user does not exist in the database.
+    """
+    user = shared_principal_cache.get(user_id)
+    if user is None:
+        user = get_user(user_id)
+        shared_principal_cache.set(user_id, user)
+    principal_cache.set(user_id, user)
+    return user
     
 def authenticate_user(user_id: str, password: str) -> UserEntry:
     """
@@ -89,6 +108,27 @@ def authenticate_user(user_id: str, password: str) -> UserEntry:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
     return user
 
+async def authenticate_user_async(user_id: str, password: str) -> UserEntry:
+    """
+    Authenticates the user without blocking the event loop.
+
+    The user lookup runs in the DynamoDB pool and the bcrypt check in the hashing process pool.
+
+    Args:
+        user_id (str): The user ID to look up in the database.
+        password (str): The plaintext password to verify.
+
+    Returns:
+        UserEntry: The user object.
+    """
+    try:
+        user = await run_in_db_pool(get_user, user_id)
+    except ValueError as v:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User not found: {str(v)}")
+    if not await verify_password_async(password, user.hashed_password):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
+    return user
+
 def create_access_token(data: dict, expires_delta: timedelta):
     to_encode = data.copy()
     if expires_delta:
@@ -97,14 +137,47 @@ def create_access_token(data: dict, expires_delta: timedelta):
         expire = datetime.utcnow() + timedelta(minutes=15)
         
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, get_secret(), algorithm=ALGORITHM)
     return encoded_jwt
 
+async def create_access_token_async(data: dict, expires_delta: timedelta):
+    await get_secret_keys_async()
+    return create_access_token(data, expires_delta)
+
+def decode_access_token(token: str, keys: list[str]) -> dict:
+    """Decodes a token signed with any of the accepted keys.
+
+    Args:
+        token (str): The encoded JWT.
+        keys (list[str]): The accepted keys, current first.
+
+    Raises:
+        ExpiredSignatureError: If the signature is valid but the token has expired.
+        JWTError: If no key validates the token.
+
+    Returns:
+        dict: The token payload.
+    """
+    error = JWTError("No JWT secret key is configured.")
+    for key in keys:
+        try:
+            return jwt.decode(token, key, algorithms=[ALGORITHM])
+        except ExpiredSignatureError:
+            raise
+        except JWTError as e:
+            #signed with another key, e.g. the previous one during a rotation
+            error = e
+    raise error
+
 
 async def get_current_user(token: str = Depends(oauth_2_scheme)) -> UserEntry:
     credential_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        keys = await get_secret_keys_async()
+    except SecretUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    try:
+        payload = decode_access_token(token, keys)
         username: str = payload.get("sub")
         if username is None:
             raise credential_exception
@@ -113,7 +186,9 @@ async def get_current_user(token: str = Depends(oauth_2_scheme)) -> UserEntry:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired", headers={"WWW-Authenticate": "Bearer"})
     except JWTError:
         raise credential_exception
-    user = get_user(user_id=token_data.username)
+    user = principal_cache.get(token_data.username)
+    if user is None:
+        user = await run_in_db_pool(load_user, token_data.username)
     if not isinstance(user, UserEntry):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return user
@@ -0,0 +1,8 @@
+from pynamodb.exceptions import CancellationReason, TransactWriteError, VerboseClientError
+
+
+# Mock a cancelled transaction; codes line up with the transaction items
+def mock_transaction_cancelled(*codes):
+    reasons = [CancellationReason(code=code) if code else None for code in codes]
+    cause = VerboseClientError({"Error": {"Code": "TransactionCanceledException", "Message": "Transaction cancelled"}}, "TransactWriteItems", cancellation_reasons=reasons)
+    return TransactWriteError("Failed to write transaction items", cause=cause)
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from service import repository
+from datetime import datetime, timezone
+from service.analytics import ClickAnalytics, agent_bucket, click_analytics, period_bucket, referrer_bucket, time_buckets
+from service.repository import InMemoryRepository, get_repository, set_repository
+from main import app
+
+client = TestClient(app)
+
+
+class FailingRepository(InMemoryRepository):
+
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+
+    def add_click_counts(self, counts):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        return super().add_click_counts(counts)
+
+
+class AnalyticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        previous = get_repository() if repository._repository is not None else None
+        self.addCleanup(set_repository, previous)
+        self.repo = InMemoryRepository()
+        set_repository(self.repo)
+
+
+class TestBuckets(unittest.TestCase):
+
+    def test_time_buckets(self):
+        self.assertEqual(time_buckets(28401120), ("minute#2024-01-01T00:00", "hour#2024-01-01T00", "day#2024-01-01", "month#2024-01"))
+        self.assertEqual(time_buckets(28401120 + 61)[0], "minute#2024-01-01T01:01")
+        self.assertEqual(period_bucket("day", datetime(2024, 1, 1, 23, 30, tzinfo=timezone.utc)), "day#2024-01-01")
+
+    def test_referrer_bucket(self):
+        self.assertEqual(referrer_bucket("https://News.Example.com/post?id=1"), "referrer#news.example.com")
+        self.assertEqual(referrer_bucket(None), "referrer#direct")
+        self.assertEqual(referrer_bucket("not a url"), "referrer#direct")
+        self.assertEqual(referrer_bucket("http://[broken"), "referrer#direct")
+
+    def test_agent_bucket(self):
+        self.assertEqual(agent_bucket("Mozilla/5.0 (compatible; Googlebot/2.1)"), "agent#bot")
+        self.assertEqual(agent_bucket("Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148"), "agent#mobile")
+        self.assertEqual(agent_bucket("Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0"), "agent#desktop")
+        self.assertEqual(agent_bucket("curl/8.4.0"), "agent#bot")
+        self.assertEqual(agent_bucket("SomeApp/1.0"), "agent#other")
+        self.assertEqual(agent_bucket(None), "agent#unknown")
+
+
+class TestClickAnalytics(AnalyticsTestCase):
+
+    @patch("service.analytics.time.time", return_value=28401120 * 60 + 30)
+    def test_clicks_are_aggregated_and_flushed(self, _):
+        analytics = ClickAnalytics(max_queue=100, aggregate_seconds=1, flush_seconds=1, batch_size=2)
+        for _ in range(3):
+            analytics.record("shorturl01", "https://example.com/a", "Mozilla/5.0 (Windows NT 10.0)")
+        analytics.record("shorturl02")
+        self.assertEqual(analytics.aggregate(), 4)
+        self.assertEqual(analytics.stats()["pending_counters"], 14)
+        self.assertEqual(asyncio.run(analytics.flush()), 14)
+        self.assertEqual(self.repo.get_click_counts("shorturl01"),
+                         {"agent#desktop": 3, "day#2024-01-01": 3, "hour#2024-01-01T00": 3, "minute#2024-01-01T00:00": 3,
+                          "month#2024-01": 3, "referrer#example.com": 3, "total": 3})
+        self.assertEqual(self.repo.get_click_counts("shorturl02"),
+                         {"agent#unknown": 1, "day#2024-01-01": 1, "hour#2024-01-01T00": 1, "minute#2024-01-01T00:00": 1,
+                          "month#2024-01": 1, "referrer#direct": 1, "total": 1})
+        self.assertEqual(asyncio.run(analytics.flush()), 0)
+
+    def test_full_queue_drops_and_counts(self):
+        analytics = ClickAnalytics(max_queue=2, aggregate_seconds=1, flush_seconds=1)
+        self.assertTrue(analytics.record("shorturl01"))
+        self.assertTrue(analytics.record("shorturl01"))
+        self.assertFalse(analytics.record("shorturl01"))
+        stats = analytics.stats()
+        self.assertEqual((stats["queue_depth"], stats["recorded"], stats["dropped"]), (2, 2, 1))
+        analytics.aggregate()
+        self.assertTrue(analytics.record("shorturl01"))
+
+    def test_failed_flush_is_retried(self):
+        failing = FailingRepository()
+        set_repository(failing)
+        analytics = ClickAnalytics(max_queue=100, aggregate_seconds=1, flush_seconds=1)
+        analytics.record("shorturl01")
+        with self.assertLogs("analytics", "WARNING"):
+            self.assertEqual(asyncio.run(analytics.flush()), 0)
+        self.assertEqual(analytics.stats()["flush_errors"], 1)
+        analytics.record("shorturl01")
+        failing.fail = False
+        self.assertEqual(asyncio.run(analytics.flush()), 7)
+        self.assertEqual(failing.get_click_counts("shorturl01", "total"), {"total": 2})
+
+    def test_counters_are_capped_while_flushes_fail(self):
+        set_repository(FailingRepository())
+        #one click fills seven counters
+        analytics = ClickAnalytics(max_queue=100, aggregate_seconds=1, flush_seconds=1, max_counters=7)
+        analytics.record("shorturl01")
+        with self.assertLogs("analytics", "WARNING"):
+            asyncio.run(analytics.flush())
+        analytics.record("shorturl01")
+        analytics.record("shorturl02")
+        analytics.aggregate()
+        stats = analytics.stats()
+        self.assertEqual((stats["pending_counters"], stats["dropped_counts"]), (7, 7))
+        self.assertEqual(analytics._counts[("shorturl01", "total")], 2)
+
+    def test_referrers_past_the_limit_go_to_other(self):
+        analytics = ClickAnalytics(max_queue=100, aggregate_seconds=1, flush_seconds=1, max_referrers=3)
+        analytics.record("shorturl01", "https://a.example.com/")
+        analytics.record("shorturl01")
+        asyncio.run(analytics.flush())
+        #two hosts fit; the one with more clicks gets in first, and a known host is never folded
+        for host, clicks in (("c.example.com", 1), ("b.example.com", 2), ("d.example.com", 3), ("a.example.com", 1)):
+            for _ in range(clicks):
+                analytics.record("shorturl01", f"https://{host}/")
+        asyncio.run(analytics.flush())
+        self.assertEqual(self.repo.get_click_counts("shorturl01", "referrer#"),
+                         {"referrer#a.example.com": 2, "referrer#d.example.com": 3, "referrer#direct": 1, "referrer#other": 3})
+        self.assertEqual(analytics.stats()["folded_referrers"], 2)
+
+    def test_flush_runs_outside_the_db_pool(self):
+        threads = set()
+
+        class RecordingRepository(InMemoryRepository):
+            def add_click_counts(self, counts):
+                threads.add(threading.current_thread().name)
+                return super().add_click_counts(counts)
+
+        set_repository(RecordingRepository())
+        analytics = ClickAnalytics(max_queue=100, aggregate_seconds=1, flush_seconds=1, batch_size=1)
+        analytics.record("shorturl01")
+        self.assertEqual(asyncio.run(analytics.flush()), 7)
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith("analytics") for name in threads))
+
+    def test_background_task_flushes_and_stop_writes_the_rest(self):
+        analytics = ClickAnalytics(max_queue=100, aggregate_seconds=0.01, flush_seconds=0.01)
+
+        async def scenario():
+            analytics.start()
+            analytics.record("shorturl01")
+            await asyncio.sleep(0.1)
+            flushed = analytics.stats()["flushed_counters"]
+            analytics.record("shorturl01")
+            await analytics.stop()
+            return flushed
+
+        self.assertEqual(asyncio.run(scenario()), 7)
+        self.assertEqual(self.repo.get_click_counts("shorturl01", "total"), {"total": 2})
+        self.assertEqual(analytics.stats()["pending_counters"], 0)
+
+
+class TestRedirectRecordsClicks(AnalyticsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(click_analytics._queue.clear)
+        click_analytics._queue.clear()
+
+    @patch("api.routes.get_original_url_async")
+    def test_redirect_queues_click(self, mock_get):
+        mock_get.return_value = "https://example.com"
+        response = client.get("/r/shorturl01", follow_redirects=False,
+                              headers={"Referer": "https://news.example.com/", "User-Agent": "curl/8.4.0"})
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(len(click_analytics._queue), 1)
+        short_url, _, referrer, user_agent = click_analytics._queue[0]
+        self.assertEqual((short_url, referrer, user_agent), ("shorturl01", "https://news.example.com/", "curl/8.4.0"))
+
+    @patch("api.routes.get_original_url_async")
+    def test_missing_url_is_not_counted(self, mock_get):
+        mock_get.side_effect = ValueError("Short URL not found")
+        self.assertEqual(client.get("/r/missingurl").status_code, 404)
+        self.assertEqual(len(click_analytics._queue), 0)
+
+    def test_metrics_expose_queue(self):
+        response = client.get("/metrics")
+        self.assertIn("click_analytics_dropped", response.text)
+        self.assertIn("click_analytics_queue_depth", response.text)
@@ -0,0 +1,80 @@
+import unittest
+import os
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import NoCredentialsError
+from models.pynamodb_model import IdCounterEntry, UrlEntry, UserEntry
+from service.aws_clients import *
+from service.repository import transaction_connection
+
+
+class TestAwsClients(unittest.TestCase):
+
+    def setUp(self):
+        #clients are only created here, never used, but botocore still needs credentials to sign with
+        env_patch = patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_client_is_created_once_and_reused(self):
+        client = get_client("secretsmanager", "us-east-2")
+        self.assertIs(get_client("secretsmanager", "us-east-2"), client)
+        self.assertIsNot(get_client("secretsmanager", "us-west-2"), client)
+
+    def test_client_config(self):
+        config = get_dynamodb_client().meta.config
+        self.assertEqual(config.max_pool_connections, AWS_MAX_POOL_CONNECTIONS)
+        self.assertEqual(config.connect_timeout, AWS_CONNECT_TIMEOUT_SECONDS)
+        self.assertEqual(config.read_timeout, AWS_READ_TIMEOUT_SECONDS)
+        self.assertEqual(config.retries["mode"], AWS_RETRY_MODE)
+        self.assertEqual(config.tcp_keepalive, AWS_TCP_KEEPALIVE)
+
+    def test_models_share_one_dynamodb_client(self):
+        client = get_dynamodb_client()
+        for model in (UrlEntry, UserEntry, IdCounterEntry):
+            self.assertIs(model._get_connection().connection.client, client)
+        self.assertIs(transaction_connection.client, client)
+
+    def test_reset_clients_creates_new_client(self):
+        client = get_dynamodb_client()
+        reset_clients()
+        self.assertIsNot(get_dynamodb_client(), client)
+        #models pick up the new client on their next call
+        self.assertIs(UrlEntry._get_connection().connection.client, get_dynamodb_client())
+
+    def test_client_is_created_again_after_missing_credentials(self):
+        client = get_client("secretsmanager", "us-east-2")
+        with patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "", "AWS_SECRET_ACCESS_KEY": ""}):
+            #credentials are only resolved when a client is built
+            self.assertIs(get_client("secretsmanager", "us-east-2"), client)
+        with self.assertLogs("aws_clients", "WARNING"):
+            client.meta.events.emit("after-call-error.secrets-manager.GetSecretValue", exception=NoCredentialsError(), context={})
+        replacement = get_client("secretsmanager", "us-east-2")
+        self.assertIsNot(replacement, client)
+        self.assertIs(get_client("secretsmanager", "us-east-2"), replacement)
+
+    def test_other_errors_keep_the_client(self):
+        client = get_client("secretsmanager", "us-east-2")
+        client.meta.events.emit("after-call-error.secrets-manager.GetSecretValue", exception=RuntimeError("reset"), context={})
+        self.assertIs(get_client("secretsmanager", "us-east-2"), client)
+
+    def test_missing_credentials_are_logged_when_building(self):
+        reset_clients()
+        with patch("botocore.session.Session.get_credentials", return_value=None), \
+                self.assertLogs("aws_clients", "WARNING"):
+            get_client("secretsmanager", "us-east-2")
+
+    def test_client_replaced_by_pynamodb_is_restored(self):
+        connection = UrlEntry._get_connection().connection
+        connection._client = MagicMock()
+        with self.assertLogs("aws_clients", "WARNING"):
+            self.assertIs(UrlEntry._get_connection().connection.client, get_dynamodb_client())
+
+    @patch("service.aws_clients.get_dynamodb_client")
+    def test_warm_clients_opens_connections(self, mock_get_client):
+        client = MagicMock()
+        mock_get_client.return_value = client
+        warm_clients(["url-shortener", "users"], connections=4)
+        self.assertEqual(client.describe_table.call_count, 4)
+        self.assertEqual({call.kwargs["TableName"] for call in client.describe_table.call_args_list}, {"url-shortener", "users"})
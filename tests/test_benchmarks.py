@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+from benchmarks import fake_dynamodb, load, micro
+from benchmarks.fake_dynamodb import apply_update, compile_condition
+from service.aws_clients import reset_clients
+from service.secret_provider import EnvSecretProvider
+
+
+class TestFakeDynamoDBExpressions(unittest.TestCase):
+
+    def test_conditions(self):
+        item = {"url_count": {"N": "3"}, "url_limit": {"N": "5"}, "user_id": {"S": "testuser1"}}
+        names = {"#0": "url_count", "#1": "url_limit", "#2": "short_url"}
+        self.assertTrue(compile_condition("#0 < #1", names)(item))
+        self.assertFalse(compile_condition("#0 >= #1", names)(item))
+        self.assertTrue(compile_condition("attribute_not_exists (#2)", names)(item))
+        self.assertTrue(compile_condition("(#0 = :0 AND NOT attribute_exists (#2)) OR #1 < :1", names,
+                                          {":0": {"N": "3"}, ":1": {"N": "1"}})(item))
+        self.assertTrue(compile_condition("begins_with (#0, :0)", {"#0": "user_id"}, {":0": {"S": "test"}})(item))
+
+    def test_updates(self):
+        item = {"user_id": {"S": "testuser1"}, "url_count": {"N": "3"}}
+        updated = apply_update(item, "SET #1 = :1 ADD #0 :0", {"#0": "url_count", "#1": "url_limit"},
+                               {":0": {"N": "-2"}, ":1": {"N": "10"}})
+        self.assertEqual(updated["url_count"], {"N": "1"})
+        self.assertEqual(updated["url_limit"], {"N": "10"})
+        self.assertEqual(item["url_count"], {"N": "3"})
+        self.assertNotIn("url_count", apply_update(updated, "REMOVE #0", {"#0": "url_count"}))
+
+
+class TestFakeDynamoDB(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = fake_dynamodb.install()
+        self.addCleanup(reset_clients)
+
+    def test_transaction_is_all_or_nothing(self):
+        from models.pynamodb_model import UrlEntry, UserEntry
+        from service.exceptions import UrlLimitReachedError
+        from service.url_service import save_url_entry
+
+        UserEntry(user_id="testuser1", hashed_password="fakehash", url_limit=1).save()
+        save_url_entry(UrlEntry(short_url="shorturl01", original_url="https://example1.com", user_id="testuser1"))
+        with self.assertRaises(UrlLimitReachedError):
+            save_url_entry(UrlEntry(short_url="shorturl02", original_url="https://example2.com", user_id="testuser1"))
+        self.assertEqual(UserEntry.get("testuser1").url_count, 1)
+        self.assertEqual(self.fake.calls["TransactWriteItems"], 2)
+        with self.assertRaises(UrlEntry.DoesNotExist):
+            UrlEntry.get("shorturl02")
+
+    def test_unsupported_operation(self):
+        with self.assertRaises(ClientError):
+            self.fake._make_api_call("ExecuteStatement", {})
+
+
+class TestLoadRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(reset_clients)
+        with patch.dict("os.environ", {"JWT_SECRET_KEY": "testsecret"}):
+            provider = EnvSecretProvider()
+            provider.get_keys()
+        secret_patch = patch("service.utils.get_secret_provider", return_value=provider)
+        secret_patch.start()
+        self.addCleanup(secret_patch.stop)
+
+    def test_mixed_workload_runs_without_errors(self):
+        workload = os.path.join(os.path.dirname(load.__file__), "workloads", "mixed.jsonl")
+        results = load.run([workload], requests=100, concurrency_levels=[4], seed_urls=50, warmup=0, quiet=True)
+        run = results["runs"][0]
+        self.assertEqual(results["meta"]["backend"], "fake")
+        self.assertEqual(run["endpoints"]["ALL"]["requests"], 100)
+        self.assertEqual(run["endpoints"]["ALL"]["errors"], 0)
+        self.assertIn("redirect", run["endpoints"])
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            self.assertIn(key, run["endpoints"]["redirect"])
+
+    def test_request_mix_is_reproducible(self):
+        workload = [{"name": "a", "method": "GET", "path": "/r/{short_url}", "weight": 1, "expect": 307},
+                    {"name": "b", "method": "POST", "path": "/shorten", "json": {"url": "https://example.com/{n}"}, "auth": True, "weight": 1, "expect": 200}]
+        first = load.build_requests(workload, 50, 7, ["short1", "short2"], "token")
+        second = load.build_requests(workload, 50, 7, ["short1", "short2"], "token")
+        self.assertEqual(first, second)
+
+
+class TestMicroBenchmarks(unittest.TestCase):
+
+    def test_every_benchmark_runs(self):
+        with micro.mocked_environment():
+            for name, bench in micro.BENCHMARKS.items():
+                with self.subTest(name), bench() as func:
+                    func()
+
+    def test_baseline_is_stored_for_every_benchmark(self):
+        import json
+        with open(micro.BASELINE_PATH) as f:
+            baseline = json.load(f)
+        self.assertEqual(set(baseline["benchmarks"]), set(micro.BENCHMARKS))
+
+    def test_compare_flags_regressions_over_threshold(self):
+        baseline = {"benchmarks": {"a": {"ns_per_call": 100, "relative": 1.0}, "b": {"ns_per_call": 100, "relative": 1.0},
+                                   "gone": {"ns_per_call": 100, "relative": 1.0}}}
+        current = {"benchmarks": {"a": {"ns_per_call": 200, "relative": 1.2}, "b": {"ns_per_call": 100, "relative": 1.5},
+                                  "new": {"ns_per_call": 100, "relative": 1.0}}}
+        rows = {row["name"]: row for row in micro.compare(baseline, current, threshold=25)}
+        self.assertEqual(set(rows), {"a", "b"})
+        self.assertFalse(rows["a"]["regressed"])
+        self.assertTrue(rows["b"]["regressed"])
+        self.assertAlmostEqual(rows["b"]["change"], 50.0)
+        rows = {row["name"]: row for row in micro.compare(baseline, current, threshold=25, absolute=True)}
+        self.assertTrue(rows["a"]["regressed"])
+        self.assertFalse(rows["b"]["regressed"])
+
+    def test_merge_best_keeps_faster_result(self):
+        first = {"meta": {}, "benchmarks": {"a": {"ns_per_call": 100, "relative": 2.0}, "b": {"ns_per_call": 100, "relative": 1.0}}}
+        retry = {"meta": {}, "benchmarks": {"a": {"ns_per_call": 120, "relative": 1.5}, "b": {"ns_per_call": 90, "relative": 1.1}}}
+        merged = micro.merge_best(first, retry)
+        self.assertEqual(merged["benchmarks"]["a"]["relative"], 1.5)
+        self.assertEqual(merged["benchmarks"]["b"]["relative"], 1.0)
+        self.assertEqual(first["benchmarks"]["a"]["relative"], 2.0)
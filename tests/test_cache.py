@@ -0,0 +1,173 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from models.pynamodb_model import UrlEntry
+from service.cache import TTLCache, NOT_FOUND, url_cache, principal_cache
+from service.secret_provider import EnvSecretProvider
+from service.url_service import *
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_returns_cached_value(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("short1", "https://example1.com")
+        self.assertEqual(cache.get("short1"), "https://example1.com")
+        self.assertEqual(cache.hits, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("short1", "https://example1.com")
+        cache.set("short2", "https://example2.com")
+        #touch short1 so short2 becomes the eviction candidate
+        cache.get("short1")
+        cache.set("short3", "https://example3.com")
+        self.assertIsNone(cache.get("short2"))
+        self.assertEqual(cache.get("short1"), "https://example1.com")
+        self.assertEqual(len(cache), 2)
+
+    @patch("service.cache.time.monotonic")
+    def test_entries_expire(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        cache = TTLCache(maxsize=2, ttl=10, negative_ttl=1)
+        cache.set("short1", "https://example1.com")
+        cache.set_missing("missing")
+        mock_monotonic.return_value = 105
+        self.assertEqual(cache.get("short1"), "https://example1.com")
+        self.assertIsNone(cache.get("missing"))
+        mock_monotonic.return_value = 111
+        self.assertIsNone(cache.get("short1"))
+
+    @patch("service.cache.time.monotonic")
+    def test_stale_values_within_window(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        cache = TTLCache(maxsize=2, ttl=10, negative_ttl=10, stale_ttl=30)
+        cache.set("short1", "https://example1.com")
+        cache.set_missing("missing")
+        self.assertEqual(cache.get_stale("short1"), ("https://example1.com", False))
+        mock_monotonic.return_value = 120
+        #get still treats an expired value as a miss, without dropping it
+        self.assertIsNone(cache.get("short1"))
+        self.assertEqual(cache.get_stale("short1"), ("https://example1.com", True))
+        self.assertEqual(cache.get_stale("missing"), (None, False))
+        self.assertEqual(cache.stale_hits, 1)
+        mock_monotonic.return_value = 140
+        self.assertEqual(cache.get_stale("short1"), (None, False))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("short1", "https://example1.com")
+        cache.invalidate("short1")
+        self.assertIsNone(cache.get("short1"))
+
+    def test_pinned_keys_are_not_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("short1", "https://example1.com")
+        cache.pin("short1")
+        for i in range(2, 6):
+            cache.set(f"short{i}", f"https://example{i}.com")
+        self.assertEqual(cache.get("short1"), "https://example1.com")
+        self.assertEqual(cache.get("short5"), "https://example5.com")
+        self.assertEqual(len(cache), 2)
+        cache.unpin("short1")
+        cache.set("short6", "https://example6.com")
+        cache.set("short7", "https://example7.com")
+        self.assertIsNone(cache.get("short1"))
+
+    @patch("service.cache.time.monotonic")
+    def test_pinned_ttl(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        cache = TTLCache(maxsize=10, ttl=10, negative_ttl=1, pinned_ttl=1000)
+        cache.set("short1", "https://example1.com")
+        #pinning extends a value that is already cached
+        cache.pin("short1")
+        cache.pin("missing")
+        cache.set_missing("missing")
+        mock_monotonic.return_value = 500
+        self.assertEqual(cache.get("short1"), "https://example1.com")
+        self.assertIsNone(cache.get("missing"))
+        #unpinning brings the expiry back within ttl
+        cache.unpin("short1")
+        mock_monotonic.return_value = 511
+        self.assertIsNone(cache.get("short1"))
+        self.assertEqual(cache.pinned(), {"missing"})
+
+
+class TestUrlResolutionCache(unittest.TestCase):
+
+    def setUp(self):
+        url_cache.clear()
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_get_original_url_is_cached(self, mock_get):
+        mock_get.return_value = UrlEntry(short_url="short1", original_url="https://example1.com")
+        self.assertEqual(get_original_url("short1"), "https://example1.com")
+        self.assertEqual(get_original_url("short1"), "https://example1.com")
+        mock_get.assert_called_once()
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_get_original_url_caches_misses(self, mock_get):
+        mock_get.side_effect = UrlEntry.DoesNotExist
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                get_original_url("nonexistent")
+        mock_get.assert_called_once()
+        self.assertIs(url_cache.get("nonexistent"), NOT_FOUND)
+
+    @patch("models.pynamodb_model.UrlEntry.batch_get")
+    def test_get_original_urls_caches_hits_and_misses(self, mock_batch_get):
+        mock_batch_get.return_value = [UrlEntry(short_url="short1", original_url="https://example1.com")]
+        expected = {"short1": "https://example1.com", "missing": None}
+        self.assertEqual(get_original_urls(["short1", "missing", "short1"]), expected)
+        self.assertEqual(get_original_urls(["short1", "missing"]), expected)
+        mock_batch_get.assert_called_once()
+        self.assertIs(url_cache.get("missing"), NOT_FOUND)
+
+    @patch("models.pynamodb_model.UrlEntry.delete")
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_delete_url_invalidates_cache(self, mock_get, mock_delete):
+        mock_get.return_value = UrlEntry(short_url="short1", original_url="https://example1.com")
+        get_original_url("short1")
+        delete_url("short1")
+        self.assertIsNone(url_cache.get("short1"))
+
+
+class TestPrincipalCache(unittest.TestCase):
+
+    def setUp(self):
+        principal_cache.clear()
+        with patch.dict("os.environ", {"JWT_SECRET_KEY": "testsecret"}):
+            provider = EnvSecretProvider()
+            provider.get_keys()
+        secret_patch = patch("service.utils.get_secret_provider", return_value=provider)
+        secret_patch.start()
+        self.addCleanup(secret_patch.stop)
+        self.token = create_access_token(data={"sub": "testuser1"}, expires_delta=timedelta(minutes=5))
+
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_get_current_user_is_cached(self, mock_user_get):
+        mock_user_get.return_value = UserEntry(user_id="testuser1", is_admin=False, url_count=3, url_limit=30, hashed_password="fakehash")
+        first = asyncio.run(get_current_user(self.token))
+        second = asyncio.run(get_current_user(self.token))
+        self.assertEqual(first.user_id, "testuser1")
+        self.assertIs(first, second)
+        mock_user_get.assert_called_once()
+
+    @patch("models.pynamodb_model.UserEntry.update")
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_update_user_url_limit_invalidates_cache(self, mock_user_get, mock_update):
+        mock_user_get.return_value = UserEntry(user_id="testuser1", is_admin=False, url_count=3, url_limit=30, hashed_password="fakehash")
+        asyncio.run(get_current_user(self.token))
+        update_user_url_limit("testuser1", 10)
+        self.assertIsNone(principal_cache.get("testuser1"))
+
+    @patch("service.url_service.get_password_hash")
+    @patch("models.pynamodb_model.UserEntry.update")
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_update_password_invalidates_cache(self, mock_user_get, mock_update, mock_hash):
+        mock_user_get.return_value = UserEntry(user_id="testuser1", is_admin=False, url_count=3, url_limit=30, hashed_password="fakehash")
+        mock_hash.return_value = "newfakehash"
+        asyncio.run(get_current_user(self.token))
+        update_password("testuser1", "Valid!Passw0rd")
+        self.assertIsNone(principal_cache.get("testuser1"))
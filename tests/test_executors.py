@@ -0,0 +1,33 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from models.pynamodb_model import UrlEntry
+from service.cache import url_cache
+from service.executors import run_in_db_pool
+from service.url_service import *
+
+
+class TestExecutors(unittest.TestCase):
+
+    def setUp(self):
+        url_cache.clear()
+
+    def test_run_in_db_pool_leaves_event_loop_thread(self):
+        loop_thread = threading.get_ident()
+        worker_thread = asyncio.run(run_in_db_pool(threading.get_ident))
+        self.assertNotEqual(loop_thread, worker_thread)
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_get_original_url_async(self, mock_get):
+        mock_get.return_value = UrlEntry(short_url="short1", original_url="https://example1.com")
+        self.assertEqual(asyncio.run(get_original_url_async("short1")), "https://example1.com")
+        #second lookup is a cache hit and never reaches the pool
+        self.assertEqual(asyncio.run(get_original_url_async("short1")), "https://example1.com")
+        mock_get.assert_called_once()
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_get_original_url_async_not_found(self, mock_get):
+        mock_get.side_effect = UrlEntry.DoesNotExist
+        with self.assertRaises(ValueError):
+            asyncio.run(get_original_url_async("nonexistent"))
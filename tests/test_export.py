@@ -0,0 +1,73 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+from models.pynamodb_model import UrlEntry
+from pynamodb.exceptions import UpdateError
+from service.export import backfill_created_at, export_urls
+
+
+def mock_segment_scan(**kwargs):
+    #two entries per segment, tagged with the segment that returned them
+    segment = kwargs["segment"]
+    return [UrlEntry(short_url=f"short{segment}_{i}", original_url=f"https://example{segment}.com", user_id="testuser1") for i in range(2)]
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @patch("models.pynamodb_model.UrlEntry.scan")
+    def test_export_ndjson_parallel_segments(self, mock_scan):
+        mock_scan.side_effect = mock_segment_scan
+        path = os.path.join(self.tmpdir.name, "urls.ndjson.gz")
+
+        count = export_urls(path, "ndjson", total_segments=4, max_read_units=400)
+        self.assertEqual(count, 8)
+        with gzip.open(path, "rt") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual({row["short_url"] for row in rows}, {f"short{s}_{i}" for s in range(4) for i in range(2)})
+        self.assertEqual(sorted(call.kwargs["segment"] for call in mock_scan.call_args_list), [0, 1, 2, 3])
+        #capacity budget is split evenly across segments
+        self.assertTrue(all(call.kwargs["total_segments"] == 4 and call.kwargs["rate_limit"] == 100 for call in mock_scan.call_args_list))
+
+    @patch("models.pynamodb_model.UrlEntry.scan")
+    def test_export_csv(self, mock_scan):
+        mock_scan.side_effect = mock_segment_scan
+        path = os.path.join(self.tmpdir.name, "urls.csv.gz")
+
+        export_urls(path, "csv", total_segments=2)
+        with gzip.open(path, "rt", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]["user_id"], "testuser1")
+
+    @patch("models.pynamodb_model.UrlEntry.scan")
+    def test_export_failure_leaves_no_file(self, mock_scan):
+        mock_scan.side_effect = RuntimeError("scan failed")
+        path = os.path.join(self.tmpdir.name, "urls.ndjson.gz")
+        with self.assertRaises(RuntimeError):
+            export_urls(path, total_segments=2)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    #Test legacy entries without created_at are stamped, skipping ones changed since the scan
+    @patch("models.pynamodb_model.UrlEntry.update")
+    @patch("models.pynamodb_model.UrlEntry.scan")
+    def test_backfill_created_at(self, mock_scan, mock_update):
+        mock_scan.side_effect = lambda *args, **kwargs: mock_segment_scan(**kwargs)
+        mock_update.side_effect = [None, None, None, UpdateError(cause=ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}}, "UpdateItem"))]
+
+        count = backfill_created_at(total_segments=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(mock_update.call_count, 4)
+        self.assertTrue(all(call.kwargs["segment"] in (0, 1) for call in mock_scan.call_args_list))
+
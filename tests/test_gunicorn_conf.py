@@ -0,0 +1,71 @@
+import os
+import runpy
+import unittest
+from types import SimpleNamespace
+from unittest.mock import mock_open, patch
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def cgroup_files(files: dict):
+    #open() replacement serving the given cgroup files and failing for any other path
+    def fake_open(path, *args, **kwargs):
+        if path in files:
+            return mock_open(read_data=files[path])()
+        raise FileNotFoundError(path)
+    return fake_open
+
+
+class TestGunicornConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.config = runpy.run_path(CONFIG_PATH)
+        self.available_cpus = self.config["available_cpus"]
+
+    def test_production_settings(self):
+        self.assertTrue(self.config["preload_app"])
+        self.assertEqual(self.config["worker_class"], "uvicorn_worker.UvicornWorker")
+        self.assertGreater(self.config["keepalive"], 60)
+        self.assertGreater(self.config["max_requests"], 0)
+        self.assertGreaterEqual(self.config["workers"], 1)
+
+    @patch("os.sched_getaffinity", return_value=set(range(8)))
+    def test_cgroup_v2_quota_limits_workers(self, _):
+        with patch("builtins.open", cgroup_files({"/sys/fs/cgroup/cpu.max": "150000 100000\n"})):
+            self.assertEqual(self.available_cpus(), 2)
+        with patch("builtins.open", cgroup_files({"/sys/fs/cgroup/cpu.max": "50000 100000\n"})):
+            self.assertEqual(self.available_cpus(), 1)
+        with patch("builtins.open", cgroup_files({"/sys/fs/cgroup/cpu.max": "max 100000\n"})):
+            self.assertEqual(self.available_cpus(), 8)
+
+    @patch("os.sched_getaffinity", return_value=set(range(4)))
+    def test_cgroup_v1_quota(self, _):
+        files = {"/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "300000\n", "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n"}
+        with patch("builtins.open", cgroup_files(files)):
+            self.assertEqual(self.available_cpus(), 3)
+        with patch("builtins.open", cgroup_files({})):
+            self.assertEqual(self.available_cpus(), 4)
+
+    @patch.dict(os.environ, {"WEB_CONCURRENCY": "3", "GUNICORN_KEEPALIVE": "120"})
+    def test_environment_overrides(self):
+        config = runpy.run_path(CONFIG_PATH)
+        self.assertEqual((config["workers"], config["keepalive"]), (3, 120))
+
+    def test_workers_get_distinct_node_ids(self):
+        from service import id_generator
+        self.addCleanup(id_generator.reset_id_generator)
+        server = SimpleNamespace(WORKERS={})
+        node_ids = []
+        for pid in range(3):
+            worker = SimpleNamespace()
+            self.config["pre_fork"](server, worker)
+            server.WORKERS[pid] = worker
+            with patch.dict(os.environ, {"NODE_ID": "1022"}), patch("service.aws_clients.reset_clients"):
+                self.config["post_fork"](server, worker)
+                node_ids.append(id_generator.default_node_id())
+        self.assertEqual(node_ids, [1022, 1023, 0])
+        #a recycled worker's slot goes to its replacement
+        del server.WORKERS[1]
+        worker = SimpleNamespace()
+        self.config["pre_fork"](server, worker)
+        self.assertEqual(worker.slot, 1)
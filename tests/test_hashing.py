@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from models.pynamodb_model import UserEntry
+from service import repository
+from service.exceptions import HashingUnavailableError
+from service.hashing import PasswordHasher, hash_password, check_password
+from service.repository import InMemoryRepository, get_repository, set_repository
+from service.url_service import create_new_user_async, update_password_async
+from main import app
+
+client = TestClient(app)
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def test_hash_and_verify_in_process_pool(self):
+        hasher = PasswordHasher(max_workers=1, max_pending=2)
+        try:
+            hashed = hasher.hash("Valid!Passw0rd")
+            self.assertTrue(hasher.verify("Valid!Passw0rd", hashed))
+            self.assertFalse(hasher.verify("Wrong!Passw0rd", hashed))
+            stats = hasher.stats()
+            self.assertEqual(stats["completed"], 3)
+            self.assertEqual(stats["queue_depth"], 0)
+            self.assertIsNotNone(stats["latency_p99"])
+        finally:
+            hasher.shutdown()
+
+    def test_rejects_when_queue_is_full(self):
+        hasher = PasswordHasher(max_workers=1, max_pending=0)
+        with self.assertRaises(HashingUnavailableError):
+            hasher.hash("Valid!Passw0rd")
+        self.assertEqual(hasher.stats()["rejected"], 1)
+
+    def test_module_level_helpers(self):
+        self.assertTrue(check_password("Valid!Passw0rd", hash_password("Valid!Passw0rd")))
+
+    @patch("api.routes.authenticate_user_async")
+    def test_login_returns_503_when_saturated(self, mock_authenticate):
+        mock_authenticate.side_effect = HashingUnavailableError("Password hashing is at capacity. Please retry shortly.")
+        response = client.post("/login", data={"username": "testuser1", "password": "Valid!Passw0rd"})
+        self.assertEqual(response.status_code, 503)
+
+
+class TestAsyncUserWritesHashOffTheDbPool(unittest.TestCase):
+
+    def setUp(self):
+        previous = get_repository() if repository._repository is not None else None
+        self.addCleanup(set_repository, previous)
+        self.repo = InMemoryRepository()
+        set_repository(self.repo)
+
+    @patch("service.url_service.get_password_hash_async")
+    @patch("service.url_service.get_password_hash", side_effect=AssertionError("hashed in a DynamoDB thread"))
+    def test_hash_is_awaited_before_the_db_call(self, _, mock_hash_async):
+        mock_hash_async.return_value = "firsthash"
+        asyncio.run(create_new_user_async("testuser1", "Valid!Passw0rd"))
+        self.assertEqual(self.repo.get_user("testuser1").hashed_password, "firsthash")
+        mock_hash_async.return_value = "secondhash"
+        asyncio.run(update_password_async("testuser1", "Other!Passw0rd"))
+        self.assertEqual(self.repo.get_user("testuser1").hashed_password, "secondhash")
+
+    @patch("service.url_service.get_password_hash_async")
+    def test_taken_username_is_rejected_before_hashing(self, mock_hash_async):
+        self.repo.create_user(UserEntry(user_id="testuser1", hashed_password="fakehash"))
+        with self.assertRaises(ValueError):
+            asyncio.run(create_new_user_async("testuser1", "Valid!Passw0rd"))
+        mock_hash_async.assert_not_called()
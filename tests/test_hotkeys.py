@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from models.pynamodb_model import UserEntry
+from service.cache import TTLCache, url_cache
+from service.hotkeys import HotKeyTracker
+from service.url_service import get_original_url
+from service.utils import get_current_user
+from main import app
+
+client = TestClient(app)
+
+
+class TestHotKeyTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.tracker = HotKeyTracker(threshold=10, window_seconds=3600, max_hot=2, width=1024, depth=4,
+                                     on_hot=lambda key: self.events.append(("hot", key)),
+                                     on_cold=lambda key: self.events.append(("cold", key)))
+
+    def test_estimates_never_undercount(self):
+        for i in range(2000):
+            self.tracker.record(f"shorturl{i % 500:04}")
+        self.assertTrue(all(self.tracker.estimate(f"shorturl{i:04}") >= 4 for i in range(500)))
+        #an unseen key can only pick up collisions; for it to reach 8 every row would need two
+        self.assertLess(self.tracker.estimate("neverseen01"), 8)
+
+    def test_key_becomes_hot_at_threshold(self):
+        for _ in range(9):
+            self.tracker.record("viralurl01")
+        self.assertEqual(self.tracker.hot_keys(), [])
+        self.tracker.record("viralurl01")
+        self.assertEqual(self.tracker.hot_keys(), [("viralurl01", 10)])
+        self.tracker.record("viralurl01")
+        self.assertEqual(self.events, [("hot", "viralurl01")])
+
+    def test_decay_cools_keys_with_hysteresis(self):
+        for _ in range(12):
+            self.tracker.record("viralurl01")
+        self.tracker.decay()
+        #12 -> 6, still at least half the threshold
+        self.assertEqual(self.tracker.hot_keys(), [("viralurl01", 6)])
+        self.tracker.decay()
+        self.assertEqual(self.tracker.hot_keys(), [])
+        self.assertEqual(self.events, [("hot", "viralurl01"), ("cold", "viralurl01")])
+        self.assertEqual(self.tracker.stats()["demotions"], 1)
+
+    @patch("service.hotkeys.time.monotonic")
+    def test_decays_when_window_ends(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        tracker = HotKeyTracker(threshold=10, window_seconds=10, max_hot=2, width=1024)
+        for _ in range(8):
+            tracker.record("shorturl01")
+        mock_monotonic.return_value = 11
+        tracker.record("shorturl01")
+        self.assertEqual(tracker.estimate("shorturl01"), 5)
+
+    def test_sampling_scales_estimates(self):
+        tracker = HotKeyTracker(threshold=40, window_seconds=3600, max_hot=2, width=1024, sample_every=4)
+        for _ in range(39):
+            tracker.record("viralurl01")
+        self.assertEqual(tracker.estimate("viralurl01"), 36)
+        self.assertEqual(tracker.hot_keys(), [])
+        tracker.record("viralurl01")
+        self.assertEqual(tracker.hot_keys(), [("viralurl01", 40)])
+
+    def test_hot_set_is_bounded(self):
+        for key, lookups in (("viralurl01", 10), ("viralurl02", 20), ("viralurl03", 10), ("viralurl04", 30)):
+            for _ in range(lookups):
+                self.tracker.record(key)
+        self.assertEqual([key for key, _ in self.tracker.hot_keys()], ["viralurl04", "viralurl02"])
+        self.assertIn(("cold", "viralurl01"), self.events)
+
+    def test_rejects_bad_dimensions(self):
+        with self.assertRaises(ValueError):
+            HotKeyTracker(threshold=10, window_seconds=10, max_hot=2, width=1000)
+        with self.assertRaises(ValueError):
+            HotKeyTracker(threshold=10, window_seconds=10, max_hot=2, width=1 << 20, depth=4)
+
+
+class TestHotKeyPinning(unittest.TestCase):
+
+    def setUp(self):
+        url_cache.clear()
+        self.addCleanup(url_cache.clear)
+        self.cache = TTLCache(maxsize=10, ttl=0, pinned_ttl=60)
+        self.tracker = HotKeyTracker(threshold=5, window_seconds=3600, max_hot=4, width=1024,
+                                     on_hot=self.cache.pin, on_cold=self.cache.unpin)
+        for target, replacement in (("service.url_service.url_cache", self.cache), ("service.hotkeys.hot_keys", self.tracker)):
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_viral_link_is_pinned_and_stops_reaching_the_database(self, mock_get):
+        mock_get.return_value.original_url = "https://example.com/viral"
+        #with a zero TTL every unpinned lookup reads the database
+        for _ in range(100):
+            self.assertEqual(get_original_url("viralurl01"), "https://example.com/viral")
+        self.assertEqual(self.cache.pinned(), {"viralurl01"})
+        self.assertLessEqual(mock_get.call_count, 6)
+
+
+class TestHotKeysEndpoint(unittest.TestCase):
+
+    def tearDown(self):
+        app.dependency_overrides.pop(get_current_user, None)
+
+    def test_requires_admin(self):
+        app.dependency_overrides[get_current_user] = lambda: UserEntry(user_id="testuser1", is_admin=False, hashed_password="x")
+        self.assertEqual(client.get("/hot-keys").status_code, 403)
+
+    def test_lists_hot_keys(self):
+        app.dependency_overrides[get_current_user] = lambda: UserEntry(user_id="adminuser", is_admin=True, hashed_password="x")
+        tracker = HotKeyTracker(threshold=2, window_seconds=3600, max_hot=4, width=1024)
+        for _ in range(3):
+            tracker.record("viralurl01")
+        with patch("api.routes.hot_keys", tracker):
+            response = client.get("/hot-keys")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["hot_keys"], [{"short_url": "viralurl01", "estimated_lookups": 3, "pinned": False}])
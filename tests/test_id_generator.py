@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+from tests.helpers import mock_transaction_cancelled
+from models.pynamodb_model import UrlEntry, UserEntry
+from service.id_generator import *
+from service.url_service import *
+
+
+class TestIdGenerator(unittest.TestCase):
+
+    def test_base62_encode(self):
+        self.assertEqual(base62_encode(0, 10), "0000000000")
+        self.assertEqual(base62_encode(61, 3), "00z")
+        self.assertEqual(base62_encode(62, 3), "010")
+        with self.assertRaises(ValueError):
+            base62_encode(62 ** 3, 3)
+
+    def test_snowflake_ids_are_unique(self):
+        generator = SnowflakeIdGenerator(node_id=7)
+        ids = {generator.next_id(10) for _ in range(5000)}
+        self.assertEqual(len(ids), 5000)
+
+    def test_snowflake_ids_differ_across_nodes(self):
+        first = SnowflakeIdGenerator(node_id=1)
+        second = SnowflakeIdGenerator(node_id=2)
+        ids = {first.next_id(10) for _ in range(500)} | {second.next_id(10) for _ in range(500)}
+        self.assertEqual(len(ids), 1000)
+
+    def test_snowflake_rejects_invalid_node_id(self):
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(node_id=1024)
+
+    def test_id_lengths(self):
+        generator = SnowflakeIdGenerator(node_id=1)
+        for length in range(10, 16):
+            short_id = generator.next_id(length)
+            self.assertEqual(len(short_id), length)
+            self.assertTrue(short_id.isalnum())
+
+    def test_default_node_id(self):
+        with patch.dict("os.environ", {"NODE_ID": "17"}):
+            self.assertEqual(default_node_id(), 17)
+        with patch.dict("os.environ"), self.assertLogs("id_generator", "WARNING"):
+            os.environ.pop("NODE_ID", None)
+            self.assertLessEqual(default_node_id(), SnowflakeIdGenerator.MAX_NODE_ID)
+
+    def test_reset_id_generator(self):
+        self.addCleanup(reset_id_generator)
+        generator = get_id_generator()
+        self.assertIs(get_id_generator(), generator)
+        reset_id_generator()
+        self.assertIsNot(get_id_generator(), generator)
+
+    @patch.object(BlockCounterIdGenerator, "allocate_block")
+    def test_block_counter_allocates_once_per_block(self, mock_allocate):
+        mock_allocate.side_effect = [(0, 3), (3, 6)]
+        generator = BlockCounterIdGenerator(block_size=3)
+        ids = {generator.next_id(10) for _ in range(6)}
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(mock_allocate.call_count, 2)
+
+
+class TestGenerateShortUrlWithoutPreRead(unittest.TestCase):
+
+    def setUp(self):
+        url_cache.clear()
+        principal_cache.clear()
+
+    @patch("pynamodb.connection.Connection.transact_write_items")
+    @patch("models.pynamodb_model.UrlEntry.get")
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_generated_url_skips_read_and_retries_conflict(self, mock_user_get, mock_get, mock_transact):
+        mock_user_get.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")
+        mock_transact.side_effect = [mock_transaction_cancelled("ConditionalCheckFailed", None), None]
+
+        short_url = generate_short_url("https://example.com", "test_user", None, 12)
+        self.assertEqual(len(short_url), 12)
+        self.assertEqual(mock_transact.call_count, 2)
+        mock_get.assert_not_called()
@@ -1,9 +1,11 @@
+import json
 import unittest
 from unittest.mock import patch
 from fastapi.testclient import TestClient
 from models.pynamodb_model import UrlEntry
 from service.url_service import *
 from jose import JWTError, jwt
+from tests.helpers import mock_transaction_cancelled
 from main import app
 
 client = TestClient(app)
@@ -18,27 +20,37 @@ def mock_get_current_user():
     #mock user object
     return UserEntry(user_id="testuser1", is_admin=False, url_count=3, url_limit=30, hashed_password="fakehash")
 
+TEST_SECRET_KEY = "testsecret"
+
 # Mock expired token
 def mock_expired_token():
-    expired_token = jwt.encode({"sub": "testuser1", "exp": datetime.utcnow() - timedelta(seconds=1)}, SECRET_KEY, algorithm=ALGORITHM)
+    expired_token = jwt.encode({"sub": "testuser1", "exp": datetime.utcnow() - timedelta(seconds=1)}, TEST_SECRET_KEY, algorithm=ALGORITHM)
     try:
-        jwt.decode(expired_token, SECRET_KEY, algorithms=[ALGORITHM])
+        jwt.decode(expired_token, TEST_SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Expired token")
 # Mock invalid token   
 def mock_invalid_token():
     raise HTTPException(status_code=401, detail="Could not validate credentials.")
 
+
+# Mock scan/query result page carrying DynamoDB's LastEvaluatedKey
+class MockResultPage(list):
+    def __init__(self, entries, last_evaluated_key=None):
+        super().__init__(entries)
+        self.last_evaluated_key = last_evaluated_key
         
 
 class TestIntegration(unittest.TestCase):
+
+    def setUp(self):
+        url_cache.clear()
+        principal_cache.clear()
     
       
-    @patch("models.pynamodb_model.UrlEntry.get")
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get")
-    @patch("models.pynamodb_model.UserEntry.save")
-    def test_create_short_url_no_collision(self, mock_save, mock_user_get, mock_get):
-        mock_get.side_effect = UrlEntry.DoesNotExist()
+    def test_create_short_url_no_collision(self, mock_user_get, mock_transact):
         mock_user = UserEntry(
         user_id="testuser1",
         is_admin=False,
@@ -47,7 +59,6 @@ class TestIntegration(unittest.TestCase):
         hashed_password="fakehash"
     )
         mock_user_get.return_value = mock_user
-        mock_save.return_value = None
         app.dependency_overrides[get_current_user] = mock_get_current_user
         
         response = client.post("/shorten", json={"url": "https://example.com"})
@@ -58,9 +69,9 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(data["original_url"], "https://example.com/")
         
     #test create short url (no custom) WITH collision
-    @patch("models.pynamodb_model.UrlEntry.get")
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get")
-    def test_create_short_url_with_collision(self, mock_user_get, mock_get):
+    def test_create_short_url_with_collision(self, mock_user_get, mock_transact):
         mock_user_get.return_value = UserEntry(
         user_id="testuser1",
         is_admin=False,
@@ -68,7 +79,8 @@ class TestIntegration(unittest.TestCase):
         url_limit=30,
         hashed_password="fakehash"
     )
-        mock_get.side_effect = [UrlEntry.DoesNotExist(), None, UrlEntry.DoesNotExist()]
+        #the second request's first ID is taken, so it retries with a new one
+        mock_transact.side_effect = [None, mock_transaction_cancelled("ConditionalCheckFailed", None), None]
         app.dependency_overrides[get_current_user] = mock_get_current_user
         
         response = client.post("/shorten", json={"url": "https://example.com"})
@@ -81,10 +93,9 @@ class TestIntegration(unittest.TestCase):
         self.assertNotEqual(first_short_url, second_short_url)
      
     #test create custom short url (no collision)
-    @patch("models.pynamodb_model.UrlEntry.get")
-    @patch("models.pynamodb_model.UrlEntry.save")
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get")
-    def test_create_short_url_with_custom(self, mock_user_get, mock_save, mock_get):
+    def test_create_short_url_with_custom(self, mock_user_get, mock_transact):
         mock_user_get.return_value = UserEntry(
         user_id="testuser1",
         is_admin=False,
@@ -92,8 +103,6 @@ class TestIntegration(unittest.TestCase):
         url_limit=30,
         hashed_password="fakehash"
     )
-        mock_get.side_effect = UrlEntry.DoesNotExist()
-        mock_save.return_value = None
         app.dependency_overrides[get_current_user] = mock_get_current_user
         
         response = client.post("/shorten", json={"url": "https://example.com", "custom_url": "customurl1"})
@@ -107,9 +116,9 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(data["original_url"], "https://example.com/")
     
     #test create custom with collision (custom url is taken)    
-    @patch("models.pynamodb_model.UrlEntry.get")
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get")
-    def test_create_custom_url_with_collision(self, mock_user_get, mock_get):
+    def test_create_custom_url_with_collision(self, mock_user_get, mock_transact):
         mock_user_get.return_value = UserEntry(
         user_id="testuser1",
         is_admin=False,
@@ -117,7 +126,7 @@ class TestIntegration(unittest.TestCase):
         url_limit=30,
         hashed_password="fakehash"
     )
-        mock_get.return_value = UrlEntry(short_url="onetwothree", original_url="https://example.com")
+        mock_transact.side_effect = mock_transaction_cancelled("ConditionalCheckFailed", None)
         app.dependency_overrides[get_current_user] = mock_get_current_user
         
         response = client.post("/shorten", json={"url": "https://example.com", "custom_url": "onetwothree"})
@@ -138,8 +147,9 @@ class TestIntegration(unittest.TestCase):
             self.assertIn("url_pairs", data) 
             self.assertIsInstance(data["url_pairs"], dict)
         
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get")    
-    def test_redirect_short_url(self, mock_user_get):
+    def test_redirect_short_url(self, mock_user_get, mock_transact):
         mock_user_get.return_value = UserEntry(
         user_id="testuser1",
         is_admin=False,
@@ -242,10 +252,10 @@ class TestIntegration(unittest.TestCase):
         data = response.json()
         self.assertIn("Could not validate credentials", data["detail"])
         
-    @patch("models.pynamodb_model.UrlEntry.scan")
-    def test_list_user_urls(self, mock_scan):
-        mock_scan.return_value = [UrlEntry(short_url="short1", original_url="https://example1.com"), 
-                                  UrlEntry(short_url="short2", original_url="https://example2.com")]
+    @patch("models.pynamodb_model.UserIdIndex.query")
+    def test_list_user_urls(self, mock_query):
+        mock_query.return_value = MockResultPage([UrlEntry(short_url="short1", original_url="https://example1.com"), 
+                                                  UrlEntry(short_url="short2", original_url="https://example2.com")])
         app.dependency_overrides[get_current_user] = mock_get_current_user
         
         response = client.get("/list-my-urls")
@@ -253,8 +263,159 @@ class TestIntegration(unittest.TestCase):
         data = response.json()
         self.assertIn("url_pairs", data) 
         self.assertIsInstance(data["url_pairs"], dict)
-   
-    
-    
-        
-    
+        self.assertIsNone(data["next_cursor"])
+
+    #Test the user's URLs are read newest first, one bounded page at a time
+    @patch("models.pynamodb_model.UserIdIndex.query")
+    def test_list_user_urls_paginated(self, mock_query):
+        last_key = {"short_url": {"S": "short2"}, "user_id": {"S": "testuser1"}, "created_at": {"S": "2024-05-01T00:00:00.000000+0000"}}
+        mock_query.side_effect = [
+            MockResultPage([UrlEntry(short_url="short2", original_url="https://example2.com"),
+                            UrlEntry(short_url="short1", original_url="https://example1.com")], last_key),
+            MockResultPage([]),
+        ]
+        app.dependency_overrides[get_current_user] = mock_get_current_user
+
+        response = client.get("/list-my-urls", params={"page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(list(data["url_pairs"]), ["short2", "short1"])
+        self.assertIsNotNone(data["next_cursor"])
+        self.assertEqual(mock_query.call_args_list[0].args[0], "testuser1")
+        self.assertFalse(mock_query.call_args_list[0].kwargs["scan_index_forward"])
+        self.assertEqual(mock_query.call_args_list[0].kwargs["limit"], 2)
+
+        #an empty page after the first one is not a 404
+        response = client.get("/list-my-urls", params={"page_size": 2, "cursor": data["next_cursor"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"url_pairs": {}, "next_cursor": None})
+        self.assertEqual(mock_query.call_args_list[1].kwargs["last_evaluated_key"], last_key)
+
+    @patch("models.pynamodb_model.UserIdIndex.query")
+    def test_list_user_urls_empty(self, mock_query):
+        mock_query.return_value = MockResultPage([])
+        app.dependency_overrides[get_current_user] = mock_get_current_user
+        response = client.get("/list-my-urls")
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_user_urls_invalid_cursor(self):
+        app.dependency_overrides[get_current_user] = mock_get_current_user
+        response = client.get("/list-my-urls", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    @patch("models.pynamodb_model.UrlEntry.user_id_index.query")
+    def test_list_user_urls_wrongly_shaped_cursor(self, mock_query):
+        app.dependency_overrides[get_current_user] = mock_get_current_user
+        #well formed, but not an index key of this user
+        for last_key in ({"short_url": "shorturl01"}, {"short_url": {"S": "shorturl01"}, "user_id": {"S": "otheruser"},
+                                                        "created_at": {"S": "2024-01-01T00:00:00.000000+0000"}}):
+            response = client.get("/list-my-urls", params={"cursor": encode_cursor(last_key)})
+            self.assertEqual(response.status_code, 400)
+        mock_query.assert_not_called()
+
+    #Test batch shorten with per-item results
+    @patch("pynamodb.connection.Connection.transact_write_items")
+    @patch("models.pynamodb_model.UrlEntry.save")
+    @patch("models.pynamodb_model.UserEntry.update")
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_create_short_urls_batch(self, mock_user_get, mock_update, mock_save, mock_transact):
+        mock_user_get.return_value = UserEntry(user_id="testuser1", is_admin=False, url_count=3, url_limit=6, hashed_password="fakehash")
+        app.dependency_overrides[get_current_user] = mock_get_current_user
+
+        response = client.post("/shorten/batch", json={"items": [
+            {"url": "https://example1.com"},
+            {"url": "https://example2.com", "custom_url": "customurl1"},
+            {"url": "https://example3.com", "custom_url": "customurl1"},
+            {"url": "https://example4.com", "length": 12},
+            {"url": "https://example5.com"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        statuses = [result["status_code"] for result in data["results"]]
+        #duplicate custom url is rejected, and only 3 of the remaining 4 fit under the limit
+        self.assertEqual(statuses, [201, 201, 409, 201, 403])
+        self.assertEqual(data["results"][1]["short_url"], "customurl1")
+        self.assertEqual(len(data["results"][3]["short_url"]), 12)
+        self.assertEqual(data["created"], 3)
+        #quota reserved once, generated urls written in one batch call
+        mock_update.assert_called_once()
+        mock_transact.assert_called_once()
+        self.assertEqual(len(mock_transact.call_args.kwargs["put_items"]), 2)
+
+    #Test batch shorten rejects invalid items in one pass
+    def test_create_short_urls_batch_invalid_item(self):
+        app.dependency_overrides[get_current_user] = mock_get_current_user
+        response = client.post("/shorten/batch", json={"items": [{"url": "https://example.com"}, {"url": "example.com"}]})
+        self.assertEqual(response.status_code, 422)
+
+    #Test batch resolve splits uncached keys into 100-key chunks
+    @patch("models.pynamodb_model.UrlEntry.batch_get")
+    def test_resolve_short_urls_batch(self, mock_batch_get):
+        url_cache.set("cachedurl01", "https://cached.com")
+        mock_batch_get.side_effect = lambda keys, **kwargs: [UrlEntry(short_url=key, original_url=f"https://{key}.com") for key in keys if key != "missingurl1"]
+        short_urls = ["cachedurl01", "missingurl1"] + [f"shorturl{i:03}" for i in range(149)]
+
+        response = client.post("/resolve/batch", json={"short_urls": short_urls})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["urls"]), 151)
+        self.assertEqual(data["urls"]["cachedurl01"], "https://cached.com")
+        self.assertEqual(data["urls"]["shorturl000"], "https://shorturl000.com")
+        self.assertIsNone(data["urls"]["missingurl1"])
+        self.assertEqual(data["misses"], ["missingurl1"])
+        self.assertEqual(mock_batch_get.call_count, 2)
+        self.assertTrue(all(len(call.args[0]) <= 100 for call in mock_batch_get.call_args_list))
+
+    #Test batch resolve rejects keys no short URL can have before reaching the database
+    @patch("models.pynamodb_model.UrlEntry.batch_get")
+    def test_resolve_short_urls_batch_invalid_key(self, mock_batch_get):
+        for bad_key in ("", "x" * 16):
+            response = client.post("/resolve/batch", json={"short_urls": ["shorturl001", bad_key]})
+            self.assertEqual(response.status_code, 422)
+        mock_batch_get.assert_not_called()
+
+    #Test paginated list-urls returns a cursor that resumes the scan
+    @patch("models.pynamodb_model.UrlEntry.scan")
+    def test_list_urls_paginated(self, mock_scan):
+        last_key = {"short_url": {"S": "short2"}}
+        mock_scan.side_effect = [
+            MockResultPage([UrlEntry(short_url="short1", original_url="https://example1.com"),
+                            UrlEntry(short_url="short2", original_url="https://example2.com")], last_key),
+            MockResultPage([UrlEntry(short_url="short3", original_url="https://example3.com")]),
+        ]
+        app.dependency_overrides[get_current_user] = mock_get_admin_user
+
+        response = client.get("/list-urls", params={"page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(list(data["url_pairs"]), ["short1", "short2"])
+        self.assertIsNotNone(data["next_cursor"])
+
+        response = client.get("/list-urls", params={"page_size": 2, "cursor": data["next_cursor"]})
+        data = response.json()
+        self.assertEqual(data["url_pairs"], {"short3": "https://example3.com"})
+        self.assertIsNone(data["next_cursor"])
+        self.assertEqual(mock_scan.call_args_list[1].kwargs["last_evaluated_key"], last_key)
+        self.assertEqual(mock_scan.call_args_list[1].kwargs["limit"], 2)
+
+    def test_list_urls_invalid_cursor(self):
+        app.dependency_overrides[get_current_user] = mock_get_admin_user
+        response = client.get("/list-urls", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    #Test ndjson streaming walks every page
+    @patch("models.pynamodb_model.UrlEntry.scan")
+    def test_list_urls_ndjson(self, mock_scan):
+        mock_scan.side_effect = [
+            MockResultPage([UrlEntry(short_url="short1", original_url="https://example1.com")], {"short_url": {"S": "short1"}}),
+            MockResultPage([UrlEntry(short_url="short2", original_url="https://example2.com")]),
+        ]
+        app.dependency_overrides[get_current_user] = mock_get_admin_user
+
+        response = client.get("/list-urls", params={"format": "ndjson", "page_size": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines, [{"short_url": "short1", "original_url": "https://example1.com"},
+                                 {"short_url": "short2", "original_url": "https://example2.com"}])
+
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from botocore.stub import Stubber
+from fastapi.testclient import TestClient
+from models.pynamodb_model import UrlEntry
+from service.aws_clients import get_dynamodb_client, reset_clients
+from service.metrics import *
+from service.url_service import *
+from main import app
+
+client = TestClient(app)
+
+
+class TestMetricTypes(unittest.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "/r")
+        histogram.observe(0.5, "/r")
+        histogram.observe(5, "/r")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/r",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/r",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/r",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{route="/r"} 3', lines)
+        self.assertIn('test_seconds_sum{route="/r"} 5.55', lines)
+
+    def test_counter_and_label_escaping(self):
+        counter = Counter("test_total", "Test.", ("error",))
+        counter.inc('bad "quote"')
+        counter.inc('bad "quote"', amount=2)
+        self.assertEqual(counter.render(), ['test_total{error="bad \\"quote\\""} 3'])
+
+
+class TestMultiprocessMetrics(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.registry = MetricsRegistry()
+        self.counter = self.registry.register(Counter("test_total", "Test.", ("route",)))
+        self.histogram = self.registry.register(Histogram("test_seconds", "Test.", buckets=(0.1,)))
+        self.entries = 0
+        self.registry.register(GaugeCallback("test_entries", "Test.", (), lambda: {(): self.entries}))
+
+    def record(self, route: str, seconds: float, entries: int) -> dict:
+        #each call stands in for one worker process
+        self.counter.inc(route)
+        self.histogram.observe(seconds)
+        self.entries = entries
+        snapshot = json.loads(json.dumps(self.registry.snapshot()))
+        self.counter._values.clear()
+        self.histogram._values.clear()
+        return snapshot
+
+    def test_workers_are_merged(self):
+        snapshots = {"101": self.record("/r", 0.05, 3), "102": self.record("/r", 0.5, 4)}
+        lines = self.registry.render(snapshots).splitlines()
+        self.assertIn('test_total{route="/r"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn("test_seconds_count 2", lines)
+        self.assertIn('test_entries{worker="101"} 3', lines)
+        self.assertIn('test_entries{worker="102"} 4', lines)
+
+    def test_exited_workers_keep_counters_but_not_gauges(self):
+        with patch("service.metrics.registry", self.registry):
+            write_snapshot(self.directory)
+            for pid, route in ((101, "/a"), (102, "/a")):
+                with open(os.path.join(self.directory, f"{pid}.json"), "w") as f:
+                    json.dump(self.record(route, 0.05, 7), f)
+                mark_process_dead(pid, self.directory)
+            snapshots = read_snapshots(self.directory)
+        self.assertEqual(set(snapshots), {str(os.getpid()), ARCHIVE_NAME})
+        lines = self.registry.render(snapshots).splitlines()
+        self.assertIn('test_total{route="/a"} 2', lines)
+        self.assertNotIn('test_entries{worker="101"} 7', lines)
+        clear_snapshots(self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_endpoint_reports_every_worker(self):
+        with patch("service.metrics.METRICS_MULTIPROC_DIR", self.directory):
+            response = client.get("/metrics")
+        self.assertIn(f'cache_url_entries{{worker="{os.getpid()}"}}', response.text)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f"{os.getpid()}.json")))
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        url_cache.clear()
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_requests_are_recorded_by_route_template(self, mock_get):
+        mock_get.return_value = UrlEntry(short_url="short1", original_url="https://example1.com")
+        before = http_request_duration.count("GET", "/r/{short_url}", 307)
+        client.get("/r/short1", follow_redirects=False)
+        client.get("/r/short1", follow_redirects=False)
+        self.assertEqual(http_request_duration.count("GET", "/r/{short_url}", 307), before + 2)
+
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/r/{short_url}",status="307"}', response.text)
+        self.assertIn("cache_url_hits_total 1", response.text)
+        self.assertIn("cache_url_hit_ratio 0.5", response.text)
+        self.assertIn("# TYPE password_hash_queue_depth gauge", response.text)
+
+    def test_unknown_paths_are_not_labelled(self):
+        client.get("/no/such/path")
+        self.assertGreaterEqual(http_request_duration.count("GET", "unmatched", 404), 1)
+
+
+class TestDynamoDBMetrics(unittest.TestCase):
+
+    def setUp(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    @patch.dict("os.environ", {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"})
+    def test_calls_and_errors_are_recorded_per_operation(self):
+        stubber = Stubber(get_dynamodb_client())
+        stubber.add_response("get_item", {"Item": {"short_url": {"S": "short1"}, "original_url": {"S": "https://example1.com"}, "user_id": {"S": "testuser1"}}})
+        stubber.add_client_error("get_item", service_error_code="ProvisionedThroughputExceededException")
+        before = dynamodb_request_duration.count("GetItem", "url-shortener")
+        errors = dynamodb_request_errors.value("GetItem", "url-shortener", "ProvisionedThroughputExceededException")
+        with stubber:
+            self.assertEqual(UrlEntry.get("short1").original_url, "https://example1.com")
+            with self.assertRaises(Exception):
+                UrlEntry.get("short1")
+        self.assertEqual(dynamodb_request_duration.count("GetItem", "url-shortener"), before + 2)
+        self.assertEqual(dynamodb_request_errors.value("GetItem", "url-shortener", "ProvisionedThroughputExceededException"), errors + 1)
+
+
+class TestEventLoopLag(unittest.TestCase):
+
+    def test_blocked_loop_is_recorded(self):
+        async def run():
+            monitor = asyncio.create_task(monitor_event_loop_lag(0.01))
+            await asyncio.sleep(0)
+            time.sleep(0.05)
+            await asyncio.sleep(0.02)
+            monitor.cancel()
+
+        before = event_loop_lag.count()
+        asyncio.run(run())
+        self.assertGreater(event_loop_lag.count(), before)
+        self.assertIn("event_loop_lag_seconds_bucket", registry.render())
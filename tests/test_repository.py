@@ -0,0 +1,234 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+from benchmarks import fake_dynamodb
+from models.pynamodb_model import UrlEntry, UserEntry
+from service import repository
+from service.aws_clients import reset_clients
+from service.cache import principal_cache, url_cache
+from service.exceptions import CustomUrlExistsError, InvalidCursorError, QuotaContentionError, UrlLimitReachedError
+from service.repository import DynamoDBRepository, InMemoryRepository, SQLiteRepository, get_repository, set_repository
+from service.url_service import QUOTA_RESERVE_ATTEMPTS, delete_url, generate_short_url, get_original_url, get_user_url_page, reserve_url_quota
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def url_entry(short_url: str, user_id: str = "testuser1", minutes: int = 0) -> UrlEntry:
+    return UrlEntry(short_url=short_url, original_url=f"https://{short_url}.com", user_id=user_id,
+                    created_at=START + timedelta(minutes=minutes))
+
+
+class RepositoryContract:
+    #every engine must pass these; subclasses provide make_repository
+
+    def setUp(self):
+        self.repo = self.make_repository()
+        self.repo.create_user(UserEntry(user_id="testuser1", hashed_password="fakehash", url_limit=2, url_count=0))
+
+    def test_create_and_get_url(self):
+        self.repo.create_url(url_entry("shorturl01"))
+        self.assertEqual(self.repo.get_original_url("shorturl01"), "https://shorturl01.com")
+        self.assertIsNone(self.repo.get_original_url("missingurl"))
+        self.assertEqual(self.repo.get_user("testuser1").url_count, 1)
+
+    def test_create_url_never_overwrites(self):
+        self.repo.create_url(url_entry("shorturl01"))
+        with self.assertRaises(CustomUrlExistsError):
+            self.repo.create_url(UrlEntry(short_url="shorturl01", original_url="https://other.com", user_id="testuser1"))
+        with self.assertRaises(CustomUrlExistsError):
+            self.repo.create_url(url_entry("shorturl01"), charge_owner=False)
+        self.assertEqual(self.repo.get_original_url("shorturl01"), "https://shorturl01.com")
+        self.assertEqual(self.repo.get_user("testuser1").url_count, 1)
+
+    def test_create_url_enforces_limit_atomically(self):
+        self.repo.create_url(url_entry("shorturl01"))
+        self.repo.create_url(url_entry("shorturl02"))
+        with self.assertRaises(UrlLimitReachedError):
+            self.repo.create_url(url_entry("shorturl03"))
+        self.assertIsNone(self.repo.get_original_url("shorturl03"))
+        self.repo.create_url(url_entry("shorturl03"), charge_owner=False)
+        self.assertEqual(self.repo.get_user("testuser1").url_count, 2)
+
+    def test_put_urls_and_batch_get(self):
+        self.assertEqual(self.repo.put_urls([url_entry(f"shorturl{i:02}") for i in range(30)]), (set(), set()))
+        resolved = self.repo.batch_get_original_urls(["shorturl00", "shorturl29", "missingurl"])
+        self.assertEqual(resolved, {"shorturl00": "https://shorturl00.com", "shorturl29": "https://shorturl29.com"})
+
+    def test_put_urls_never_overwrites(self):
+        self.repo.put_urls([url_entry("shorturl05"), url_entry("shorturl120")])
+        entries = [url_entry(f"shorturl{i:02}", user_id="testuser2") for i in range(130)]
+        self.assertEqual(self.repo.put_urls(entries), ({"shorturl05", "shorturl120"}, set()))
+        self.assertEqual(self.repo.get_original_url("shorturl05"), "https://shorturl05.com")
+        self.assertEqual({short_url for short_url, _ in self.repo.iter_user_urls("testuser1")}, {"shorturl05", "shorturl120"})
+        self.assertEqual(len(list(self.repo.iter_user_urls("testuser2"))), 128)
+
+    def test_delete_url(self):
+        self.repo.put_urls([url_entry("shorturl01")])
+        self.assertTrue(self.repo.delete_url("shorturl01"))
+        self.assertFalse(self.repo.delete_url("shorturl01"))
+        self.assertIsNone(self.repo.get_original_url("shorturl01"))
+        self.assertEqual(list(self.repo.iter_user_urls("testuser1")), [])
+
+    def test_list_urls_pages_through_everything_once(self):
+        self.repo.put_urls([url_entry(f"shorturl{i:02}") for i in range(7)])
+        seen, last_key, pages = [], None, 0
+        while True:
+            pairs, last_key = self.repo.list_urls(3, last_key)
+            seen.extend(pairs)
+            pages += 1
+            if last_key is None:
+                break
+        self.assertEqual(sorted(short_url for short_url, _ in seen), [f"shorturl{i:02}" for i in range(7)])
+        self.assertLessEqual(pages, 4)
+        self.assertEqual(dict(self.repo.iter_urls(2)), dict(seen))
+
+    def test_list_user_urls_newest_first(self):
+        self.repo.put_urls([url_entry(f"shorturl{i:02}", minutes=i) for i in range(5)]
+                           + [url_entry("otheruser1", user_id="testuser2")])
+        pairs, last_key = self.repo.list_user_urls("testuser1", 3)
+        self.assertEqual([short_url for short_url, _ in pairs], ["shorturl04", "shorturl03", "shorturl02"])
+        self.assertIsNotNone(last_key)
+        pairs, last_key = self.repo.list_user_urls("testuser1", 3, last_key)
+        self.assertEqual([short_url for short_url, _ in pairs], ["shorturl01", "shorturl00"])
+        self.assertIsNone(last_key)
+        self.assertEqual({short_url for short_url, _ in self.repo.iter_user_urls("testuser1")},
+                         {f"shorturl{i:02}" for i in range(5)})
+
+    def test_users(self):
+        self.assertIsNone(self.repo.get_user("missinguser"))
+        user = self.repo.get_user("testuser1")
+        self.assertIsInstance(user, UserEntry)
+        self.assertEqual((user.hashed_password, user.url_limit, user.is_admin), ("fakehash", 2, False))
+        self.repo.update_user(user, url_limit=10, hashed_password="newhash")
+        self.assertEqual(user.url_limit, 10)
+        stored = self.repo.get_user("testuser1")
+        self.assertEqual((stored.url_limit, stored.hashed_password), (10, "newhash"))
+
+    def test_add_url_count(self):
+        self.assertTrue(self.repo.add_url_count("testuser1", 5, expected_count=0))
+        self.assertFalse(self.repo.add_url_count("testuser1", 5, expected_count=0))
+        self.assertTrue(self.repo.add_url_count("testuser1", -2))
+        self.assertEqual(self.repo.get_user("testuser1").url_count, 3)
+
+    def test_increment_counter(self):
+        self.assertEqual(self.repo.increment_counter("short_url", 1000), 1000)
+        self.assertEqual(self.repo.increment_counter("short_url", 1000), 2000)
+        self.assertEqual(self.repo.increment_counter("other", 5), 5)
+
+    def test_click_counts(self):
+        counts = {("shorturl01", "minute#2024-01-01T00:00"): 3, ("shorturl01", "referrer#direct"): 3,
+                  ("shorturl02", "minute#2024-01-01T00:00"): 1}
+        self.assertEqual(self.repo.add_click_counts(counts), {})
+        self.assertEqual(self.repo.add_click_counts({("shorturl01", "minute#2024-01-01T00:00"): 2}), {})
+        self.assertEqual(self.repo.get_click_counts("shorturl01"),
+                         {"minute#2024-01-01T00:00": 5, "referrer#direct": 3})
+        self.assertEqual(self.repo.get_click_counts("shorturl01", "minute#"), {"minute#2024-01-01T00:00": 5})
+        self.assertEqual(self.repo.get_click_counts("missingurl"), {})
+
+    def test_click_count_ranges(self):
+        self.repo.add_click_counts({("shorturl01", f"day#2024-01-{day:02}"): day for day in range(1, 8)}
+                                   | {("shorturl01", "dayz"): 1, ("shorturl01", "total"): 28})
+        self.assertEqual(self.repo.get_click_counts("shorturl01", "day#", "2024-01-03", "2024-01-05"),
+                         {"day#2024-01-03": 3, "day#2024-01-04": 4, "day#2024-01-05": 5})
+        self.assertEqual(list(self.repo.get_click_counts("shorturl01", "day#", "2024-01-06")), ["day#2024-01-06", "day#2024-01-07"])
+        self.assertEqual(len(self.repo.get_click_counts("shorturl01", "day#", limit=2)), 2)
+        self.assertEqual(self.repo.batch_get_click_counts([("shorturl01", "total"), ("shorturl01", "day#2024-01-02"),
+                                                           ("shorturl02", "total")]),
+                         {("shorturl01", "total"): 28, ("shorturl01", "day#2024-01-02"): 2})
+
+    def test_get_url(self):
+        self.repo.put_urls([url_entry("shorturl01", minutes=5)])
+        entry = self.repo.get_url("shorturl01")
+        self.assertEqual((entry.original_url, entry.user_id, entry.created_at),
+                         ("https://shorturl01.com", "testuser1", START + timedelta(minutes=5)))
+        self.assertIsNone(self.repo.get_url("missingurl"))
+
+
+class TestInMemoryRepository(RepositoryContract, unittest.TestCase):
+
+    def make_repository(self):
+        return InMemoryRepository()
+
+    def test_invalid_last_key(self):
+        with self.assertRaises(InvalidCursorError):
+            self.repo.list_user_urls("testuser1", 10, {"short_url": 5})
+
+
+class TestSQLiteRepository(RepositoryContract, unittest.TestCase):
+
+    def make_repository(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        repo = SQLiteRepository(os.path.join(directory.name, "urls.db"))
+        self.addCleanup(repo.close)
+        return repo
+
+    def test_wal_mode(self):
+        self.assertEqual(self.repo._connection().execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_invalid_last_key(self):
+        with self.assertRaises(InvalidCursorError):
+            self.repo.list_urls(10, {"created_at": "x"})
+
+
+class TestDynamoDBRepository(RepositoryContract, unittest.TestCase):
+
+    def make_repository(self):
+        fake_dynamodb.install()
+        self.addCleanup(reset_clients)
+        return DynamoDBRepository()
+
+    def test_invalid_last_key(self):
+        valid = {"short_url": {"S": "shorturl01"}, "user_id": {"S": "testuser1"}, "created_at": {"S": "2024-01-01T00:00:00.000000+0000"}}
+        for last_key in ({"short_url": "shorturl01"}, {**valid, "user_id": {"S": "testuser2"}}, {**valid, "extra": {"S": "x"}},
+                         {**valid, "created_at": {"N": "5"}}):
+            with self.subTest(last_key=last_key), self.assertRaises(InvalidCursorError):
+                self.repo.list_user_urls("testuser1", 10, last_key)
+        with self.assertRaises(InvalidCursorError):
+            self.repo.list_urls(10, {"short_url": {"S": ["shorturl01"]}})
+
+
+class TestServiceOnInMemoryRepository(unittest.TestCase):
+    #the service layer runs end to end on the in-memory engine without patching models
+
+    def setUp(self):
+        previous = get_repository() if repository._repository is not None else None
+        self.addCleanup(set_repository, previous)
+        self.repo = InMemoryRepository()
+        set_repository(self.repo)
+        self.repo.create_user(UserEntry(user_id="testuser1", hashed_password="fakehash", url_limit=3))
+        url_cache.clear()
+        principal_cache.clear()
+        self.addCleanup(url_cache.clear)
+        self.addCleanup(principal_cache.clear)
+
+    def test_create_resolve_and_delete(self):
+        short_url = generate_short_url("https://example.com", "testuser1")
+        custom_url = generate_short_url("https://example.com/custom", "testuser1", "customurl01")
+        self.assertEqual(get_original_url(short_url), "https://example.com/")
+        url_cache.clear()
+        self.assertEqual(get_original_url(custom_url), "https://example.com/custom")
+        pairs, cursor = get_user_url_page("testuser1", 10)
+        self.assertEqual(set(pairs), {short_url, custom_url})
+        self.assertIsNone(cursor)
+        delete_url(short_url)
+        with self.assertRaises(ValueError):
+            get_original_url(short_url)
+
+    def test_quota(self):
+        self.assertEqual(reserve_url_quota("testuser1", 5), 3)
+        self.assertEqual(reserve_url_quota("testuser1", 1), 0)
+
+    def test_quota_contention_is_reported_after_backoff(self):
+        #every conditional increment loses the race
+        with patch.object(self.repo, "add_url_count", return_value=False) as mock_add, \
+                patch.object(self.repo, "get_user", wraps=self.repo.get_user) as mock_get, \
+                patch("service.url_service.time.sleep") as mock_sleep:
+            with self.assertRaises(QuotaContentionError):
+                reserve_url_quota("testuser1", 1)
+        self.assertEqual(mock_add.call_count, QUOTA_RESERVE_ATTEMPTS)
+        self.assertEqual(mock_sleep.call_count, QUOTA_RESERVE_ATTEMPTS - 1)
+        for call in mock_get.call_args_list:
+            self.assertTrue(call.kwargs["consistent_read"])
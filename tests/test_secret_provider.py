@@ -0,0 +1,161 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+from jose import jwt
+from models.pynamodb_model import UserEntry
+from service.aws_clients import reset_clients
+from service.exceptions import SecretUnavailableError
+from service.secret_provider import EnvSecretProvider, SecretProvider, SecretsManagerSecretProvider
+from service.utils import *
+
+
+class StaticSecretProvider(SecretProvider):
+    #returns whatever keys the test sets, counting loads
+    def __init__(self, keys, refresh_seconds=300):
+        super().__init__(refresh_seconds)
+        self.keys = keys
+        self.loads = 0
+
+    def load_keys(self):
+        self.loads += 1
+        if isinstance(self.keys, Exception):
+            raise self.keys
+        return self.keys
+
+
+def secret_value(key):
+    return {"SecretString": '{"JWT_SECRET_KEY": "%s"}' % key}
+
+
+class TestSecretProvider(unittest.TestCase):
+
+    def test_keys_are_loaded_lazily_and_cached(self):
+        provider = StaticSecretProvider(["key1"])
+        self.assertEqual(provider.loads, 0)
+        self.assertIsNone(provider.cached_keys())
+        self.assertEqual(provider.current_key(), "key1")
+        self.assertEqual(provider.get_keys(), ["key1"])
+        self.assertEqual(provider.loads, 1)
+
+    @patch("service.secret_provider.time.monotonic")
+    def test_keys_are_refreshed_after_interval(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        provider = StaticSecretProvider(["key1"], refresh_seconds=60)
+        provider.get_keys()
+        provider.keys = ["key2", "key1"]
+        mock_monotonic.return_value = 159
+        self.assertEqual(provider.current_key(), "key1")
+        mock_monotonic.return_value = 161
+        self.assertEqual(provider.get_keys(), ["key2", "key1"])
+        self.assertEqual(provider.loads, 2)
+
+    @patch("service.secret_provider.time.monotonic")
+    def test_failed_refresh_keeps_cached_keys(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        provider = StaticSecretProvider(["key1"], refresh_seconds=60)
+        provider.get_keys()
+        provider.keys = RuntimeError("throttled")
+        mock_monotonic.return_value = 200
+        with self.assertLogs("secret_provider", "WARNING") as logs:
+            self.assertEqual(provider.get_keys(), ["key1"])
+        self.assertIn("throttled", logs.output[0])
+
+    def test_first_load_failure_raises(self):
+        provider = StaticSecretProvider(RuntimeError("unreachable"))
+        with self.assertRaises(SecretUnavailableError):
+            provider.get_keys()
+        with self.assertRaises(SecretUnavailableError):
+            StaticSecretProvider([None]).get_keys()
+
+    def test_secrets_manager_reads_current_and_previous(self):
+        provider = SecretsManagerSecretProvider("test/secret", "us-east-2")
+        client = MagicMock()
+        client.get_secret_value.side_effect = lambda SecretId, VersionStage: secret_value(
+            "new" if VersionStage == "AWSCURRENT" else "old")
+        with patch("service.secret_provider.get_client", return_value=client):
+            self.assertEqual(provider.get_keys(), ["new", "old"])
+
+    def test_secrets_manager_without_previous_version(self):
+        provider = SecretsManagerSecretProvider("test/secret", "us-east-2")
+        client = MagicMock()
+        not_found = ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": ""}}, "GetSecretValue")
+        client.get_secret_value.side_effect = [secret_value("new"), not_found]
+        with patch("service.secret_provider.get_client", return_value=client):
+            self.assertEqual(provider.get_keys(), ["new"])
+
+    @patch("service.secret_provider.get_client")
+    def test_secrets_manager_client_is_created_on_first_use(self, mock_get_client):
+        provider = SecretsManagerSecretProvider("test/secret", "us-east-2")
+        mock_get_client.assert_not_called()
+        mock_get_client.return_value.get_secret_value.return_value = secret_value("new")
+        self.assertEqual(provider.current_key(), "new")
+        mock_get_client.assert_called_with("secretsmanager", "us-east-2")
+
+    def test_secrets_manager_client_is_not_kept_across_reset(self):
+        #a gunicorn worker resets the clients it inherited from the master after forking
+        provider = SecretsManagerSecretProvider("test/secret", "us-east-2")
+        with patch.dict("os.environ", {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}):
+            inherited = provider._get_client()
+            reset_clients()
+            self.addCleanup(reset_clients)
+            self.assertIsNot(provider._get_client(), inherited)
+
+    @patch.dict("os.environ", {"JWT_SECRET_KEY": "envkey", "JWT_PREVIOUS_SECRET_KEY": "oldkey"})
+    def test_env_provider(self):
+        self.assertEqual(EnvSecretProvider().get_keys(), ["envkey", "oldkey"])
+
+    def test_env_provider_reads_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "jwt_secret")
+            with open(path, "w") as f:
+                f.write("filekey\n")
+            with patch.dict("os.environ", {"JWT_SECRET_FILE": path}):
+                self.assertEqual(EnvSecretProvider().get_keys(), ["filekey"])
+
+
+class TestTokenRotation(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = StaticSecretProvider(["old"])
+        secret_patch = patch("service.utils.get_secret_provider", return_value=self.provider)
+        secret_patch.start()
+        self.addCleanup(secret_patch.stop)
+        principal_cache.clear()
+
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_previous_key_accepted_during_rotation(self, mock_user_get):
+        mock_user_get.return_value = UserEntry(user_id="testuser1", is_admin=False, url_count=3, url_limit=30, hashed_password="fakehash")
+        token = create_access_token(data={"sub": "testuser1"}, expires_delta=timedelta(minutes=5))
+
+        self.provider.keys = ["new", "old"]
+        self.provider.invalidate()
+        self.assertEqual(asyncio.run(get_current_user(token)).user_id, "testuser1")
+        #new tokens are signed with the current key
+        new_token = asyncio.run(create_access_token_async(data={"sub": "testuser1"}, expires_delta=timedelta(minutes=5)))
+        self.assertEqual(jwt.decode(new_token, "new", algorithms=[ALGORITHM])["sub"], "testuser1")
+
+        #once the old key is retired its tokens are rejected
+        self.provider.keys = ["new"]
+        self.provider.invalidate()
+        principal_cache.clear()
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(get_current_user(token))
+        self.assertEqual(context.exception.status_code, 401)
+
+    def test_expired_token_is_not_retried_with_other_keys(self):
+        self.provider.keys = ["new", "old"]
+        token = create_access_token(data={"sub": "testuser1"}, expires_delta=timedelta(minutes=-1))
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(get_current_user(token))
+        self.assertEqual(context.exception.detail, "Token has expired")
+
+    def test_unavailable_secret_is_503(self):
+        self.provider.keys = RuntimeError("unreachable")
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(get_current_user("token"))
+        self.assertEqual(context.exception.status_code, 503)
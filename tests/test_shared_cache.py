@@ -0,0 +1,155 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+from models.pynamodb_model import UrlEntry, UserEntry
+from service import repository
+from service.cache import NOT_FOUND, TTLCache, principal_cache, url_cache
+from service.repository import InMemoryRepository, get_repository, set_repository
+from service.shared_cache import (CacheBackend, InMemoryCacheBackend, SharedCacheTier, decode_principal, encode_principal,
+                                  set_cache_backend, start_invalidation_listener)
+from service.url_service import delete_url, get_original_url_async, get_original_urls
+from service.utils import load_user
+
+
+class CountingRepository(InMemoryRepository):
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get_original_url(self, short_url):
+        self.reads += 1
+        return super().get_original_url(short_url)
+
+    def batch_get_original_urls(self, short_urls):
+        self.reads += 1
+        return super().batch_get_original_urls(short_urls)
+
+    def get_user(self, user_id, consistent_read=False):
+        self.reads += 1
+        return super().get_user(user_id, consistent_read)
+
+
+class BrokenBackend(CacheBackend):
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_many(self, keys):
+        self.calls += 1
+        raise ConnectionError("connection refused")
+
+
+class TestSharedCacheTier(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = InMemoryCacheBackend()
+        #two nodes, each with its own local cache, sharing one backend
+        self.local_a = TTLCache(maxsize=10, ttl=60)
+        self.local_b = TTLCache(maxsize=10, ttl=60)
+        self.tier_a = SharedCacheTier("url", self.local_a, ttl=60, negative_ttl=5, backend=self.backend)
+        self.tier_b = SharedCacheTier("url", self.local_b, ttl=60, negative_ttl=5, backend=self.backend)
+        self.tier_a.listen()
+        self.tier_b.listen()
+
+    def test_values_and_misses_are_shared(self):
+        self.tier_a.set_many({"short1": "https://example1.com", "missing": NOT_FOUND})
+        self.assertEqual(self.tier_b.get_many(["short1", "missing", "other"]), {"short1": "https://example1.com", "missing": NOT_FOUND})
+        self.assertEqual((self.tier_b.hits, self.tier_b.misses), (2, 1))
+
+    @patch("service.shared_cache.time.monotonic")
+    def test_misses_use_the_negative_ttl(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.tier_a.set_many({"short1": "https://example1.com", "missing": NOT_FOUND})
+        mock_monotonic.return_value = 110
+        self.assertEqual(self.tier_b.get_many(["short1", "missing"]), {"short1": "https://example1.com"})
+
+    def test_invalidate_reaches_every_node(self):
+        self.tier_a.set("short1", "https://example1.com")
+        for local in (self.local_a, self.local_b):
+            local.set("short1", "https://example1.com")
+        self.tier_a.invalidate("short1")
+        self.assertIsNone(self.local_a.get("short1"))
+        self.assertIsNone(self.local_b.get("short1"))
+        self.assertIsNone(self.tier_b.get("short1"))
+        self.assertEqual(self.tier_b.invalidations_received, 1)
+
+    @patch("service.shared_cache.time.monotonic")
+    def test_read_from_before_a_delete_is_not_shared(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        tier = SharedCacheTier("url", self.local_a, ttl=3600, backend=self.backend, tombstone_seconds=30)
+        #node a read the link from the database, then node b deleted it before a wrote it back
+        tier.invalidate("short1")
+        tier.set("short1", "https://example1.com")
+        self.assertIsNone(self.tier_b.get("short1"))
+        #once the tombstone is gone, reads fill the key again
+        mock_monotonic.return_value = 131
+        tier.set("short1", "https://example2.com")
+        tier.set("short1", "https://example3.com")
+        self.assertEqual(self.tier_b.get("short1"), "https://example2.com")
+
+    def test_other_namespaces_and_bad_messages_are_ignored(self):
+        self.local_a.set("short1", "https://example1.com")
+        self.tier_a.handle_message(json.dumps(["principal", "short1"]))
+        with self.assertLogs("shared_cache", "WARNING"):
+            self.tier_a.handle_message("not json")
+        self.assertEqual(self.local_a.get("short1"), "https://example1.com")
+
+    def test_failing_backend_is_a_miss_and_skipped(self):
+        backend = BrokenBackend()
+        tier = SharedCacheTier("url", self.local_a, ttl=60, backend=backend, retry_seconds=60)
+        with self.assertLogs("shared_cache", "WARNING"):
+            self.assertIsNone(tier.get("short1"))
+        self.assertIsNone(tier.get("short1"))
+        self.assertEqual((backend.calls, tier.errors), (1, 1))
+
+    def test_principal_round_trip_leaves_out_the_password_hash(self):
+        user = UserEntry(user_id="testuser1", hashed_password="$2b$12$secret", is_admin=True, url_limit=20, url_count=3)
+        self.assertNotIn("secret", encode_principal(user))
+        decoded = decode_principal(encode_principal(user))
+        self.assertEqual((decoded.user_id, decoded.is_admin, decoded.url_limit, decoded.url_count), ("testuser1", True, 20, 3))
+        self.assertIsNone(decoded.hashed_password)
+
+
+class TestSharedResolution(unittest.TestCase):
+
+    def setUp(self):
+        previous = get_repository() if repository._repository is not None else None
+        self.addCleanup(set_repository, previous)
+        self.repo = CountingRepository()
+        set_repository(self.repo)
+        self.repo.create_user(UserEntry(user_id="testuser1", hashed_password="hash", is_admin=False, url_limit=20, url_count=0))
+        self.repo.create_url(UrlEntry(short_url="shorturl01", original_url="https://example.com/a", user_id="testuser1"))
+        self.backend = InMemoryCacheBackend()
+        set_cache_backend(self.backend)
+        self.addCleanup(set_cache_backend, None)
+        start_invalidation_listener()
+        for cache in (url_cache, principal_cache):
+            cache.clear()
+            self.addCleanup(cache.clear)
+        self.repo.reads = 0
+
+    def test_other_workers_resolve_from_the_shared_cache(self):
+        self.assertEqual(asyncio.run(get_original_url_async("shorturl01")), "https://example.com/a")
+        #another worker starts with an empty local cache
+        url_cache.clear()
+        self.assertEqual(asyncio.run(get_original_url_async("shorturl01")), "https://example.com/a")
+        self.assertEqual(get_original_urls(["shorturl01", "missing01"]), {"shorturl01": "https://example.com/a", "missing01": None})
+        url_cache.clear()
+        self.assertEqual(get_original_urls(["shorturl01", "missing01"]), {"shorturl01": "https://example.com/a", "missing01": None})
+        #one single read and one batch read for the miss
+        self.assertEqual(self.repo.reads, 2)
+
+    def test_delete_is_seen_by_every_worker(self):
+        asyncio.run(get_original_url_async("shorturl01"))
+        delete_url("shorturl01")
+        self.assertIsNone(url_cache.get("shorturl01"))
+        with self.assertRaises(ValueError):
+            asyncio.run(get_original_url_async("shorturl01"))
+
+    def test_principals_are_shared(self):
+        load_user("testuser1")
+        principal_cache.clear()
+        self.assertEqual(load_user("testuser1").url_limit, 20)
+        self.assertEqual(self.repo.reads, 1)
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from models.pynamodb_model import UrlEntry
+from service.cache import TTLCache
+from service.repository import InMemoryRepository
+from service.singleflight import SingleFlight
+from service.url_service import get_original_url, get_original_url_async
+
+
+class SlowRepository(InMemoryRepository):
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.release = threading.Event()
+
+    def get_original_url(self, short_url):
+        self.reads += 1
+        self.release.wait(5)
+        return super().get_original_url(short_url)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_threads_share_one_call(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fetch(key):
+            calls.append(key)
+            release.wait(5)
+            return key.upper()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", fetch, "key"))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        #wait until every follower has joined the leader's flight
+        while flight.coalesced < 4:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((calls, results), (["key"], ["KEY"] * 5))
+        self.assertEqual(flight.stats(), {"in_flight": 0, "flights": 1, "coalesced": 4, "failed": 0})
+        #finished flights are not cached
+        flight.do("key", fetch, "key")
+        self.assertEqual(len(calls), 2)
+
+    def test_error_is_shared_and_not_cached(self):
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("database unavailable")
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do_async("key", fail) for _ in range(3)), return_exceptions=True)
+
+        errors = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertEqual((flight.flights, flight.coalesced, flight.failed), (1, 2, 1))
+        with self.assertRaises(ValueError):
+            asyncio.run(flight.do_async("key", fail))
+        self.assertEqual(flight.flights, 2)
+
+    def test_cancelled_caller_does_not_cancel_the_flight(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            first = asyncio.create_task(flight.do_async("key", fetch))
+            second = asyncio.create_task(flight.do_async("key", fetch))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), "done")
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+class TestUrlFetchCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = SlowRepository()
+        self.repo.put_urls([UrlEntry(short_url="viralurl01", original_url="https://example.com/viral", user_id="testuser1")])
+        #every value is stale as soon as it is set
+        self.cache = TTLCache(maxsize=10, ttl=0, stale_ttl=60)
+        self.flight = SingleFlight()
+        for target, replacement in (("service.url_service.url_cache", self.cache), ("service.url_service.url_fetches", self.flight),
+                                    ("service.url_service.get_repository", lambda: self.repo)):
+            patcher = patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_concurrent_async_misses_read_once(self):
+        async def scenario():
+            lookups = [asyncio.create_task(get_original_url_async("viralurl01")) for _ in range(20)]
+            await asyncio.sleep(0.01)
+            self.repo.release.set()
+            return await asyncio.gather(*lookups)
+
+        self.assertEqual(asyncio.run(scenario()), ["https://example.com/viral"] * 20)
+        self.assertEqual(self.repo.reads, 1)
+        self.assertEqual(self.flight.coalesced, 19)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        self.cache.set("viralurl01", "https://example.com/old")
+
+        async def scenario():
+            stale = await get_original_url_async("viralurl01")
+            again = await get_original_url_async("viralurl01")
+            #one background read for both stale hits
+            self.assertEqual(self.flight.flights, 1)
+            self.repo.release.set()
+            while self.flight.stats()["in_flight"]:
+                await asyncio.sleep(0.001)
+            return stale, again
+
+        self.assertEqual(asyncio.run(scenario()), ("https://example.com/old", "https://example.com/old"))
+        self.assertEqual(self.repo.reads, 1)
+        self.assertEqual(self.cache.get_stale("viralurl01"), ("https://example.com/viral", True))
+        self.assertEqual(self.cache.stale_hits, 3)
+
+    def test_stale_value_is_refreshed_in_the_pool_off_the_loop(self):
+        self.cache.set("viralurl01", "https://example.com/old")
+        self.repo.release.set()
+        self.assertEqual(get_original_url("viralurl01"), "https://example.com/old")
+        for _ in range(500):
+            if self.repo.reads and not self.flight.in_flight("viralurl01"):
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(self.cache.get_stale("viralurl01"), ("https://example.com/viral", True))
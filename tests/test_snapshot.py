@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from service.cache import url_cache
+from service.exceptions import SnapshotFormatError
+from service.snapshot import RedirectSnapshot, SnapshotResolver, build_snapshot
+from service.url_service import get_original_url, get_original_urls
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "redirects.snap")
+
+
+class TestRedirectSnapshot(SnapshotTestCase):
+
+    def test_lookup(self):
+        pairs = {f"shorturl{i:04}": f"https://example.com/{i}" for i in range(1000)}
+        pairs["ünïcødeurl1"] = "https://example.com/ü"
+        self.assertEqual(build_snapshot(self.path, pairs.items()), 1001)
+        snapshot = RedirectSnapshot(self.path)
+        self.assertEqual(len(snapshot), 1001)
+        for short_url, original_url in pairs.items():
+            self.assertEqual(snapshot.get(short_url), original_url)
+        self.assertIsNone(snapshot.get("missingurl1"))
+        self.assertIsNone(snapshot.get(""))
+
+    def test_records_are_sorted(self):
+        build_snapshot(self.path, [("shortb", "https://b.com"), ("shorta", "https://a.com"), ("shortc", "https://c.com")])
+        self.assertEqual(list(RedirectSnapshot(self.path)),
+                         [("shorta", "https://a.com"), ("shortb", "https://b.com"), ("shortc", "https://c.com")])
+
+    def test_empty_snapshot(self):
+        build_snapshot(self.path, [])
+        snapshot = RedirectSnapshot(self.path)
+        self.assertEqual(len(snapshot), 0)
+        self.assertIsNone(snapshot.get("shorturl01"))
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot" * 10)
+        with self.assertRaises(SnapshotFormatError):
+            RedirectSnapshot(self.path)
+        build_snapshot(self.path, [("shorturl01", "https://example.com")])
+        with open(self.path, "r+b") as f:
+            f.truncate(70)
+        with self.assertRaises(SnapshotFormatError):
+            RedirectSnapshot(self.path)
+
+    def test_failed_build_keeps_previous_file(self):
+        build_snapshot(self.path, [("shorturl01", "https://example.com")])
+        with self.assertRaises(AttributeError):
+            build_snapshot(self.path, [("shorturl02", None)])
+        self.assertEqual(RedirectSnapshot(self.path).get("shorturl01"), "https://example.com")
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["redirects.snap"])
+
+
+class TestSnapshotResolver(SnapshotTestCase):
+
+    def test_missing_file(self):
+        resolver = SnapshotResolver(self.path, reload_seconds=0)
+        self.assertIsNone(resolver.current())
+        self.assertIsNone(resolver.get("shorturl01"))
+
+    def test_picks_up_replaced_snapshot(self):
+        build_snapshot(self.path, [("shorturl01", "https://old.com")])
+        resolver = SnapshotResolver(self.path, reload_seconds=0)
+        old = resolver.current()
+        self.assertEqual(resolver.get("shorturl01"), "https://old.com")
+        build_snapshot(self.path, [("shorturl01", "https://new.com"), ("shorturl02", "https://two.com")])
+        self.assertEqual(resolver.get("shorturl01"), "https://new.com")
+        self.assertEqual(resolver.get("shorturl02"), "https://two.com")
+        #a reader still holding the old mapping keeps working
+        self.assertEqual(old.get("shorturl01"), "https://old.com")
+
+    def test_reload_is_throttled(self):
+        build_snapshot(self.path, [("shorturl01", "https://old.com")])
+        resolver = SnapshotResolver(self.path, reload_seconds=3600)
+        self.assertEqual(resolver.get("shorturl01"), "https://old.com")
+        build_snapshot(self.path, [("shorturl01", "https://new.com")])
+        self.assertEqual(resolver.get("shorturl01"), "https://old.com")
+        self.assertTrue(resolver.reload())
+        self.assertEqual(resolver.get("shorturl01"), "https://new.com")
+
+    def test_bad_replacement_keeps_serving_previous(self):
+        build_snapshot(self.path, [("shorturl01", "https://old.com")])
+        resolver = SnapshotResolver(self.path, reload_seconds=0)
+        resolver.current()
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(b"garbage")
+        os.replace(self.path + ".tmp", self.path)
+        self.assertEqual(resolver.get("shorturl01"), "https://old.com")
+
+
+class TestSnapshotMode(SnapshotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        build_snapshot(self.path, [("shorturl01", "https://example.com/1")])
+        resolver_patch = patch("service.url_service.get_snapshot_resolver", return_value=SnapshotResolver(self.path))
+        resolver_patch.start()
+        self.addCleanup(resolver_patch.stop)
+        url_cache.clear()
+        self.addCleanup(url_cache.clear)
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_served_from_snapshot(self, mock_get):
+        self.assertEqual(get_original_url("shorturl01"), "https://example.com/1")
+        mock_get.assert_not_called()
+        self.assertEqual(len(url_cache), 0)
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_miss_falls_back_to_database(self, mock_get):
+        mock_get.return_value.original_url = "https://example.com/new"
+        self.assertEqual(get_original_url("shorturl02"), "https://example.com/new")
+        mock_get.assert_called_once_with("shorturl02")
+
+    @patch("service.url_service.REDIRECT_SNAPSHOT_FALLBACK", False)
+    @patch("models.pynamodb_model.UrlEntry.batch_get")
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_miss_without_fallback(self, mock_get, mock_batch_get):
+        with self.assertRaises(ValueError):
+            get_original_url("shorturl02")
+        self.assertEqual(get_original_urls(["shorturl01", "shorturl02"]),
+                         {"shorturl01": "https://example.com/1", "shorturl02": None})
+        mock_get.assert_not_called()
+        mock_batch_get.assert_not_called()
@@ -0,0 +1,150 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from models.pynamodb_model import UrlEntry, UserEntry
+from service import repository
+from service.analytics import ClickAnalytics
+from service.exceptions import InvalidStatsRangeError
+from service.repository import InMemoryRepository, get_repository, set_repository
+from service.stats import default_start, get_link_stats, get_top_urls, period_count, periods
+from service.utils import get_current_user
+from main import app
+import asyncio
+
+client = TestClient(app)
+
+OWNER = UserEntry(user_id="testuser1", is_admin=False, hashed_password="fakehash")
+OTHER = UserEntry(user_id="testuser2", is_admin=False, hashed_password="fakehash")
+ADMIN = UserEntry(user_id="adminuser", is_admin=True, hashed_password="fakehash")
+
+# 2024-01-31 23:59 UTC, in whole minutes since the epoch
+END_OF_JANUARY = 28445759
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestPeriods(unittest.TestCase):
+
+    def test_periods_cross_month_and_year_ends(self):
+        self.assertEqual(periods(utc(2023, 11, 15), utc(2024, 2, 1), "month"),
+                         [utc(2023, 11, 1), utc(2023, 12, 1), utc(2024, 1, 1), utc(2024, 2, 1)])
+        self.assertEqual(len(periods(utc(2024, 1, 1, 22, 30), utc(2024, 1, 2, 1, 5), "hour")), 4)
+        self.assertEqual(period_count(utc(2023, 11, 1), utc(2024, 2, 1), "month"), 4)
+        self.assertEqual(period_count(utc(2024, 1, 1), utc(2024, 1, 31), "day"), 31)
+
+    def test_default_window(self):
+        self.assertEqual(default_start(utc(2024, 3, 10, 12), "day"), utc(2024, 2, 10))
+        self.assertEqual(default_start(utc(2024, 3, 10, 12), "month"), utc(2023, 4, 1))
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        previous = get_repository() if repository._repository is not None else None
+        self.addCleanup(set_repository, previous)
+        self.repo = InMemoryRepository()
+        set_repository(self.repo)
+        for user in (OWNER, OTHER):
+            self.repo.create_user(UserEntry(user_id=user.user_id, hashed_password="fakehash"))
+        self.repo.put_urls([UrlEntry(short_url=f"shorturl0{i}", original_url=f"https://example.com/{i}", user_id="testuser1")
+                            for i in range(1, 4)])
+        self.repo.put_urls([UrlEntry(short_url="otherurl01", original_url="https://example.com/other", user_id="testuser2")])
+        #clicks go through the real pipeline so the stats read what it writes
+        analytics = ClickAnalytics(max_queue=1000, aggregate_seconds=1, flush_seconds=1)
+        clicks = [("shorturl01", END_OF_JANUARY - 60 * 24, "https://news.example.com/a"),
+                  ("shorturl01", END_OF_JANUARY, "https://news.example.com/b"),
+                  ("shorturl01", END_OF_JANUARY, None),
+                  ("shorturl02", END_OF_JANUARY + 1, None),
+                  ("otherurl01", END_OF_JANUARY, None)]
+        for short_url, minute, referrer in clicks:
+            with patch("service.analytics.time.time", return_value=minute * 60):
+                analytics.record(short_url, referrer, "Mozilla/5.0 (Windows NT 10.0)")
+        asyncio.run(analytics.flush())
+
+
+class TestLinkStats(StatsTestCase):
+
+    def test_daily_series_is_zero_filled(self):
+        stats = get_link_stats("shorturl01", OWNER, "day", utc(2024, 1, 29), utc(2024, 2, 1, 12))
+        self.assertEqual(stats["series"], [{"period": "2024-01-29", "clicks": 0}, {"period": "2024-01-30", "clicks": 1},
+                                           {"period": "2024-01-31", "clicks": 2}, {"period": "2024-02-01", "clicks": 0}])
+        self.assertEqual((stats["total_clicks"], stats["range_clicks"]), (3, 3))
+        self.assertEqual(stats["referrers"], {"news.example.com": 2, "direct": 1})
+        self.assertEqual(stats["agents"], {"desktop": 3})
+        self.assertEqual((stats["start"], stats["end"]), (utc(2024, 1, 29), utc(2024, 2, 1)))
+
+    def test_range_filters_series_not_total(self):
+        stats = get_link_stats("shorturl01", OWNER, "hour", utc(2024, 1, 31, 23), utc(2024, 1, 31, 23, 59))
+        self.assertEqual(stats["series"], [{"period": "2024-01-31T23", "clicks": 2}])
+        self.assertEqual((stats["total_clicks"], stats["range_clicks"]), (3, 2))
+        monthly = get_link_stats("shorturl02", OWNER, "month", utc(2024, 1, 1), utc(2024, 2, 1))
+        self.assertEqual(monthly["series"], [{"period": "2024-01", "clicks": 0}, {"period": "2024-02", "clicks": 1}])
+
+    def test_only_owner_or_admin(self):
+        with self.assertRaises(ValueError):
+            get_link_stats("shorturl01", OTHER)
+        with self.assertRaises(ValueError):
+            get_link_stats("missingurl", ADMIN)
+        self.assertEqual(get_link_stats("shorturl01", ADMIN)["total_clicks"], 3)
+
+    def test_invalid_ranges(self):
+        with self.assertRaises(InvalidStatsRangeError):
+            get_link_stats("shorturl01", OWNER, "day", utc(2024, 2, 1), utc(2024, 1, 1))
+        with self.assertRaises(InvalidStatsRangeError):
+            get_link_stats("shorturl01", OWNER, "minute", utc(2024, 1, 1), utc(2024, 2, 1))
+        with self.assertRaises(InvalidStatsRangeError):
+            get_link_stats("shorturl01", OWNER, "week")
+
+
+class TestTopUrls(StatsTestCase):
+
+    def test_ranked_by_total(self):
+        self.assertEqual(get_top_urls("testuser1", 2), [
+            {"short_url": "shorturl01", "original_url": "https://example.com/1", "clicks": 3},
+            {"short_url": "shorturl02", "original_url": "https://example.com/2", "clicks": 1}])
+        self.assertEqual([url["clicks"] for url in get_top_urls("testuser1")], [3, 1, 0])
+
+    @patch("service.stats.TOP_URLS_CANDIDATES", 2)
+    def test_ranks_only_the_newest_links(self):
+        self.repo.put_urls([UrlEntry(short_url="newurl01", original_url="https://example.com/new", user_id="testuser1",
+                                     created_at=utc(2030, 1, 1))])
+        self.assertEqual(len(get_top_urls("testuser1")), 2)
+        self.assertIn("newurl01", [url["short_url"] for url in get_top_urls("testuser1")])
+
+    @patch("service.stats.datetime")
+    def test_ranked_by_period(self, mock_datetime):
+        mock_datetime.now.return_value = utc(2024, 2, 1, 0, 30)
+        self.assertEqual([(url["short_url"], url["clicks"]) for url in get_top_urls("testuser1", 2, "day")],
+                         [("shorturl02", 1), ("shorturl01", 0)])
+        with self.assertRaises(InvalidStatsRangeError):
+            get_top_urls("testuser1", 2, "week")
+
+
+class TestStatsRoutes(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        app.dependency_overrides[get_current_user] = lambda: OWNER
+        self.addCleanup(app.dependency_overrides.pop, get_current_user, None)
+
+    def test_stats(self):
+        response = client.get("/stats/shorturl01", params={"granularity": "day", "start": "2024-01-30T00:00:00Z",
+                                                           "end": "2024-01-31T12:00:00Z"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["series"], [{"period": "2024-01-30", "clicks": 1}, {"period": "2024-01-31", "clicks": 2}])
+        self.assertEqual(data["total_clicks"], 3)
+
+    def test_stats_errors(self):
+        self.assertEqual(client.get("/stats/otherurl01").status_code, 404)
+        self.assertEqual(client.get("/stats/shorturl01", params={"start": "2024-02-01", "end": "2024-01-01"}).status_code, 400)
+        self.assertEqual(client.get("/stats/shorturl01", params={"granularity": "week"}).status_code, 422)
+
+    def test_my_top_urls(self):
+        response = client.get("/my-top-urls", params={"limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"period": "all", "urls": [
+            {"short_url": "shorturl01", "original_url": "https://example.com/1", "clicks": 3}]})
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+import unittest
+from unittest.mock import patch
+from botocore.stub import Stubber
+from fastapi.testclient import TestClient
+from models.pynamodb_model import UrlEntry, UserEntry
+from service.aws_clients import get_dynamodb_client, reset_clients
+from service.hashing import PasswordHasher
+from service.tracing import *
+from service.url_service import *
+from main import app
+
+client = TestClient(app)
+
+
+class TracingTestCase(unittest.TestCase):
+    #turns tracing on with an in-memory exporter for the duration of each test
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        enabled = patch.object(tracer, "enabled", True)
+        exporter = patch.object(tracer, "exporter", self.exporter)
+        enabled.start()
+        exporter.start()
+        self.addCleanup(enabled.stop)
+        self.addCleanup(exporter.stop)
+        url_cache.clear()
+
+    def spans_by_name(self):
+        return {span.name: span for span in self.exporter.get_finished_spans()}
+
+
+class TestTracer(TracingTestCase):
+
+    def test_nested_spans_share_trace(self):
+        with tracer.start_as_current_span("outer") as outer:
+            with tracer.start_as_current_span("inner") as inner:
+                self.assertIs(get_current_span(), inner)
+        self.assertIs(get_current_span(), NOOP_SPAN)
+        self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertIsNone(outer.parent_id)
+        self.assertEqual([span.name for span in self.exporter.get_finished_spans()], ["inner", "outer"])
+
+    def test_exception_marks_span_as_error(self):
+        with self.assertRaises(ValueError):
+            with tracer.start_as_current_span("failing"):
+                raise ValueError("boom")
+        span = self.exporter.get_finished_spans()[0]
+        self.assertEqual(span.status, "ERROR")
+        self.assertEqual(span.events[0]["exception.type"], "ValueError")
+
+    def test_traced_sync_and_async(self):
+        @traced("sync_op")
+        def sync_op():
+            return get_current_span().name
+
+        @traced("async_op")
+        async def async_op():
+            return sync_op()
+
+        self.assertEqual(asyncio.run(async_op()), "sync_op")
+        spans = self.spans_by_name()
+        self.assertEqual(spans["sync_op"].parent_id, spans["async_op"].span_id)
+
+    def test_disabled_tracer_records_nothing(self):
+        with patch.object(tracer, "enabled", False):
+            with tracer.start_as_current_span("ignored") as span:
+                self.assertIs(span, NOOP_SPAN)
+        self.assertEqual(self.exporter.get_finished_spans(), [])
+
+    def test_trace_ids_in_log_records(self):
+        with self.assertLogs("test", level="INFO") as logs:
+            with tracer.start_as_current_span("logged") as span:
+                logging.getLogger("test").info("inside")
+        self.assertEqual(logs.records[0].trace_id, span.trace_id)
+        self.assertEqual(logs.records[0].span_id, span.span_id)
+
+    def test_parse_traceparent(self):
+        self.assertEqual(parse_traceparent("00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"),
+                         ("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331"))
+        self.assertEqual(parse_traceparent("garbage"), (None, None))
+
+
+class TestRequestTracing(TracingTestCase):
+
+    @patch("models.pynamodb_model.UrlEntry.get")
+    def test_route_and_service_spans(self, mock_get):
+        mock_get.return_value = UrlEntry(short_url="short1", original_url="https://example1.com")
+        response = client.get("/r/short1", follow_redirects=False,
+                              headers={"traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"})
+        self.assertEqual(response.headers["x-trace-id"], "0af7651916cd43dd8448eb211c80319c")
+        spans = self.spans_by_name()
+        root = spans["HTTP GET /r/{short_url}"]
+        self.assertEqual(root.parent_id, "b7ad6b7169203331")
+        self.assertEqual(root.attributes["http.status_code"], 307)
+        #the lookup runs in the DB pool but stays in the request's trace
+        self.assertEqual(spans["url_service.fetch_original_url"].trace_id, root.trace_id)
+        self.assertEqual(spans["url_service.get_original_url_async"].parent_id, root.span_id)
+
+    @patch.dict("os.environ", {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"})
+    def test_dynamodb_call_spans(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+        stubber = Stubber(get_dynamodb_client())
+        stubber.add_response("get_item", {"Item": {"short_url": {"S": "short1"}, "original_url": {"S": "https://example1.com"}, "user_id": {"S": "testuser1"}}})
+        with stubber:
+            self.assertEqual(get_original_url("short1"), "https://example1.com")
+        spans = self.spans_by_name()
+        call = spans["dynamodb.GetItem"]
+        self.assertEqual(call.attributes["aws.dynamodb.table_names"], "url-shortener")
+        self.assertEqual(call.parent_id, spans["url_service.fetch_original_url"].span_id)
+
+    def test_bcrypt_spans(self):
+        hasher = PasswordHasher(max_workers=1, max_pending=2)
+        self.addCleanup(hasher.shutdown)
+        with tracer.start_as_current_span("login"):
+            hashed = hasher.hash("Valid!Passw0rd")
+            self.assertTrue(hasher.verify("Valid!Passw0rd", hashed))
+        #spans end in the future's done callback, which can run just after result() returns
+        deadline = time.monotonic() + 2
+        while len(self.exporter.get_finished_spans()) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        spans = self.spans_by_name()
+        self.assertEqual(spans["bcrypt.hash_password"].parent_id, spans["login"].span_id)
+        self.assertIn("bcrypt.check_password", spans)
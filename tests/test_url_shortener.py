@@ -4,8 +4,10 @@ from models.pynamodb_model import UrlEntry
 from models.url_pydantic_models import URLRequest, UserRequest
 from service.url_service import *
 from service.exceptions import *
+from service.repository import InMemoryRepository
 from fastapi.testclient import TestClient
 from pydantic import ValidationError
+from tests.helpers import mock_transaction_cancelled
 
 from main import app
 
@@ -13,45 +15,54 @@ client = TestClient(app)
 
 class TestUrlShortener(unittest.TestCase):
 
+    def setUp(self):
+        url_cache.clear()
+        principal_cache.clear()
+
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get") 
-    def test_generate_short_url(self, mock_user):
+    def test_generate_short_url(self, mock_user, mock_transact):
         mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")  
         short_url = generate_short_url("https://example.com", "test_user", None, 10)
         self.assertIsNotNone(short_url)
         self.assertEqual(len(short_url), 10)
     
-    @patch("models.pynamodb_model.UrlEntry.get")
-    @patch("models.pynamodb_model.UrlEntry.save")
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get") 
-    def test_generate_short_url_no_collision(self, mock_user, mock_save, mock_get):
-        mock_get.side_effect = UrlEntry.DoesNotExist
-        mock_save.return_value = None
+    def test_generate_short_url_no_collision(self, mock_user, mock_transact):
         mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")  
         
         short_url = generate_short_url("https://example.com", "test_user", None, 10)
         self.assertIsNotNone(short_url)
         self.assertEqual(len(short_url), 10)
+        mock_transact.assert_called_once()
         
-    @patch("models.pynamodb_model.UrlEntry.get")
-    @patch("models.pynamodb_model.UrlEntry.save")
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get") 
-    def test_generate_short_url_with_collision(self, mock_user, mock_save, mock_get):
-        #simulate collision with first short url
-        mock_get.side_effect = [UrlEntry(short_url="unique_url", original_url="https://example.com"), UrlEntry.DoesNotExist]
-        mock_save.return_value = None
+    def test_generate_short_url_with_collision(self, mock_user, mock_transact):
+        #simulate collision with first short url: its conditional put fails and a new ID is tried
+        mock_transact.side_effect = [mock_transaction_cancelled("ConditionalCheckFailed", None), None]
         mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")  
         
         short_url = generate_short_url("https://example.com", "test_user", None, 10)
         self.assertIsNotNone(short_url)
         self.assertEqual(len(short_url), 10)
-        self.assertNotEqual(short_url, "unique_url")
-        
-    @patch("models.pynamodb_model.UrlEntry.get")
-    @patch("models.pynamodb_model.UrlEntry.save") 
+        first_attempt = mock_transact.call_args_list[0].kwargs["put_items"][0]["Item"]["short_url"]["S"]
+        self.assertNotEqual(short_url, first_attempt)
+        
+    @patch("pynamodb.connection.Connection.transact_write_items")
+    @patch("models.pynamodb_model.UserEntry.get")
+    def test_generate_short_url_gives_up_after_collisions(self, mock_user, mock_transact):
+        #every generated ID is taken: stop instead of retrying forever
+        mock_transact.side_effect = mock_transaction_cancelled("ConditionalCheckFailed", None)
+        mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")
+        with self.assertRaises(ShortIdUnavailableError):
+            generate_short_url("https://example.com", "test_user", None, 10)
+        self.assertEqual(mock_transact.call_count, GENERATED_ID_ATTEMPTS)
+        
+    @patch("pynamodb.connection.Connection.transact_write_items")
     @patch("models.pynamodb_model.UserEntry.get")   
-    def test_generate_custom_url_no_collision(self,mock_user, mock_save, mock_get):
-        mock_get.side_effect = UrlEntry.DoesNotExist
-        mock_save.return_value = None
+    def test_generate_custom_url_no_collision(self,mock_user, mock_transact):
         mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")  
         
         custom_url = "mycustomurl"             
@@ -59,14 +70,79 @@ class TestUrlShortener(unittest.TestCase):
         self.assertIsNotNone(short_url)            
         self.assertEqual(short_url, custom_url)
     
-    @patch("models.pynamodb_model.UrlEntry.get")  
+    @patch("pynamodb.connection.Connection.transact_write_items")  
     @patch("models.pynamodb_model.UserEntry.get")      
-    def test_generate_custom_url_with_collision(self, mock_user, mock_get):
-        mock_get.return_value = UrlEntry(short_url="mycustomurl", original_url="https://example.com")
+    def test_generate_custom_url_with_collision(self, mock_user, mock_transact):
+        mock_transact.side_effect = mock_transaction_cancelled("ConditionalCheckFailed", None)
         mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")     
         with self.assertRaises(CustomUrlExistsError) as context:
             generate_short_url("https://example.com", "test_user", "mycustomurl")            
         self.assertIn("This custom URL is already in use.", str(context.exception))
+    
+    @patch("pynamodb.connection.Connection.transact_write_items")  
+    @patch("models.pynamodb_model.UserEntry.get")      
+    def test_generate_short_url_limit_enforced_by_transaction(self, mock_user, mock_transact):
+        #cached count looks fine but the transaction's url_count < url_limit guard fails
+        mock_transact.side_effect = mock_transaction_cancelled(None, "ConditionalCheckFailed")
+        mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")     
+        with self.assertRaises(UrlLimitReachedError):
+            generate_short_url("https://example.com", "test_user", "mycustomurl")
+            
+    @patch("pynamodb.connection.Connection.transact_write_items")  
+    @patch("models.pynamodb_model.UserEntry.get")      
+    def test_generate_short_url_single_transaction(self, mock_user, mock_transact):
+        mock_user.return_value = UserEntry(user_id="test_user", url_limit=5, url_count=1, hashed_password="fakehash")     
+        short_url = generate_short_url("https://example.com", "test_user", None, 10)
+        self.assertEqual(len(short_url), 10)
+        mock_transact.assert_called_once()
+        self.assertEqual(len(mock_transact.call_args.kwargs["put_items"]), 1)
+        self.assertEqual(len(mock_transact.call_args.kwargs["update_items"]), 1)
+        self.assertEqual(principal_cache.get("test_user").url_count, 2)
+        
+    @patch("pynamodb.connection.Connection.transact_write_items")
+    @patch("models.pynamodb_model.UserEntry.update")
+    @patch("models.pynamodb_model.UserEntry.get") 
+    def test_generate_short_urls_retries_taken_ids(self, mock_user, mock_update, mock_transact):
+        mock_user.return_value = UserEntry(user_id="test_user", url_limit=100, url_count=0, hashed_password="fakehash")
+        requests = [URLRequest(url=f"https://example{i}.com") for i in range(3)]
+        #the second generated ID is taken, the rest go through on the resend, then it gets a new ID
+        mock_transact.side_effect = [mock_transaction_cancelled(None, "ConditionalCheckFailed", None), None, None]
+        
+        results = generate_short_urls(requests, "test_user")
+        self.assertEqual([r["status_code"] for r in results], [201] * 3)
+        self.assertEqual([len(call.kwargs["put_items"]) for call in mock_transact.call_args_list], [3, 2, 1])
+        taken = mock_transact.call_args_list[0].kwargs["put_items"][1]["Item"]["short_url"]["S"]
+        self.assertNotIn(taken, [r["short_url"] for r in results])
+        #nothing to give back
+        self.assertEqual(mock_update.call_count, 1)
+        
+    @patch("pynamodb.connection.Connection.transact_write_items")
+    @patch("models.pynamodb_model.UserEntry.update")
+    @patch("models.pynamodb_model.UserEntry.get") 
+    def test_generate_short_urls_releases_quota_for_unprocessed(self, mock_user, mock_update, mock_transact):
+        mock_user.return_value = UserEntry(user_id="test_user", url_limit=200, url_count=0, hashed_password="fakehash")
+        requests = [URLRequest(url=f"https://example{i}.com") for i in range(130)]
+        #second chunk fails outright
+        mock_transact.side_effect = [None, mock_transaction_cancelled()]
+        
+        results = generate_short_urls(requests, "test_user")
+        self.assertEqual(mock_transact.call_count, 2)
+        self.assertEqual([r["status_code"] for r in results], [201] * 100 + [503] * 30)
+        #one update reserves 130, a second gives back the 30 that failed
+        self.assertEqual(mock_update.call_count, 2)
+        
+    @patch("service.url_service.release_url_quota")
+    @patch("service.url_service.reserve_url_quota")
+    def test_generate_short_urls_releases_quota_on_error(self, mock_reserve, mock_release):
+        mock_reserve.return_value = 2
+        repository = InMemoryRepository()
+        with patch.object(repository, "put_urls", side_effect=RuntimeError("connection reset")), \
+                patch("service.url_service.get_repository", return_value=repository):
+            with self.assertRaises(RuntimeError):
+                generate_short_urls([URLRequest(url="https://example.com/a", custom_url="customurl1"),
+                                     URLRequest(url="https://example.com/b")], "test_user")
+        #the custom URL was created before the failure
+        mock_release.assert_called_once_with("test_user", 1)
         
         #test invalid url format
     def test_generate_short_url_malformed(self):